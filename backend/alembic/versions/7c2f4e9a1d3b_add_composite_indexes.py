@@ -0,0 +1,55 @@
+"""add composite indexes for hot query paths
+
+Revision ID: 7c2f4e9a1d3b
+Revises: 1b6814358839
+Create Date: 2026-10-18 09:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7c2f4e9a1d3b'
+down_revision = '1b6814358839'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # /stock/history/{item_id}
+    op.create_index(
+        'ix_stock_history_company_item_timestamp',
+        'stock_history',
+        ['company_id', 'stock_item_id', 'timestamp'],
+    )
+    # /audit/logs keyset pagination
+    op.create_index(
+        'ix_stock_history_company_timestamp_id',
+        'stock_history',
+        ['company_id', 'timestamp', 'id'],
+    )
+    # /my-equipment and /stock?user_id= (open assignments only)
+    open_only = sa.column('returned_at').is_(None)
+    op.create_index(
+        'ix_assignments_company_assignee_open',
+        'assignments',
+        ['company_id', 'assignee_user_id', 'returned_at'],
+        postgresql_where=open_only,
+        sqlite_where=open_only,
+    )
+    # add_stock / transfer_stock natural-key lookup (live items only)
+    live_only = sa.column('is_deleted') == sa.false()
+    op.create_index(
+        'ix_stock_items_company_department_name_live',
+        'stock_items',
+        ['company_id', 'department_id', 'name', 'is_deleted'],
+        postgresql_where=live_only,
+        sqlite_where=live_only,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stock_items_company_department_name_live', table_name='stock_items')
+    op.drop_index('ix_assignments_company_assignee_open', table_name='assignments')
+    op.drop_index('ix_stock_history_company_timestamp_id', table_name='stock_history')
+    op.drop_index('ix_stock_history_company_item_timestamp', table_name='stock_history')
@@ -0,0 +1,37 @@
+"""add stock_warnings table
+
+Revision ID: a41d7e2c9b60
+Revises: 7c2f4e9a1d3b
+Create Date: 2026-10-18 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a41d7e2c9b60'
+down_revision = '7c2f4e9a1d3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('stock_warnings',
+    sa.Column('stock_item_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.ForeignKeyConstraint(['stock_item_id'], ['stock_items.id'], ),
+    sa.PrimaryKeyConstraint('stock_item_id')
+    )
+    op.create_index(op.f('ix_stock_warnings_company_id'), 'stock_warnings', ['company_id'], unique=False)
+    op.execute(
+        "INSERT INTO stock_warnings (stock_item_id, company_id) "
+        "SELECT id, company_id FROM stock_items "
+        "WHERE is_deleted = false AND is_faulty = false "
+        "AND par_level IS NOT NULL AND quantity < par_level"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stock_warnings_company_id'), table_name='stock_warnings')
+    op.drop_table('stock_warnings')
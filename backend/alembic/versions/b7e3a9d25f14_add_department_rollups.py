@@ -0,0 +1,101 @@
+"""add department rollup tables
+
+Revision ID: b7e3a9d25f14
+Revises: f2d8b6a3c915
+Create Date: 2026-10-18 14:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3a9d25f14'
+down_revision = 'f2d8b6a3c915'
+branch_labels = None
+depends_on = None
+
+_COUNTERS = (
+    'total_quantity, item_count, faulty_count, below_par_count, '
+    'open_assignments, acquired_seconds, dated_items'
+)
+_EPOCH = {
+    'sqlite': "CAST(strftime('%s', acquired_at) AS INTEGER)",
+    'postgresql': 'CAST(floor(extract(epoch FROM acquired_at)) AS BIGINT)',
+}
+
+
+def _counter_columns(quantity_type):
+    return [
+        sa.Column('total_quantity', quantity_type, nullable=False),
+        sa.Column('item_count', sa.Integer(), nullable=False),
+        sa.Column('faulty_count', sa.Integer(), nullable=False),
+        sa.Column('below_par_count', sa.Integer(), nullable=False),
+        sa.Column('open_assignments', sa.Integer(), nullable=False),
+        sa.Column('acquired_seconds', sa.BigInteger(), nullable=False),
+        sa.Column('dated_items', sa.Integer(), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table('department_rollups',
+    sa.Column('department_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    *_counter_columns(sa.BigInteger()),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.ForeignKeyConstraint(['department_id'], ['departments.id'], ),
+    sa.PrimaryKeyConstraint('department_id')
+    )
+    op.create_index(op.f('ix_department_rollups_company_id'), 'department_rollups', ['company_id'], unique=False)
+    op.create_table('department_rollup_items',
+    sa.Column('stock_item_id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=True),
+    sa.Column('department_id', sa.Integer(), nullable=True),
+    *_counter_columns(sa.Integer()),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.ForeignKeyConstraint(['department_id'], ['departments.id'], ),
+    sa.ForeignKeyConstraint(['stock_item_id'], ['stock_items.id'], ),
+    sa.PrimaryKeyConstraint('stock_item_id')
+    )
+    op.create_index(op.f('ix_department_rollup_items_company_id'), 'department_rollup_items', ['company_id'], unique=False)
+    open_only = sa.column('returned_at').is_(None)
+    op.create_index(
+        'ix_assignments_item_open',
+        'assignments',
+        ['stock_item_id'],
+        postgresql_where=open_only,
+        sqlite_where=open_only,
+    )
+
+    # Same contributions as app.rollups.rebuild.
+    bind = op.get_bind()
+    epoch = _EPOCH[bind.dialect.name]
+    bind.execute(sa.text(f"""
+        INSERT INTO department_rollup_items (stock_item_id, company_id, department_id, {_COUNTERS})
+        SELECT id, company_id, department_id,
+               COALESCE(quantity, 0),
+               1,
+               CASE WHEN is_faulty = :true THEN 1 ELSE 0 END,
+               CASE WHEN par_level IS NOT NULL AND quantity < par_level THEN 1 ELSE 0 END,
+               (SELECT count(*) FROM assignments
+                WHERE assignments.stock_item_id = stock_items.id AND assignments.returned_at IS NULL),
+               COALESCE({epoch}, 0),
+               CASE WHEN acquired_at IS NOT NULL THEN 1 ELSE 0 END
+        FROM stock_items
+        WHERE is_deleted = :false AND department_id IS NOT NULL
+    """), {'false': False, 'true': True})
+    op.execute(f"""
+        INSERT INTO department_rollups (department_id, company_id, {_COUNTERS})
+        SELECT department_id, company_id,
+               SUM(total_quantity), SUM(item_count), SUM(faulty_count), SUM(below_par_count),
+               SUM(open_assignments), SUM(acquired_seconds), SUM(dated_items)
+        FROM department_rollup_items
+        GROUP BY department_id, company_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_assignments_item_open', table_name='assignments')
+    op.drop_index(op.f('ix_department_rollup_items_company_id'), table_name='department_rollup_items')
+    op.drop_table('department_rollup_items')
+    op.drop_index(op.f('ix_department_rollups_company_id'), table_name='department_rollups')
+    op.drop_table('department_rollups')
@@ -0,0 +1,57 @@
+"""add full-text search over stock item names
+
+Revision ID: c4f1e8a2d6b3
+Revises: b7e3a9d25f14
+Create Date: 2026-10-18 15:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1e8a2d6b3'
+down_revision = 'b7e3a9d25f14'
+branch_labels = None
+depends_on = None
+
+_SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE stock_search USING fts5(name, company, prefix='2 3')",
+    """CREATE TRIGGER stock_search_insert AFTER INSERT ON stock_items
+    WHEN new.is_deleted = 0 BEGIN
+        INSERT INTO stock_search (rowid, name, company) VALUES (new.id, new.name, 'c' || new.company_id);
+    END""",
+    """CREATE TRIGGER stock_search_update
+    AFTER UPDATE OF name, company_id, is_deleted ON stock_items BEGIN
+        DELETE FROM stock_search WHERE rowid = old.id;
+        INSERT INTO stock_search (rowid, name, company)
+        SELECT new.id, new.name, 'c' || new.company_id WHERE new.is_deleted = 0;
+    END""",
+    """CREATE TRIGGER stock_search_delete AFTER DELETE ON stock_items BEGIN
+        DELETE FROM stock_search WHERE rowid = old.id;
+    END""",
+    "INSERT INTO stock_search (rowid, name, company) "
+    "SELECT id, name, 'c' || company_id FROM stock_items WHERE is_deleted = 0",
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in _SQLITE_DDL:
+            op.execute(statement)
+        return
+    op.create_index(
+        'ix_stock_items_name_search',
+        'stock_items',
+        [sa.text("to_tsvector('simple'::regconfig, name)")],
+        postgresql_using='gin',
+        postgresql_where=sa.column('is_deleted') == sa.false(),
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('stock_search_insert', 'stock_search_update', 'stock_search_delete'):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE stock_search")
+        return
+    op.drop_index('ix_stock_items_name_search', table_name='stock_items')
@@ -0,0 +1,29 @@
+"""add data_versions table
+
+Revision ID: c83b5f0e2a17
+Revises: a41d7e2c9b60
+Create Date: 2026-10-18 11:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c83b5f0e2a17'
+down_revision = 'a41d7e2c9b60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('data_versions',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('department_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('company_id', 'department_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('data_versions')
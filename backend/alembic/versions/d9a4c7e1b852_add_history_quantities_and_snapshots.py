@@ -0,0 +1,62 @@
+"""add quantities to stock history and stock snapshots
+
+Revision ID: d9a4c7e1b852
+Revises: c4f1e8a2d6b3
+Create Date: 2026-10-18 16:00:00.000000
+"""
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4c7e1b852'
+down_revision = 'c4f1e8a2d6b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('stock_history', sa.Column('quantity_delta', sa.Integer(), nullable=True))
+    op.add_column('stock_history', sa.Column('quantity_after', sa.Integer(), nullable=True))
+    op.create_table('stock_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_snapshots_company_taken_at', 'stock_snapshots', ['company_id', 'taken_at'], unique=False)
+    op.create_table('stock_snapshot_items',
+    sa.Column('snapshot_id', sa.Integer(), nullable=False),
+    sa.Column('stock_item_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['snapshot_id'], ['stock_snapshots.id'], ),
+    sa.ForeignKeyConstraint(['stock_item_id'], ['stock_items.id'], ),
+    sa.PrimaryKeyConstraint('snapshot_id', 'stock_item_id')
+    )
+
+    # Existing history has no quantities to replay, so every company starts
+    # from a baseline of its live items, as app.snapshots.take does.
+    bind = op.get_bind()
+    bind.execute(
+        sa.text("INSERT INTO stock_snapshots (company_id, taken_at) SELECT id, :now FROM companies"),
+        {'now': datetime.utcnow()},
+    )
+    bind.execute(sa.text("""
+        INSERT INTO stock_snapshot_items (snapshot_id, stock_item_id, quantity)
+        SELECT stock_snapshots.id, stock_items.id, COALESCE(stock_items.quantity, 0)
+        FROM stock_items
+        JOIN stock_snapshots ON stock_snapshots.company_id = stock_items.company_id
+        WHERE stock_items.is_deleted = :false
+    """), {'false': False})
+
+
+def downgrade() -> None:
+    op.drop_table('stock_snapshot_items')
+    op.drop_index('ix_stock_snapshots_company_taken_at', table_name='stock_snapshots')
+    op.drop_table('stock_snapshots')
+    with op.batch_alter_table('stock_history') as batch_op:
+        batch_op.drop_column('quantity_after')
+        batch_op.drop_column('quantity_delta')
@@ -0,0 +1,24 @@
+"""add stock_items.version
+
+Revision ID: e5a9c1f47b28
+Revises: c83b5f0e2a17
+Create Date: 2026-10-18 12:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c1f47b28'
+down_revision = 'c83b5f0e2a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('stock_items', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('stock_items') as batch_op:
+        batch_op.drop_column('version')
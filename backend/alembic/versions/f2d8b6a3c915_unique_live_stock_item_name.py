@@ -0,0 +1,95 @@
+"""make live stock item natural key unique
+
+Revision ID: f2d8b6a3c915
+Revises: e5a9c1f47b28
+Create Date: 2026-10-18 13:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f2d8b6a3c915'
+down_revision = 'e5a9c1f47b28'
+branch_labels = None
+depends_on = None
+
+# Live rows whose natural key is shared with another live row, oldest first.
+_DUPLICATES = """
+    SELECT stock_items.id, stock_items.company_id, stock_items.department_id,
+           stock_items.name, COALESCE(stock_items.quantity, 0) AS quantity
+    FROM stock_items
+    JOIN (
+        SELECT company_id, department_id, name FROM stock_items
+        WHERE is_deleted = :false
+        GROUP BY company_id, department_id, name
+        HAVING count(*) > 1
+    ) dup ON dup.company_id = stock_items.company_id
+         AND dup.department_id = stock_items.department_id
+         AND dup.name = stock_items.name
+    WHERE stock_items.is_deleted = :false
+    ORDER BY stock_items.id
+"""
+
+
+def upgrade() -> None:
+    # Concurrent restocks could previously create duplicate live rows. Fold
+    # each group into its oldest row so the unique index can be built: the
+    # survivor takes the others' quantity, open assignments and history, and
+    # the others are soft-deleted.
+    bind = op.get_bind()
+    flags = {'false': False, 'true': True}
+    survivors, merged, companies = {}, [], set()
+    for row in bind.execute(sa.text(_DUPLICATES), flags):
+        key = (row.company_id, row.department_id, row.name)
+        if key not in survivors:
+            survivors[key] = row.id
+            continue
+        merged.append({'id': row.id, 'survivor': survivors[key], 'quantity': row.quantity, **flags})
+        companies.add(row.company_id)
+    if merged:
+        bind.execute(sa.text(
+            "UPDATE stock_items SET quantity = COALESCE(quantity, 0) + :quantity WHERE id = :survivor"
+        ), merged)
+        bind.execute(sa.text("UPDATE stock_items SET is_deleted = :true WHERE id = :id"), merged)
+        bind.execute(sa.text(
+            "UPDATE assignments SET stock_item_id = :survivor "
+            "WHERE stock_item_id = :id AND returned_at IS NULL"
+        ), merged)
+        bind.execute(sa.text(
+            "UPDATE stock_history SET stock_item_id = :survivor WHERE stock_item_id = :id"
+        ), merged)
+    # Same rows as app.warnings_store.rebuild. The department rollups are
+    # created from the folded table by a later revision.
+    for company_id in sorted(companies):
+        params = {'company_id': company_id, **flags}
+        bind.execute(sa.text("DELETE FROM stock_warnings WHERE company_id = :company_id"), params)
+        bind.execute(sa.text(
+            "INSERT INTO stock_warnings (stock_item_id, company_id) "
+            "SELECT id, company_id FROM stock_items "
+            "WHERE company_id = :company_id AND is_deleted = :false AND is_faulty = :false "
+            "AND par_level IS NOT NULL AND quantity < par_level"
+        ), params)
+
+    live_only = sa.column('is_deleted') == sa.false()
+    op.drop_index('ix_stock_items_company_department_name_live', table_name='stock_items')
+    op.create_index(
+        'uq_stock_items_live_name',
+        'stock_items',
+        ['company_id', 'department_id', 'name'],
+        unique=True,
+        postgresql_where=live_only,
+        sqlite_where=live_only,
+    )
+
+
+def downgrade() -> None:
+    live_only = sa.column('is_deleted') == sa.false()
+    op.drop_index('uq_stock_items_live_name', table_name='stock_items')
+    op.create_index(
+        'ix_stock_items_company_department_name_live',
+        'stock_items',
+        ['company_id', 'department_id', 'name', 'is_deleted'],
+        postgresql_where=live_only,
+        sqlite_where=live_only,
+    )
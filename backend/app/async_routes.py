@@ -0,0 +1,144 @@
+"""AsyncSession-backed versions of the read-heavy endpoints.
+
+Enabled with ``USE_ASYNC_DB``; when included ahead of the sync routes they
+take precedence over them for the same paths. Reading the archive manifest
+and partitions is blocking file I/O, so it runs in the threadpool rather
+than on the event loop.
+
+On SQLite, ``benchmarks.async_vs_threadpool`` shows no throughput gain
+over the threadpool routes; the two stay within run-to-run noise of each
+other, since aiosqlite still runs each query on a thread of its own. The async path is expected
+to pay off with asyncpg on Postgres, where it has not been measured yet.
+"""
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import auth, history_archive, queries, versions
+from .audit import (
+    MAX_PAGE_SIZE, STREAM_CHUNK_SIZE, archived_stream, audit_page, decode_cursor, ndjson_chunk,
+)
+from .database import AsyncSessionLocal, get_async_db
+from .responses import rows_response
+from .schemas import AuditLogPage, StockHistoryResponse, StockItemResponse
+
+router = APIRouter()
+
+
+async def _version(db: AsyncSession, company_id: int, department_id: int | None = None) -> int:
+    return await db.scalar(versions.version_stmt(company_id, department_id)) or 0
+
+
+@router.get("/stock/warnings", response_model=list[StockItemResponse])
+async def stock_warnings(
+    request: Request,
+    current_user=Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    version = await _version(db, current_user.company_id)
+    tag = versions.etag(request, current_user, version)
+    if versions.client_has(request, tag):
+        return versions.not_modified(tag)
+    stmt = queries.stock_item_rows(queries.stock_warnings(current_user.company_id))
+    return versions.tagged(rows_response(await db.execute(stmt)), tag)
+
+
+@router.get("/stock", response_model=list[StockItemResponse])
+async def view_stock(
+    request: Request,
+    department_id: int | None = None,
+    user_id: int | None = None,
+    below_par: bool | None = None,
+    older_than_days: int | None = None,
+    status: str | None = None,
+    current_user=Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if user_id is not None:
+        version = await _version(db, current_user.company_id)
+        stmt = queries.assigned_items(current_user.company_id, user_id, department_id)
+    else:
+        version = await _version(db, current_user.company_id, department_id)
+        stmt = queries.stock_items(
+            current_user.company_id, department_id, below_par, older_than_days, status
+        )
+    tag = versions.etag(request, current_user, version)
+    if versions.client_has(request, tag):
+        return versions.not_modified(tag)
+    return versions.tagged(rows_response(await db.execute(queries.stock_item_rows(stmt))), tag)
+
+
+@router.get("/my-equipment", response_model=list[StockItemResponse])
+async def my_equipment(
+    request: Request,
+    current_user=Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    tag = versions.etag(request, current_user, await _version(db, current_user.company_id))
+    if versions.client_has(request, tag):
+        return versions.not_modified(tag)
+    stmt = queries.assigned_items(current_user.company_id, current_user.id)
+    return versions.tagged(rows_response(await db.execute(queries.stock_item_rows(stmt))), tag)
+
+
+@router.get("/stock/history/{item_id}", response_model=list[StockHistoryResponse])
+async def stock_history(
+    item_id: int,
+    current_user=Depends(auth.get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    manifest = await run_in_threadpool(history_archive.load_manifest, current_user.company_id)
+    stmt = queries.item_history(current_user.company_id, item_id, manifest.archived_before)
+    rows = [row._asdict() for row in await db.execute(queries.history_rows(stmt))]
+    if manifest.partitions:
+        rows += await run_in_threadpool(history_archive.archived_item_history, manifest, item_id)
+    return ORJSONResponse(rows)
+
+
+async def _stream_ndjson(company_id: int, item_id, user_id, department_id, after):
+    manifest = await run_in_threadpool(history_archive.load_manifest, company_id)
+    async with AsyncSessionLocal() as db:
+        stmt = queries.history_rows(
+            queries.audit_history(
+                company_id, item_id, user_id, department_id, after, manifest.archived_before
+            )
+        ).execution_options(yield_per=STREAM_CHUNK_SIZE)
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield ndjson_chunk(row._asdict() for row in rows)
+    archived = archived_stream(
+        manifest, item_id=item_id, user_id=user_id, department_id=department_id, after=after
+    )
+    async for chunk in iterate_in_threadpool(archived):
+        yield chunk
+
+
+@router.get("/audit/logs", response_model=AuditLogPage, tags=["audit"])
+async def audit_logs(
+    item_id: int | None = None,
+    user_id: int | None = None,
+    department_id: int | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
+    current_user=Depends(auth.require_role_async("admin")),
+    db: AsyncSession = Depends(get_async_db),
+):
+    after = decode_cursor(cursor) if cursor is not None else None
+    if stream:
+        return StreamingResponse(
+            _stream_ndjson(current_user.company_id, item_id, user_id, department_id, after),
+            media_type="application/x-ndjson",
+        )
+    manifest = await run_in_threadpool(history_archive.load_manifest, current_user.company_id)
+    stmt = queries.audit_history(
+        current_user.company_id, item_id, user_id, department_id, after, manifest.archived_before
+    )
+    rows = [row._asdict() for row in await db.execute(queries.history_rows(stmt).limit(limit + 1))]
+    if len(rows) <= limit:
+        rows += await run_in_threadpool(
+            history_archive.archived_page, manifest, limit + 1 - len(rows),
+            item_id=item_id, user_id=user_id, department_id=department_id, after=after,
+        )
+    return audit_page(rows, limit)
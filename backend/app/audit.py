@@ -1,31 +1,99 @@
-from fastapi import APIRouter, Depends
+import base64
+from datetime import datetime
+from typing import Iterable, Iterator
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from . import auth
-from .database import get_db
-from .models import StockHistory, StockItem
-from .schemas import StockHistoryResponse
+from . import auth, history_archive, queries
+from .database import SessionLocal, get_db
+from .schemas import AuditLogPage
 
 router = APIRouter(prefix="/audit", tags=["audit"])
 
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def ndjson_chunk(rows: Iterable[dict]) -> bytes:
+    return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
 
-@router.get("/logs", response_model=list[StockHistoryResponse])
+def audit_page(rows: list[dict], limit: int) -> ORJSONResponse:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return ORJSONResponse({"logs": rows, "next_cursor": next_cursor})
+
+
+def archived_stream(manifest: history_archive.Manifest, **filters) -> Iterator[bytes]:
+    rows = history_archive.iter_archived(manifest, **filters)
+    for chunk in history_archive.chunked(rows, STREAM_CHUNK_SIZE):
+        yield ndjson_chunk(chunk)
+
+
+def _stream_ndjson(company_id: int, item_id, user_id, department_id, after):
+    # The request-scoped session may be closed before the body is sent, so the
+    # stream owns its session for as long as the client keeps reading.
+    manifest = history_archive.load_manifest(company_id)
+    db = SessionLocal()
+    try:
+        stmt = queries.history_rows(
+            queries.audit_history(
+                company_id, item_id, user_id, department_id, after, manifest.archived_before
+            )
+        ).execution_options(stream_results=True, yield_per=STREAM_CHUNK_SIZE)
+        for rows in db.execute(stmt).partitions():
+            yield ndjson_chunk(row._asdict() for row in rows)
+    finally:
+        db.close()
+    yield from archived_stream(
+        manifest, item_id=item_id, user_id=user_id, department_id=department_id, after=after
+    )
+
+
+@router.get("/logs", response_model=AuditLogPage)
 def audit_logs(
     item_id: int | None = None,
     user_id: int | None = None,
     department_id: int | None = None,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    stream: bool = False,
     current_user=Depends(auth.require_role("admin")),
     db: Session = Depends(get_db),
 ):
-    q = (
-        db.query(StockHistory)
-        .join(StockItem)
-        .filter(StockHistory.company_id == current_user.company_id)
+    after = decode_cursor(cursor) if cursor is not None else None
+    if stream:
+        return StreamingResponse(
+            _stream_ndjson(current_user.company_id, item_id, user_id, department_id, after),
+            media_type="application/x-ndjson",
+        )
+    manifest = history_archive.load_manifest(current_user.company_id)
+    stmt = queries.audit_history(
+        current_user.company_id, item_id, user_id, department_id, after, manifest.archived_before
+    )
+    rows = [row._asdict() for row in db.execute(queries.history_rows(stmt).limit(limit + 1))]
+    # Only reaches into the archive when the hot table can't fill the page.
+    rows += history_archive.archived_page(
+        manifest, limit + 1 - len(rows),
+        item_id=item_id, user_id=user_id, department_id=department_id, after=after,
     )
-    if item_id is not None:
-        q = q.filter(StockHistory.stock_item_id == item_id)
-    if user_id is not None:
-        q = q.filter(StockHistory.user_id == user_id)
-    if department_id is not None:
-        q = q.filter(StockItem.department_id == department_id)
-    return q.order_by(StockHistory.timestamp.desc()).all()
+    return audit_page(rows, limit)
@@ -1,22 +1,88 @@
+"""Password login, JWT bearer tokens and the request principal.
+
+Two in-process caches sit in front of the database and the JWT check:
+``principal_cache`` holds the :class:`Principal` per username for
+``PRINCIPAL_CACHE_TTL`` seconds, and ``token_cache`` holds verified token
+claims until the token expires. Their hit and miss counts are exported at
+``/metrics``. The principal cache is invalidated by mapper events on
+``User`` and ``Role``, which only fire in the process that made the change;
+other workers keep serving the old role or department until the entry's
+TTL runs out.
+"""
+import hashlib
+import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Callable
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
+from sqlalchemy import event, select
+from sqlalchemy.orm import joinedload
 
-from .database import SessionLocal
-from .models import User
+from . import hashing, slow_queries
+from .cache import TTLCache
+from .database import USE_ASYNC_DB, AsyncSessionLocal, SessionLocal
+from .models import Role, User
 
 SECRET_KEY = "secret"  # in production load from env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+# Verified tokens, keyed by digest; 0 disables the cache.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+pwd_context = hashing.pwd_context
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by request handlers."""
+
+    id: int
+    username: str
+    company_id: int
+    department_id: Optional[int]
+    role_id: Optional[int]
+    role_name: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            company_id=user.company_id,
+            department_id=user.department_id,
+            role_id=user.role_id,
+            role_name=user.role.name if user.role else None,
+        )
+
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+token_cache = (
+    TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    if TOKEN_CACHE_SIZE
+    else None
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    principal_cache.discard_where(lambda p: p.id == target.id)
+
+
+@event.listens_for(Role, "after_update")
+@event.listens_for(Role, "after_delete")
+def _invalidate_role(mapper, connection, target):
+    principal_cache.discard_where(lambda p: p.role_id == target.id)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -25,13 +91,24 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
-def authenticate_user(db, username: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        return None
-    if not verify_password(password, user.hashed_password):
-        return None
-    return user
+def _password_hash(username: str) -> Optional[str]:
+    with SessionLocal() as db:
+        return db.scalar(select(User.hashed_password).where(User.username == username))
+
+
+async def authenticate(username: str, password: str) -> bool:
+    """Check a login without tying up the request threadpool.
+
+    The hash lookup is a short query; the verification itself runs on
+    :data:`hashing.verifier` and raises :class:`hashing.HashingBusy` when
+    too many logins are already in flight.
+    """
+    if USE_ASYNC_DB:
+        async with AsyncSessionLocal() as db:
+            hashed = await db.scalar(select(User.hashed_password).where(User.username == username))
+    else:
+        hashed = await run_in_threadpool(_password_hash, username)
+    return await hashing.verifier.verify(password, hashed)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -42,32 +119,108 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def _principal_query(username: str):
+    return select(User).options(joinedload(User.role)).where(User.username == username)
+
+
+def load_principal(username: str) -> Optional[Principal]:
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+    db = SessionLocal()
+    try:
+        user = db.scalars(_principal_query(username)).first()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+    finally:
+        db.close()
+    principal_cache.set(username, principal)
+    return principal
+
+
+async def load_principal_async(username: str) -> Optional[Principal]:
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+    async with AsyncSessionLocal() as db:
+        user = (await db.scalars(_principal_query(username))).first()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+    principal_cache.set(username, principal)
+    return principal
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def decode_token(token: str) -> dict:
+    """Verify ``token`` and return its claims.
+
+    Verified tokens are remembered until their ``exp``, so a token reused
+    across many requests is only checked once. A cached entry never
+    outlives the token, so expired tokens are still rejected.
+    """
+    if token_cache is None:
+        return _verify_token(token)
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = _verify_token(token)
+        exp = claims.get("exp")
+        ttl = None if exp is None else exp - time.time()
+        if ttl is None or ttl > 0:
+            token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+
+def _verify_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
-        raise credentials_exception
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter(User.username == username).first()
-    finally:
-        db.close()
-    if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+
+
+def token_subject(token: str) -> str:
+    username: str = decode_token(token).get("sub")
+    if username is None:
+        raise _credentials_exception()
+    return username
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = load_principal(token_subject(token))
+    if principal is None:
+        raise _credentials_exception()
+    slow_queries.attribute(principal.company_id)
+    return principal
+
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = await load_principal_async(token_subject(token))
+    if principal is None:
+        raise _credentials_exception()
+    slow_queries.attribute(principal.company_id)
+    return principal
 
 
 def require_role(role: str) -> Callable:
-    def role_dependency(current_user: User = Depends(get_current_user)):
-        if current_user.role is None or current_user.role.name != role:
+    def role_dependency(current_user: Principal = Depends(get_current_user)):
+        if current_user.role_name != role:
+            raise HTTPException(status_code=403, detail="Insufficient role")
+        return current_user
+    return role_dependency
+
+
+def require_role_async(role: str) -> Callable:
+    async def role_dependency(current_user: Principal = Depends(get_current_user_async)):
+        if current_user.role_name != role:
             raise HTTPException(status_code=403, detail="Insufficient role")
         return current_user
     return role_dependency
@@ -0,0 +1,212 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from . import auth, changes, rollups, upserts, warnings_store
+from .database import get_db
+from .models import Assignment, StockHistory, StockItem, User
+from .schemas import StockBulkRequest, StockBulkResponse
+
+router = APIRouter(tags=["stock"])
+
+MAX_BULK_OPERATIONS = 5000
+
+
+class BulkOperationError(Exception):
+    pass
+
+
+class StockBatch:
+    """Applies a list of stock operations against rows resolved up front.
+
+    Existing items and assignments are loaded with a handful of set-based
+    queries and changed in memory. Add targets and transfer destinations go
+    through :func:`app.upserts.restock`, like ``/stock/add``, so concurrent
+    batches creating the same item meet on its unique key. The resulting
+    history and assignment rows are written with bulk inserts on ``flush``.
+    """
+
+    def __init__(self, db: Session, current_user, operations):
+        self.db = db
+        self.user = current_user
+        self.company_id = current_user.company_id
+        self.now = datetime.utcnow()
+        # (item, action, reason, quantity delta, quantity after)
+        self.history: list[tuple[StockItem, str, str | None, int, int]] = []
+        self.assignments: list[tuple[StockItem, int]] = []
+        self._resolve(operations)
+
+    def _resolve(self, operations) -> None:
+        db = self.db
+        assignment_ids = {op.assignment_id for op in operations if op.op == "return"}
+        self.open_assignments: dict[int, Assignment] = {}
+        if assignment_ids:
+            rows = db.scalars(
+                select(Assignment)
+                .where(
+                    Assignment.id.in_(assignment_ids),
+                    Assignment.company_id == self.company_id,
+                    Assignment.returned_at.is_(None),
+                )
+                .with_for_update()
+            )
+            self.open_assignments = {a.id: a for a in rows}
+
+        item_ids = {op.stock_item_id for op in operations if op.op in ("assign", "transfer")}
+        item_ids |= {a.stock_item_id for a in self.open_assignments.values()}
+        self.items: dict[int, StockItem] = {}
+        if item_ids:
+            rows = db.scalars(
+                select(StockItem)
+                .where(StockItem.id.in_(item_ids), StockItem.company_id == self.company_id)
+                .with_for_update()
+            )
+            self.items = {item.id: item for item in rows}
+
+        assignee_ids = {op.assignee_user_id for op in operations if op.op == "assign"}
+        self.user_companies: dict[int, int] = {}
+        if assignee_ids:
+            rows = db.execute(select(User.id, User.company_id).where(User.id.in_(assignee_ids)))
+            self.user_companies = dict(rows.all())
+
+    def _restock(self, **values) -> StockItem:
+        # The upsert reloads the row over its in-memory state, so pending
+        # changes to it must reach the database first.
+        self.db.flush()
+        return upserts.restock(self.db, StockItem, **values).scalar_one()
+
+    def apply(self, op) -> StockItem:
+        return getattr(self, f"_{op.op}")(op)
+
+    def _add(self, op) -> StockItem:
+        if op.quantity <= 0:
+            raise BulkOperationError("Quantity must be positive")
+        item = self._restock(
+            company_id=self.company_id,
+            department_id=op.department_id,
+            name=op.name,
+            quantity=op.quantity,
+            acquired_at=self.now,
+            par_level=op.par_level,
+        )
+        action = "create" if upserts.was_inserted(item.version) else "add"
+        self.history.append((item, action, op.reason, op.quantity, item.quantity))
+        return item
+
+    def _assign(self, op) -> StockItem:
+        item = self.items.get(op.stock_item_id)
+        if not item or item.is_faulty or item.is_deleted or item.quantity <= 0:
+            raise BulkOperationError("Item not available")
+        assignee_company = self.user_companies.get(op.assignee_user_id)
+        if assignee_company is None:
+            raise BulkOperationError("User not found")
+        if assignee_company != self.company_id:
+            raise BulkOperationError("Cross-company assignment")
+        item.quantity -= 1
+        self.assignments.append((item, op.assignee_user_id))
+        self.history.append((item, "assign", op.reason, -1, item.quantity))
+        return item
+
+    def _return(self, op) -> StockItem:
+        assignment = self.open_assignments.get(op.assignment_id)
+        if not assignment or self.items[assignment.stock_item_id].is_deleted:
+            raise BulkOperationError("Assignment not found")
+        del self.open_assignments[op.assignment_id]
+        item = self.items[assignment.stock_item_id]
+        assignment.returned_at = self.now
+        item.quantity += 1
+        self.history.append((item, "return", op.reason, 1, item.quantity))
+        return item
+
+    def _transfer(self, op) -> StockItem:
+        if op.quantity <= 0:
+            raise BulkOperationError("Quantity must be positive")
+        item = self.items.get(op.stock_item_id)
+        if not item or item.is_faulty or item.is_deleted or item.quantity < op.quantity:
+            raise BulkOperationError("Not enough stock")
+        item.quantity -= op.quantity
+        self.history.append((item, "transfer", op.reason, -op.quantity, item.quantity))
+        dest_item = self._restock(
+            company_id=self.company_id,
+            department_id=op.to_department_id,
+            name=item.name,
+            quantity=op.quantity,
+        )
+        self.history.append((dest_item, "transfer", op.reason, op.quantity, dest_item.quantity))
+        return item
+
+    def touched_items(self) -> set[StockItem]:
+        # Every operation that changes an item, inserts included, records
+        # history for it.
+        return {entry[0] for entry in self.history}
+
+    def flush(self) -> None:
+        db = self.db
+        # Emits the quantity UPDATEs for items changed in memory.
+        db.flush()
+        if self.assignments:
+            db.execute(insert(Assignment), [
+                {
+                    "stock_item_id": item.id,
+                    "assignee_user_id": assignee_id,
+                    "assigned_by_id": self.user.id,
+                    "assigned_at": self.now,
+                    "company_id": self.company_id,
+                }
+                for item, assignee_id in self.assignments
+            ])
+        if self.history:
+            db.execute(insert(StockHistory), [
+                {
+                    "stock_item_id": item.id,
+                    "user_id": self.user.id,
+                    "company_id": self.company_id,
+                    "action": action,
+                    "reason": reason,
+                    "timestamp": self.now,
+                    "quantity_delta": delta,
+                    "quantity_after": after,
+                }
+                for item, action, reason, delta, after in self.history
+            ])
+
+
+@router.post("/stock/bulk", response_model=StockBulkResponse)
+def bulk_stock(
+    payload: StockBulkRequest,
+    current_user=Depends(auth.require_role("warehouse")),
+    db: Session = Depends(get_db),
+):
+    if len(payload.operations) > MAX_BULK_OPERATIONS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BULK_OPERATIONS} operations per request"
+        )
+    batch = StockBatch(db, current_user, payload.operations)
+    results, touched = [], []
+    for index, op in enumerate(payload.operations):
+        try:
+            touched.append(batch.apply(op))
+            results.append({"index": index, "op": op.op, "ok": True, "detail": "ok"})
+        except BulkOperationError as exc:
+            touched.append(None)
+            results.append({"index": index, "op": op.op, "ok": False, "detail": str(exc)})
+
+    if payload.atomic and not all(r["ok"] for r in results):
+        db.rollback()
+        raise HTTPException(status_code=400, detail=results)
+    batch.flush()
+    touched_items = batch.touched_items()
+    warnings_store.refresh(db, [item.id for item in touched_items])
+    rollups.refresh(db, [item.id for item in touched_items])
+    changes.record(
+        db, current_user.company_id, "bulk",
+        department_ids=[item.department_id for item in touched_items],
+        item_ids=[item.id for item in touched_items],
+        user_ids=[assignee_id for _, assignee_id in batch.assignments],
+    )
+    for result, item in zip(results, touched):
+        result["stock_item_id"] = item.id if item is not None else None
+    db.commit()
+    return {"committed": True, "results": results}
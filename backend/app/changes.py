@@ -0,0 +1,25 @@
+"""Single place where mutation handlers record what they changed.
+
+Call :func:`record` after the change has been made and before committing.
+It bumps the data versions in the same transaction, so ETags go stale
+together with the data. It also queues the realtime event, which is
+published only if the transaction commits.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from . import realtime, versions
+
+
+def record(
+    db: Session,
+    company_id: int,
+    action: str,
+    department_ids: Iterable[Optional[int]] = (),
+    item_ids: Iterable[Optional[int]] = (),
+    user_ids: Iterable[Optional[int]] = (),
+) -> None:
+    department_ids = tuple(department_ids)
+    versions.bump(db, company_id, department_ids)
+    realtime.notify(db, company_id, action, department_ids, item_ids, user_ids)
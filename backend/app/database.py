@@ -1,16 +1,211 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Callable
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./local.db")
+USE_ASYNC_DB = os.getenv("USE_ASYNC_DB", "false").lower() in ("1", "true", "yes")
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# Engine profiles. "defaults" is SQLAlchemy's out-of-the-box behaviour and is
+# kept for comparison; individual settings can be overridden with the
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+# DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS environment variables.
+PROFILES = {
+    "defaults": {},
+    "tuned": {
+        "pool_size": 20,
+        "max_overflow": 20,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 15000,
+        "sqlite_pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": -64000,  # KiB, i.e. 64 MB
+            "mmap_size": 268435456,
+            "busy_timeout": 5000,
+        },
+    },
+}
+
+_ENV_OVERRIDES = {
+    "pool_size": ("DB_POOL_SIZE", int),
+    "max_overflow": ("DB_MAX_OVERFLOW", int),
+    "pool_timeout": ("DB_POOL_TIMEOUT", float),
+    "pool_recycle": ("DB_POOL_RECYCLE", int),
+    "pool_pre_ping": ("DB_POOL_PRE_PING", lambda v: v.lower() in ("1", "true", "yes")),
+    "statement_timeout_ms": ("DB_STATEMENT_TIMEOUT_MS", int),
+}
+
+
+def async_url(url: str) -> str:
+    """Swap the sync driver in ``url`` for its asyncio counterpart."""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {dialect!r}")
+    return f"{ASYNC_DRIVERS[dialect]}://{rest}"
+
+
+def profile_settings(name: str = DB_PROFILE) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}; expected one of {sorted(PROFILES)}")
+    settings = dict(PROFILES[name])
+    for key, (var, parse) in _ENV_OVERRIDES.items():
+        if os.getenv(var):
+            settings[key] = parse(os.environ[var])
+    return settings
+
+
+class PoolStats:
+    """Checkout counts and time spent waiting for a pooled connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        # Called with each wait in seconds, e.g. to attribute it to a request.
+        self.observers: list[Callable[[float], None]] = []
+        self._lock = threading.Lock()
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        for observer in self.observers:
+            observer(waited)
+
+    def snapshot(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms_total": round(self.wait_seconds * 1000, 3),
+            "wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+class _TimedPoolMixin:
+    """Times ``connect()``, i.e. how long a request waited for a connection."""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the counters across it.
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-)
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: str, settings: dict, is_async: bool = False) -> dict:
+    """``create_engine`` keyword arguments for ``url`` under a profile's settings."""
+    parsed = make_url(url)
+    options: dict = {}
+    connect_args: dict = {}
+    if parsed.get_backend_name() == "sqlite":
+        if not is_async:
+            connect_args["check_same_thread"] = False
+    elif "statement_timeout_ms" in settings:
+        timeout = settings["statement_timeout_ms"]
+        if is_async:
+            connect_args["server_settings"] = {"statement_timeout": str(timeout)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={timeout}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    # In-memory SQLite uses a single shared connection, not a queue pool.
+    if not _is_memory_sqlite(parsed):
+        options["poolclass"] = TimedAsyncQueuePool if is_async else TimedQueuePool
+        for key in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"):
+            if key in settings:
+                options[key] = settings[key]
+    return options
+
+
+def apply_sqlite_pragmas(engine, pragmas: dict) -> None:
+    """Run ``PRAGMA`` statements on every new SQLite connection of ``engine``."""
+    if not pragmas or engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+ENGINE_SETTINGS = profile_settings()
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, ENGINE_SETTINGS))
+apply_sqlite_pragmas(engine, ENGINE_SETTINGS.get("sqlite_pragmas"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = AsyncSessionLocal = None
+if USE_ASYNC_DB:
+    # Imported lazily so sync-only deployments don't need greenlet or an async driver.
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        async_url(DATABASE_URL),
+        **engine_options(DATABASE_URL, ENGINE_SETTINGS, is_async=True),
+    )
+    apply_sqlite_pragmas(async_engine.sync_engine, ENGINE_SETTINGS.get("sqlite_pragmas"))
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+
+def pool_stats() -> dict:
+    """Pool statistics for the sync engine and, when enabled, the async one."""
+    stats = {}
+    for name, eng in (("sync", engine), ("async", async_engine and async_engine.sync_engine)):
+        if eng is not None and hasattr(eng.pool, "stats"):
+            stats[name] = eng.pool.stats.snapshot(eng.pool)
+    return stats
+
 
 def get_db():
     db = SessionLocal()
@@ -18,3 +213,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
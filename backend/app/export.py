@@ -0,0 +1,182 @@
+"""Streaming CSV/NDJSON dumps of stock, assignments and history.
+
+Rows are read through a server-side cursor in chunks of
+``EXPORT_CHUNK_SIZE``, encoded, optionally gzip-compressed, and written to
+the response as they arrive, so memory use does not grow with the size of
+the export.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import Iterable, Iterator, Optional, Sequence
+
+import orjson
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from . import auth, history_archive, queries
+from .database import SessionLocal
+from .models import StockItem
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+MEDIA_TYPES = {ExportFormat.csv: "text/csv", ExportFormat.ndjson: "application/x-ndjson"}
+
+
+def _csv_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_lines(rows: Iterable[Iterable]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def encode_rows(
+    chunks: Iterable[list[dict]], fmt: ExportFormat, columns: Sequence[str]
+) -> Iterator[bytes]:
+    """Rows as NDJSON, or as CSV under a ``columns`` header that is written even when there are none."""
+    if fmt is ExportFormat.csv:
+        yield _csv_lines([columns])
+    for rows in chunks:
+        if not rows:
+            continue
+        if fmt is ExportFormat.ndjson:
+            yield b"".join(orjson.dumps(row) + b"\n" for row in rows)
+            continue
+        yield _csv_lines([_csv_value(v) for v in row.values()] for row in rows)
+
+
+def gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def query_chunks(stmt: Select) -> Iterator[list[dict]]:
+    # Owns its session: the stream outlives the request-scoped one.
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            stmt.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+        )
+        for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+    finally:
+        db.close()
+
+
+def _columns(stmt: Select) -> list[str]:
+    return [column.key for column in stmt.selected_columns]
+
+
+def export_response(
+    chunks: Iterable[list[dict]], columns: Sequence[str], name: str, fmt: ExportFormat, gzip: bool
+):
+    body = encode_rows(chunks, fmt, columns)
+    filename = f"{name}.{fmt.value}"
+    media_type = MEDIA_TYPES[fmt]
+    if gzip:
+        body, filename, media_type = gzipped(body), f"{filename}.gz", "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/stock")
+def export_stock(
+    format: ExportFormat = ExportFormat.csv,
+    gzip: bool = False,
+    department_id: Optional[int] = None,
+    below_par: Optional[bool] = None,
+    older_than_days: Optional[int] = None,
+    status: Optional[str] = None,
+    current_user=Depends(auth.get_current_user),
+):
+    stmt = queries.stock_item_rows(
+        queries.stock_items(
+            current_user.company_id, department_id, below_par, older_than_days, status
+        )
+    ).order_by(StockItem.id)
+    return export_response(query_chunks(stmt), _columns(stmt), "stock", format, gzip)
+
+
+@router.get("/assignments")
+def export_assignments(
+    format: ExportFormat = ExportFormat.csv,
+    gzip: bool = False,
+    department_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    open_only: bool = False,
+    current_user=Depends(auth.require_role("admin")),
+):
+    stmt = queries.assignments(
+        current_user.company_id,
+        department_id,
+        user_id,
+        queries.naive_utc(since),
+        queries.naive_utc(until),
+        open_only,
+    )
+    return export_response(query_chunks(stmt), _columns(stmt), "assignments", format, gzip)
+
+
+def _history_chunks(company_id: int, since, until, **filters) -> Iterator[list[dict]]:
+    manifest = history_archive.load_manifest(company_id)
+    before = (until, 0) if until is not None else None
+    hot_since = since
+    if manifest.archived_before is not None:
+        hot_since = max(since, manifest.archived_before) if since else manifest.archived_before
+    stmt = queries.history_rows(
+        queries.audit_history(
+            company_id,
+            filters["item_id"],
+            filters["user_id"],
+            filters["department_id"],
+            before,
+            hot_since,
+            filters["action"],
+        )
+    )
+    yield from query_chunks(stmt)
+    archived = history_archive.iter_archived(manifest, after=before, since=since, **filters)
+    yield from history_archive.chunked(archived, EXPORT_CHUNK_SIZE)
+
+
+@router.get("/history")
+def export_history(
+    format: ExportFormat = ExportFormat.csv,
+    gzip: bool = False,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user=Depends(auth.require_role("admin")),
+):
+    """History newest first, including archived rows; ``until`` is exclusive."""
+    chunks = _history_chunks(
+        current_user.company_id, queries.naive_utc(since), queries.naive_utc(until),
+        item_id=item_id, user_id=user_id, department_id=department_id, action=action,
+    )
+    return export_response(chunks, history_archive.RESPONSE_FIELDS, "history", format, gzip)
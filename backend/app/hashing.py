@@ -0,0 +1,88 @@
+"""Password verification kept off the request threadpool.
+
+Verifying a pbkdf2 hash is deliberately expensive. During a login storm,
+running it inline lets ``/token`` occupy every threadpool worker and
+stalls unrelated requests. Verification instead runs in a small, dedicated
+process pool behind an admission limit. Once ``HASH_QUEUE_SIZE``
+verifications are admitted, further logins are turned away with
+:class:`HashingBusy` rather than queueing without bound.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+# 0 verifies on the shared threadpool instead (development, constrained hosts).
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+
+
+class HashingBusy(Exception):
+    """Raised when the verification queue is full."""
+
+
+@lru_cache(maxsize=1)
+def dummy_hash() -> str:
+    """A hash with the current scheme and cost, verified for unknown users.
+
+    Verifying it takes as long as verifying a real user's hash, so response
+    times do not reveal which usernames exist.
+    """
+    return pwd_context.hash(os.urandom(16).hex())
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordVerifier:
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.admitted = 0
+        self.rejected = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        if self.workers and self._executor is None:
+            # spawn, not fork: the parent holds threads and pooled DB connections.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            dummy_hash()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def verify(self, password: str, hashed: Optional[str]) -> bool:
+        """Check ``password`` against ``hashed``; a missing hash never matches.
+
+        Must be called from the event loop, which owns the admission count.
+        """
+        if self.admitted >= self.queue_size:
+            self.rejected += 1
+            raise HashingBusy()
+        self.admitted += 1
+        try:
+            target = hashed or dummy_hash()
+            if self.workers:
+                self.start()
+                loop = asyncio.get_running_loop()
+                ok = await loop.run_in_executor(self._executor, _verify, password, target)
+            else:
+                ok = await run_in_threadpool(_verify, password, target)
+        finally:
+            self.admitted -= 1
+        return ok and hashed is not None
+
+
+verifier = PasswordVerifier()
@@ -0,0 +1,335 @@
+"""Cold storage for old ``stock_history`` rows.
+
+``archive`` moves rows older than a cutoff out of the table into gzip
+NDJSON files, one per company and calendar month::
+
+    <HISTORY_ARCHIVE_DIR>/<company_id>/2024-03.ndjson.gz
+    <HISTORY_ARCHIVE_DIR>/<company_id>/2024-03.items.json
+    <HISTORY_ARCHIVE_DIR>/<company_id>/manifest.json
+
+Rows inside a partition are sorted newest first, like the audit queries.
+The manifest records each partition's time range and the company's
+``archived_before`` watermark: every row older than it lives in the
+archive, and every newer row is still in the table. Next to each partition
+is the list of item ids it contains. The read endpoints query the table
+from the watermark onwards, and only open partitions when a page reaches
+past it, or, for per-item queries, when the partition holds that item.
+"""
+import gzip
+import heapq
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import groupby, islice
+from typing import Iterable, Iterator, Optional
+
+import orjson
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from .models import StockHistory, StockItem
+
+HISTORY_ARCHIVE_DIR = os.getenv(
+    "HISTORY_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "archive"),
+)
+HISTORY_ARCHIVE_DAYS = int(os.getenv("HISTORY_ARCHIVE_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = 5000
+
+# Fields returned by the history endpoints; archived rows also keep the
+# item's department at archive time so department filters still apply.
+RESPONSE_FIELDS = (
+    "id", "stock_item_id", "user_id", "action", "reason", "timestamp",
+    "quantity_delta", "quantity_after",
+)
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    min_ts: datetime
+    max_ts: datetime
+    rows: int
+
+
+@dataclass(frozen=True)
+class Manifest:
+    company_id: int
+    archived_before: Optional[datetime] = None
+    partitions: tuple[Partition, ...] = ()  # newest first
+
+    def partitions_overlapping(
+        self, before: Optional[datetime] = None, since: Optional[datetime] = None
+    ) -> list[Partition]:
+        return [
+            p for p in self.partitions
+            if (before is None or p.min_ts <= before) and (since is None or p.max_ts >= since)
+        ]
+
+
+_manifests: dict[int, tuple[int, Manifest]] = {}
+
+
+def _company_dir(company_id: int) -> str:
+    return os.path.join(HISTORY_ARCHIVE_DIR, str(company_id))
+
+
+def _manifest_path(company_id: int) -> str:
+    return os.path.join(_company_dir(company_id), "manifest.json")
+
+
+def load_manifest(company_id: int) -> Manifest:
+    """The company's manifest; an empty one when nothing has been archived.
+
+    Parsed manifests are reused until the file changes.
+    """
+    path = _manifest_path(company_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return Manifest(company_id)
+    cached = _manifests.get(company_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        raw = json.load(f)
+    manifest = Manifest(
+        company_id=company_id,
+        archived_before=datetime.fromisoformat(raw["archived_before"]),
+        partitions=tuple(
+            Partition(
+                name=p["name"],
+                min_ts=datetime.fromisoformat(p["min_ts"]),
+                max_ts=datetime.fromisoformat(p["max_ts"]),
+                rows=p["rows"],
+            )
+            for p in sorted(raw["partitions"], key=lambda p: p["name"], reverse=True)
+        ),
+    )
+    _manifests[company_id] = (mtime, manifest)
+    return manifest
+
+
+@contextmanager
+def _replacing(path: str):
+    """A binary file that atomically replaces ``path`` once the block completes."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _replace(path: str, data: bytes) -> None:
+    with _replacing(path) as f:
+        f.write(data)
+
+
+def _write_manifest(manifest: Manifest) -> None:
+    _replace(_manifest_path(manifest.company_id), json.dumps({
+        "archived_before": manifest.archived_before.isoformat(),
+        "partitions": [
+            {
+                "name": p.name,
+                "min_ts": p.min_ts.isoformat(),
+                "max_ts": p.max_ts.isoformat(),
+                "rows": p.rows,
+            }
+            for p in manifest.partitions
+        ],
+    }, indent=1).encode())
+
+
+@lru_cache(maxsize=1024)
+def _partition_items(company_id: int, name: str, rows: int) -> frozenset[int]:
+    # ``rows`` is part of the key so a rewritten partition is reloaded.
+    with open(os.path.join(_company_dir(company_id), f"{name}.items.json")) as f:
+        return frozenset(json.load(f))
+
+
+def _read_partition(company_id: int, name: str) -> Iterator[dict]:
+    path = os.path.join(_company_dir(company_id), f"{name}.ndjson.gz")
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            row = orjson.loads(line)
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            yield row
+
+
+def _newest_first(row: dict) -> tuple[datetime, int]:
+    return row["timestamp"], row["id"]
+
+
+def _merge_archived(fresh: Iterable[dict], archived: Iterable[dict]) -> Iterator[dict]:
+    """Two newest-first row streams as one; a row in both is taken from ``fresh``."""
+    last_id = None
+    # merge is stable, so of two equal keys the ``fresh`` row comes first.
+    for row in heapq.merge(fresh, archived, key=_newest_first, reverse=True):
+        if row["id"] != last_id:
+            yield row
+        last_id = row["id"]
+
+
+def _write_partition(company_id: int, name: str, rows: Iterable[dict]) -> Partition:
+    """Stream ``rows``, newest first, into the partition, replacing any existing file.
+
+    Only the item ids, the row count and the time range are kept in memory.
+    """
+    path = os.path.join(_company_dir(company_id), f"{name}.ndjson.gz")
+    items: set[int] = set()
+    count, newest, oldest = 0, None, None
+    with _replacing(path) as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+        for batch in chunked(rows, ARCHIVE_BATCH_SIZE):
+            f.write(b"".join(orjson.dumps(row) + b"\n" for row in batch))
+            items.update(r["stock_item_id"] for r in batch if r["stock_item_id"] is not None)
+            count += len(batch)
+            newest = newest or batch[0]["timestamp"]
+            oldest = batch[-1]["timestamp"]
+    _replace(
+        os.path.join(_company_dir(company_id), f"{name}.items.json"),
+        json.dumps(sorted(items)).encode(),
+    )
+    return Partition(name, oldest, newest, count)
+
+
+def archive_company(db: Session, company_id: int, cutoff: datetime) -> int:
+    """Move the company's rows older than ``cutoff`` into the archive.
+
+    Partitions and the manifest are written before the rows are deleted.
+    Readers only look at the table from the watermark onwards, and only at
+    archived rows before it, so a failure between any two steps never shows
+    a row twice: a partition rewritten before the manifest may already hold
+    rows that are still in the table.
+    """
+    manifest = load_manifest(company_id)
+    if manifest.archived_before is not None:
+        cutoff = max(cutoff, manifest.archived_before)
+    os.makedirs(_company_dir(company_id), exist_ok=True)
+    stmt = (
+        select(
+            StockHistory.id,
+            StockHistory.stock_item_id,
+            StockHistory.user_id,
+            StockHistory.action,
+            StockHistory.reason,
+            StockHistory.timestamp,
+            StockHistory.quantity_delta,
+            StockHistory.quantity_after,
+            StockItem.department_id,
+        )
+        .outerjoin(StockItem, StockItem.id == StockHistory.stock_item_id)
+        .where(StockHistory.company_id == company_id, StockHistory.timestamp < cutoff)
+        .order_by(StockHistory.timestamp.desc(), StockHistory.id.desc())
+        .execution_options(stream_results=True, yield_per=ARCHIVE_BATCH_SIZE)
+    )
+    partitions = {p.name: p for p in manifest.partitions}
+    moved, max_id = 0, 0
+
+    def rows():
+        nonlocal moved, max_id
+        for row in db.execute(stmt):
+            moved += 1
+            max_id = max(max_id, row.id)
+            yield row._asdict()
+
+    for name, month in groupby(rows(), key=lambda r: r["timestamp"].strftime("%Y-%m")):
+        if name in partitions:
+            # Rows from an earlier run that stopped mid-month, in the same order.
+            month = _merge_archived(month, _read_partition(company_id, name))
+        partitions[name] = _write_partition(company_id, name, month)
+
+    _write_manifest(Manifest(
+        company_id=company_id,
+        archived_before=cutoff,
+        partitions=tuple(sorted(partitions.values(), key=lambda p: p.name, reverse=True)),
+    ))
+    if moved:
+        db.execute(
+            delete(StockHistory).where(
+                StockHistory.company_id == company_id,
+                StockHistory.timestamp < cutoff,
+                StockHistory.id <= max_id,
+            )
+        )
+    return moved
+
+
+def archive(db: Session, older_than_days: int = HISTORY_ARCHIVE_DAYS, company_id: Optional[int] = None) -> dict[int, int]:
+    """Archive every company's (or one company's) rows older than ``older_than_days``."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    if company_id is not None:
+        company_ids = [company_id]
+    else:
+        company_ids = db.scalars(
+            select(StockHistory.company_id).where(StockHistory.timestamp < cutoff).distinct()
+        ).all()
+    moved = {}
+    for cid in company_ids:
+        moved[cid] = archive_company(db, cid, cutoff)
+        db.commit()
+    return moved
+
+
+def iter_archived(
+    manifest: Manifest,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    since: Optional[datetime] = None,
+    action: Optional[str] = None,
+) -> Iterator[dict]:
+    """Archived rows matching the filters, newest first, as response dicts.
+
+    ``after`` is a keyset position as in :func:`queries.audit_history`.
+    Partitions entirely newer than it or older than ``since``, and with
+    ``item_id`` set, partitions without that item, are skipped without
+    being opened.
+    """
+    before = after[0] if after is not None else None
+    for partition in manifest.partitions_overlapping(before, since):
+        if item_id is not None and item_id not in _partition_items(
+            manifest.company_id, partition.name, partition.rows
+        ):
+            continue
+        for row in _read_partition(manifest.company_id, partition.name):
+            if row["timestamp"] >= manifest.archived_before:
+                # Left by a run that stopped before moving the watermark;
+                # the row is still read from the table.
+                continue
+            if after is not None and (row["timestamp"], row["id"]) >= after:
+                continue
+            if since is not None and row["timestamp"] < since:
+                break
+            if item_id is not None and row["stock_item_id"] != item_id:
+                continue
+            if user_id is not None and row["user_id"] != user_id:
+                continue
+            if action is not None and row["action"] != action:
+                continue
+            if department_id is not None and row["department_id"] != department_id:
+                continue
+            # Partitions written before quantities were recorded lack them.
+            yield {field: row.get(field) for field in RESPONSE_FIELDS}
+
+
+def archived_page(manifest: Manifest, count: int, **filters) -> list[dict]:
+    if count <= 0 or not manifest.partitions:
+        return []
+    return list(islice(iter_archived(manifest, **filters), count))
+
+
+def archived_item_history(manifest: Manifest, item_id: int) -> list[dict]:
+    if not manifest.partitions:
+        return []
+    return list(iter_archived(manifest, item_id=item_id))
+
+
+def chunked(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
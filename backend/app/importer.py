@@ -0,0 +1,320 @@
+"""CSV bulk import of stock items.
+
+The file is parsed as a stream and handled ``IMPORT_CHUNK_SIZE`` rows at a
+time. Each chunk is validated, its valid rows are written with one
+multi-row upsert (staged through ``COPY`` on Postgres), and it is committed
+on its own. Invalid rows are reported with their line number and skipped;
+they never abort the rest of the file.
+
+Columns: ``name``, ``quantity`` and ``department`` (a department name or
+id) are required. ``par_level``, ``acquired_at`` (ISO date) and ``reason``
+are optional. A row for an item that already exists restocks it, as
+``/stock/add`` would.
+"""
+import csv
+import io
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+import orjson
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from . import auth, changes, rollups, upserts, warnings_store
+from .database import SessionLocal, get_db
+from .models import Department, StockHistory, StockItem
+from .schemas import StockImportReport
+
+router = APIRouter(tags=["stock"])
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+REQUIRED_COLUMNS = {"name", "quantity", "department"}
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    created: int = 0
+    restocked: int = 0
+    failed: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _optional_int(value: str, column: str) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{column} must be a whole number")
+    if number < 0:
+        raise ValueError(f"{column} must not be negative")
+    return number
+
+
+def _numbered_rows(reader: csv.DictReader) -> Iterator[tuple[int, dict | csv.Error]]:
+    # A malformed line comes back as its csv.Error, so it can be reported
+    # like any other bad row while the reader carries on with the next one.
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            # DictReader.line_num only moves on after a row parses.
+            yield reader.reader.line_num, exc
+            continue
+        yield reader.line_num, row
+
+
+class StockImporter:
+    def __init__(
+        self,
+        db: Session,
+        company_id: int,
+        user_id: int,
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+    ):
+        self.db = db
+        self.company_id = company_id
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+        self.now = datetime.utcnow()
+        # Resolved once for the whole file; rows may name a department or give its id.
+        departments = db.execute(
+            select(Department.id, Department.name).where(Department.company_id == company_id)
+        ).all()
+        self.departments = {name.strip().lower(): id_ for id_, name in departments}
+        self.department_ids = {id_ for id_, _ in departments}
+
+    def _department(self, value: str) -> int:
+        value = value.strip()
+        if value.isdigit() and int(value) in self.department_ids:
+            return int(value)
+        department_id = self.departments.get(value.lower())
+        if department_id is None:
+            raise ValueError(f"unknown department {value!r}")
+        return department_id
+
+    def _validate(self, row: dict) -> dict:
+        name = (row.get("name") or "").strip()
+        if not name:
+            raise ValueError("name is required")
+        quantity = _optional_int((row.get("quantity") or "").strip(), "quantity")
+        if quantity is None:
+            raise ValueError("quantity is required")
+        acquired_at = (row.get("acquired_at") or "").strip()
+        try:
+            acquired_at = datetime.fromisoformat(acquired_at) if acquired_at else self.now
+        except ValueError:
+            raise ValueError("acquired_at must be an ISO date")
+        return {
+            "name": name,
+            "quantity": quantity,
+            "department_id": self._department(row.get("department") or ""),
+            "par_level": _optional_int((row.get("par_level") or "").strip(), "par_level"),
+            "acquired_at": acquired_at,
+            "reason": (row.get("reason") or "").strip() or None,
+        }
+
+    def run(self, lines: Iterable[str]) -> Iterator[ImportReport]:
+        """Import ``lines`` of CSV, yielding the running report after each chunk."""
+        reader = csv.DictReader(lines)
+        try:
+            fieldnames = reader.fieldnames
+        except csv.Error as exc:
+            raise ValueError(f"malformed CSV header: {exc}")
+        missing = REQUIRED_COLUMNS - set(fieldnames or ())
+        if missing:
+            raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+        numbered = _numbered_rows(reader)
+        while chunk := list(islice(numbered, self.chunk_size)):
+            valid = {}
+            for line, row in chunk:
+                self.report.rows += 1
+                if isinstance(row, csv.Error):
+                    self.report.error(line, f"malformed CSV: {row}")
+                    continue
+                try:
+                    item = self._validate(row)
+                except ValueError as exc:
+                    self.report.error(line, str(exc))
+                    continue
+                key = (item["department_id"], item["name"])
+                if key in valid:
+                    # The same item twice in a chunk: one upsert can't touch a row twice.
+                    valid[key]["quantity"] += item["quantity"]
+                    if item["par_level"] is not None:
+                        # Later rows win, like coalesce() in the upsert.
+                        valid[key]["par_level"] = item["par_level"]
+                else:
+                    valid[key] = item
+            if valid:
+                self._write(list(valid.values()))
+            yield self.report
+
+    def _write(self, items: list[dict]) -> None:
+        db = self.db
+        reasons = {(item["department_id"], item["name"]): item.pop("reason") for item in items}
+        added = {(item["department_id"], item["name"]): item["quantity"] for item in items}
+        for item in items:
+            item["company_id"] = self.company_id
+        # insertmanyvalues starts a new batch whenever a NULL appears or
+        # disappears, so keep rows with and without a par level together.
+        items.sort(key=lambda item: item["par_level"] is None)
+        if db.get_bind().dialect.name == "postgresql":
+            written = _copy_upsert(db, items)
+        else:
+            written = db.execute(
+                upserts.restock_many(
+                    db, StockItem.id, StockItem.department_id, StockItem.name, StockItem.version,
+                    StockItem.quantity,
+                ),
+                items,
+            ).all()
+        history = []
+        for item_id, department_id, name, version, quantity in written:
+            created = upserts.was_inserted(version)
+            self.report.created += created
+            self.report.restocked += not created
+            history.append({
+                "stock_item_id": item_id,
+                "user_id": self.user_id,
+                "company_id": self.company_id,
+                "action": "create" if created else "add",
+                "reason": reasons[department_id, name],
+                "timestamp": self.now,
+                "quantity_delta": added[department_id, name],
+                "quantity_after": quantity,
+            })
+        db.execute(insert(StockHistory), history)
+        item_ids = [row[0] for row in written]
+        warnings_store.refresh(db, item_ids)
+        rollups.refresh(db, item_ids)
+        changes.record(
+            db, self.company_id, "import",
+            department_ids={row[1] for row in written},
+            item_ids=item_ids,
+        )
+        db.commit()
+
+
+_STAGING_COLUMNS = ("name", "quantity", "department_id", "company_id", "par_level", "acquired_at")
+
+
+def _copy_upsert(db: Session, items: list[dict]) -> list:
+    """Postgres: COPY the chunk into a temp table, then upsert from it in one statement."""
+    connection = db.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS stock_import_staging ("
+        " name varchar, quantity integer, department_id integer,"
+        " company_id integer, par_level integer, acquired_at timestamp"
+        ") ON COMMIT DELETE ROWS"
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for item in items:
+        writer.writerow(
+            "" if item[c] is None else item[c].isoformat() if c == "acquired_at" else item[c]
+            for c in _STAGING_COLUMNS
+        )
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        f"COPY stock_import_staging ({', '.join(_STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+    return connection.exec_driver_sql(
+        f"""
+        INSERT INTO stock_items
+            ({', '.join(_STAGING_COLUMNS)}, is_faulty, is_deleted, created_at, version)
+        SELECT {', '.join(_STAGING_COLUMNS)}, false, false, %(now)s, 1
+        FROM stock_import_staging
+        ON CONFLICT (company_id, department_id, name) WHERE is_deleted = false
+        DO UPDATE SET
+            quantity = stock_items.quantity + excluded.quantity,
+            par_level = coalesce(excluded.par_level, stock_items.par_level),
+            version = stock_items.version + 1
+        RETURNING id, department_id, name, version, quantity
+        """,
+        {"now": datetime.utcnow()},
+    ).all()
+
+
+def import_csv(
+    db: Session,
+    lines: Iterable[str],
+    company_id: int,
+    user_id: int,
+    on_progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    importer = StockImporter(db, company_id, user_id)
+    for report in importer.run(lines):
+        if on_progress is not None:
+            on_progress(report)
+    return importer.report
+
+
+def _text_lines(upload: UploadFile) -> Iterator[str]:
+    return io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+
+
+def _progress_stream(upload: UploadFile, company_id: int, user_id: int) -> Iterator[bytes]:
+    # Owns its session: the stream outlives the request-scoped one.
+    db = SessionLocal()
+    try:
+        importer = StockImporter(db, company_id, user_id)
+        try:
+            for report in importer.run(_text_lines(upload)):
+                yield orjson.dumps({
+                    "type": "progress",
+                    "rows": report.rows,
+                    "created": report.created,
+                    "restocked": report.restocked,
+                    "failed": report.failed,
+                }) + b"\n"
+        except ValueError as exc:
+            yield orjson.dumps({"type": "error", "detail": str(exc)}) + b"\n"
+            return
+        yield orjson.dumps({"type": "done", **importer.report.as_dict()}) + b"\n"
+    finally:
+        db.close()
+        upload.file.close()
+
+
+@router.post("/stock/import", response_model=StockImportReport)
+def import_stock(
+    file: UploadFile = File(...),
+    progress: bool = False,
+    current_user=Depends(auth.require_role("warehouse")),
+    db: Session = Depends(get_db),
+):
+    """Import stock items from a CSV upload.
+
+    With ``progress=true`` the response is NDJSON: a ``progress`` line per
+    chunk and a final ``done`` line carrying the full report.
+    """
+    if progress:
+        return StreamingResponse(
+            _progress_stream(file, current_user.company_id, current_user.id),
+            media_type="application/x-ndjson",
+        )
+    try:
+        report = import_csv(db, _text_lines(file), current_user.company_id, current_user.id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return report.as_dict()
@@ -1,14 +1,28 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse, ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import func, select, update
+from datetime import datetime
 
-from . import auth
-from .database import Base, engine, get_db
+from . import (
+    auth, changes, hashing, history_archive, metrics, queries, realtime, rollups, slow_queries,
+    snapshots, upserts, versions, warnings_store,
+)
+from .database import (
+    DB_PROFILE, USE_ASYNC_DB, Base, SessionLocal, async_engine, engine, get_db, pool_stats,
+)
 from .models import Department, StockItem, StockHistory, Assignment, User
 from .audit import router as audit_router
+from .responses import rows_response
+from .bulk import router as bulk_router
+from .export import router as export_router
+from .importer import router as import_router
+from .search import router as search_router
+from .snapshots import router as snapshots_router
 from .schemas import (
+    DepartmentSummary,
     StockAddRequest,
     StockAssignRequest,
     StockReturnRequest,
@@ -20,12 +34,52 @@ from .schemas import (
 )
 
 app = FastAPI(title="Stock Management System")
+if USE_ASYNC_DB:
+    from .async_routes import router as async_router
+
+    # Registered first so the async handlers win over the sync ones below.
+    app.include_router(async_router)
 app.include_router(audit_router)
+app.include_router(bulk_router)
+app.include_router(export_router)
+app.include_router(import_router)
+app.include_router(search_router)
+app.include_router(snapshots_router)
+app.include_router(realtime.router)
+if metrics.METRICS_ENABLED:
+    metrics.instrument(engine)
+    if async_engine is not None:
+        metrics.instrument(async_engine.sync_engine)
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(metrics.router)
+if slow_queries.SLOW_QUERY_MS > 0:
+    slow_queries.instrument(engine, engine)
+    if async_engine is not None:
+        # Plans need the sync driver's parameter style; aiosqlite shares it.
+        same_style = async_engine.dialect.paramstyle == engine.dialect.paramstyle
+        slow_queries.instrument(async_engine.sync_engine, engine if same_style else None)
+    app.add_middleware(slow_queries.SlowQueryMiddleware)
+
+
+@app.exception_handler(StaleDataError)
+def stale_data_handler(request: Request, exc: StaleDataError):
+    # Another request changed the row between our read and our write.
+    return JSONResponse(
+        status_code=409, content={"detail": "Item was modified concurrently, retry"}
+    )
 
 
 @app.on_event("startup")
 def on_startup():
     Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        snapshots.take_baselines(db)
+    hashing.verifier.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    hashing.verifier.shutdown()
 
 
 @app.get("/")
@@ -34,22 +88,45 @@ def read_root():
 
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
-    if not user:
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    try:
+        ok = await auth.authenticate(form_data.username, form_data.password)
+    except hashing.HashingBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many logins in progress, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if not ok:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    access_token = auth.create_access_token({"sub": user.username})
+    access_token = auth.create_access_token({"sub": form_data.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.get("/departments")
-def list_departments(current_user=Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    departments = (
-        db.query(Department)
-        .filter(Department.company_id == current_user.company_id)
-        .all()
+def list_departments(
+    request: Request,
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    tag = versions.etag(request, current_user, versions.current_version(db, current_user.company_id))
+    stmt = select(Department.id, Department.name, Department.company_id).where(
+        Department.company_id == current_user.company_id
+    )
+    return versions.conditional(request, tag, lambda: rows_response(db.execute(stmt)))
+
+
+@app.get("/departments/summary", response_model=list[DepartmentSummary])
+def department_summary(
+    request: Request,
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    tag = versions.etag(request, current_user, versions.current_version(db, current_user.company_id))
+    stmt = rollups.summary_stmt(current_user.company_id)
+    return versions.conditional(
+        request, tag, lambda: ORJSONResponse(rollups.summaries(db.execute(stmt)))
     )
-    return departments
 
 
 @app.get("/stock-items")
@@ -71,94 +148,106 @@ def add_stock(
     current_user=Depends(auth.require_role("warehouse")),
     db: Session = Depends(get_db),
 ):
-    item = (
-        db.query(StockItem)
-        .filter(
-            StockItem.company_id == current_user.company_id,
-            StockItem.department_id == payload.department_id,
-            StockItem.name == payload.name,
-        )
-        .first()
-    )
-    if item:
-        item.quantity += payload.quantity
-        if payload.par_level is not None:
-            item.par_level = payload.par_level
-        db.add(
-            StockHistory(
-                stock_item=item,
-                user_id=current_user.id,
-                company_id=current_user.company_id,
-                action="add",
-                reason=payload.reason,
-            )
-        )
-    else:
-        item = StockItem(
-            name=payload.name,
-            quantity=payload.quantity,
-            department_id=payload.department_id,
+    item = upserts.restock(
+        db,
+        StockItem,
+        company_id=current_user.company_id,
+        department_id=payload.department_id,
+        name=payload.name,
+        quantity=payload.quantity,
+        acquired_at=datetime.utcnow(),
+        par_level=payload.par_level,
+    ).scalar_one()
+    db.add(
+        StockHistory(
+            stock_item_id=item.id,
+            user_id=current_user.id,
             company_id=current_user.company_id,
-            acquired_at=datetime.utcnow(),
-            par_level=payload.par_level,
-        )
-        db.add(item)
-        db.flush()
-        db.add(
-            StockHistory(
-                stock_item=item,
-                user_id=current_user.id,
-                company_id=current_user.company_id,
-                action="create",
-                reason=payload.reason,
-            )
+            action="create" if upserts.was_inserted(item.version) else "add",
+            reason=payload.reason,
+            quantity_delta=payload.quantity,
+            quantity_after=item.quantity,
         )
+    )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "add",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+    )
     db.commit()
     db.refresh(item)
     return item
 
 
+def _adjust_quantity(db: Session, delta: int, *criteria):
+    """Atomically add ``delta`` to the matching item's quantity.
+
+    The guard conditions in ``criteria`` are evaluated by the UPDATE itself,
+    so concurrent requests cannot act on a stale quantity. Returns the
+    updated row, or None when no row matched.
+    """
+    return db.execute(
+        update(StockItem)
+        .where(*criteria)
+        .values(quantity=StockItem.quantity + delta, version=StockItem.version + 1)
+        .returning(StockItem.id, StockItem.name, StockItem.department_id, StockItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).first()
+
+
 @app.post("/stock/assign")
 def assign_stock(
     payload: StockAssignRequest,
     current_user=Depends(auth.require_role("warehouse")),
     db: Session = Depends(get_db),
 ):
-    item = (
-        db.query(StockItem)
-        .filter(
-            StockItem.id == payload.stock_item_id,
-            StockItem.company_id == current_user.company_id,
-            StockItem.is_faulty == False,
-            StockItem.is_deleted == False,
-        )
-        .first()
-    )
-    if not item or item.quantity <= 0:
-        raise HTTPException(status_code=400, detail="Item not available")
-    assignee = db.query(User).filter(User.id == payload.assignee_user_id).first()
+    assignee = db.execute(
+        select(User.id, User.company_id).where(User.id == payload.assignee_user_id)
+    ).first()
     if not assignee:
         raise HTTPException(status_code=404, detail="User not found")
     if assignee.company_id != current_user.company_id:
         raise HTTPException(status_code=403, detail="Cross-company assignment")
+    item = _adjust_quantity(
+        db, -1,
+        StockItem.id == payload.stock_item_id,
+        StockItem.company_id == current_user.company_id,
+        StockItem.is_faulty == False,
+        StockItem.is_deleted == False,
+        StockItem.quantity > 0,
+    )
+    if not item:
+        raise HTTPException(status_code=400, detail="Item not available")
 
-    item.quantity -= 1
-    assignment = Assignment(
-        stock_item=item,
-        assignee=assignee,
-        assigned_by=current_user,
-        company_id=current_user.company_id,
+    db.add(
+        Assignment(
+            stock_item_id=item.id,
+            assignee_user_id=assignee.id,
+            assigned_by_id=current_user.id,
+            company_id=current_user.company_id,
+        )
     )
-    db.add(assignment)
     db.add(
         StockHistory(
-            stock_item=item,
+            stock_item_id=item.id,
             user_id=current_user.id,
             company_id=current_user.company_id,
             action="assign",
             reason=payload.reason,
+            quantity_delta=-1,
+            quantity_after=item.quantity,
         )
     )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "assign",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+        user_ids=[assignee.id],
+    )
     db.commit()
     return {"detail": "assigned"}
 
@@ -169,29 +258,43 @@ def return_stock(
     current_user=Depends(auth.require_role("warehouse")),
     db: Session = Depends(get_db),
 ):
-    assignment = (
-        db.query(Assignment)
-        .filter(
+    # Closing the assignment and reading its item happen in one statement;
+    # the returned_at guard makes concurrent returns of the same assignment
+    # succeed exactly once.
+    assignment = db.execute(
+        update(Assignment)
+        .where(
             Assignment.id == payload.assignment_id,
             Assignment.company_id == current_user.company_id,
             Assignment.returned_at.is_(None),
             Assignment.stock_item.has(is_deleted=False),
         )
-        .first()
-    )
+        .values(returned_at=datetime.utcnow())
+        .returning(Assignment.stock_item_id, Assignment.assignee_user_id)
+        .execution_options(synchronize_session=False)
+    ).first()
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    assignment.returned_at = datetime.utcnow()
-    assignment.stock_item.quantity += 1
+    item = _adjust_quantity(db, 1, StockItem.id == assignment.stock_item_id)
     db.add(
         StockHistory(
-            stock_item=assignment.stock_item,
+            stock_item_id=item.id,
             user_id=current_user.id,
             company_id=current_user.company_id,
             action="return",
             reason=payload.reason,
+            quantity_delta=1,
+            quantity_after=item.quantity,
         )
     )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "return",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+        user_ids=[assignment.assignee_user_id],
+    )
     db.commit()
     return {"detail": "returned"}
 
@@ -221,8 +324,17 @@ def mark_faulty(
             company_id=current_user.company_id,
             action="faulty",
             reason=payload.reason,
+            quantity_delta=0,
+            quantity_after=item.quantity,
         )
     )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "faulty",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+    )
     db.commit()
     return {"detail": "marked faulty"}
 
@@ -233,48 +345,53 @@ def transfer_stock(
     current_user=Depends(auth.require_role("warehouse")),
     db: Session = Depends(get_db),
 ):
-    item = (
-        db.query(StockItem)
-        .filter(
-            StockItem.id == payload.stock_item_id,
-            StockItem.company_id == current_user.company_id,
-            StockItem.is_faulty == False,
-            StockItem.is_deleted == False,
-        )
-        .first()
+    item = _adjust_quantity(
+        db, -payload.quantity,
+        StockItem.id == payload.stock_item_id,
+        StockItem.company_id == current_user.company_id,
+        StockItem.is_faulty == False,
+        StockItem.is_deleted == False,
+        StockItem.quantity >= payload.quantity,
     )
-    if not item or item.quantity < payload.quantity:
+    if not item:
         raise HTTPException(status_code=400, detail="Not enough stock")
-    dest_item = (
-        db.query(StockItem)
-        .filter(
-            StockItem.name == item.name,
-            StockItem.department_id == payload.to_department_id,
-            StockItem.company_id == current_user.company_id,
-            StockItem.is_deleted == False,
-        )
-        .first()
-    )
-    if dest_item:
-        dest_item.quantity += payload.quantity
-    else:
-        dest_item = StockItem(
-            name=item.name,
-            quantity=payload.quantity,
-            department_id=payload.to_department_id,
-            company_id=current_user.company_id,
-        )
-        db.add(dest_item)
+    dest_item = upserts.restock(
+        db,
+        StockItem.id,
+        StockItem.department_id,
+        StockItem.quantity,
+        company_id=current_user.company_id,
+        department_id=payload.to_department_id,
+        name=item.name,
+        quantity=payload.quantity,
+    ).one()
 
-    item.quantity -= payload.quantity
-    db.add(
+    db.add_all([
         StockHistory(
-            stock_item=item,
+            stock_item_id=item.id,
             user_id=current_user.id,
             company_id=current_user.company_id,
             action="transfer",
             reason=payload.reason,
-        )
+            quantity_delta=-payload.quantity,
+            quantity_after=item.quantity,
+        ),
+        StockHistory(
+            stock_item_id=dest_item.id,
+            user_id=current_user.id,
+            company_id=current_user.company_id,
+            action="transfer",
+            reason=payload.reason,
+            quantity_delta=payload.quantity,
+            quantity_after=dest_item.quantity,
+        ),
+    ])
+    warnings_store.refresh(db, [item.id, dest_item.id])
+    rollups.refresh(db, [item.id, dest_item.id])
+    changes.record(
+        db, current_user.company_id, "transfer",
+        department_ids=[item.department_id, dest_item.department_id],
+        item_ids=[item.id, dest_item.id],
     )
     db.commit()
     return {"detail": "transferred"}
@@ -306,8 +423,17 @@ def delete_stock(
             company_id=current_user.company_id,
             action="delete",
             reason=reason,
+            quantity_delta=0,
+            quantity_after=item.quantity,
         )
     )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "delete",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+    )
     db.commit()
     return {"detail": "deleted"}
 
@@ -337,8 +463,17 @@ def update_par_level(
             user_id=current_user.id,
             company_id=current_user.company_id,
             action="set_par_level",
+            quantity_delta=0,
+            quantity_after=item.quantity,
         )
     )
+    warnings_store.refresh(db, [item.id])
+    rollups.refresh(db, [item.id])
+    changes.record(
+        db, current_user.company_id, "set_par_level",
+        department_ids=[item.department_id],
+        item_ids=[item.id],
+    )
     db.commit()
     db.refresh(item)
     return item
@@ -346,25 +481,18 @@ def update_par_level(
 
 @app.get("/stock/warnings", response_model=list[StockItemResponse])
 def stock_warnings(
+    request: Request,
     current_user=Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
-    items = (
-        db.query(StockItem)
-        .filter(
-            StockItem.company_id == current_user.company_id,
-            StockItem.is_deleted == False,
-            StockItem.is_faulty == False,
-            StockItem.par_level.isnot(None),
-            StockItem.quantity < StockItem.par_level,
-        )
-        .all()
-    )
-    return items
+    tag = versions.etag(request, current_user, versions.current_version(db, current_user.company_id))
+    stmt = queries.stock_item_rows(queries.stock_warnings(current_user.company_id))
+    return versions.conditional(request, tag, lambda: rows_response(db.execute(stmt)))
 
 
 @app.get("/stock", response_model=list[StockItemResponse])
 def view_stock(
+    request: Request,
     department_id: int | None = None,
     user_id: int | None = None,
     below_par: bool | None = None,
@@ -374,55 +502,31 @@ def view_stock(
     db: Session = Depends(get_db),
 ):
     if user_id is not None:
-        assign_q = (
-            db.query(Assignment)
-            .join(StockItem)
-            .filter(
-                Assignment.assignee_user_id == user_id,
-                Assignment.returned_at.is_(None),
-                Assignment.company_id == current_user.company_id,
-                StockItem.is_deleted == False,
-            )
+        # Assignments to the user may live in any department.
+        version = versions.current_version(db, current_user.company_id)
+        stmt = queries.assigned_items(current_user.company_id, user_id, department_id)
+    else:
+        version = versions.current_version(db, current_user.company_id, department_id)
+        stmt = queries.stock_items(
+            current_user.company_id, department_id, below_par, older_than_days, status
         )
-        if department_id is not None:
-            assign_q = assign_q.filter(StockItem.department_id == department_id)
-        assignments = assign_q.all()
-        return [a.stock_item for a in assignments]
-    q = db.query(StockItem).filter(
-        StockItem.company_id == current_user.company_id,
-        StockItem.is_deleted == False,
+    tag = versions.etag(request, current_user, version)
+    return versions.conditional(
+        request, tag, lambda: rows_response(db.execute(queries.stock_item_rows(stmt)))
     )
-    if department_id is not None:
-        q = q.filter(StockItem.department_id == department_id)
-    if below_par:
-        q = q.filter(StockItem.par_level.isnot(None)).filter(StockItem.quantity < StockItem.par_level)
-    if older_than_days is not None:
-        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
-        q = q.filter(StockItem.acquired_at < cutoff)
-    if status == "faulty":
-        q = q.filter(StockItem.is_faulty == True)
-    elif status == "ok":
-        q = q.filter(StockItem.is_faulty == False)
-    return q.all()
 
 
 @app.get("/my-equipment", response_model=list[StockItemResponse])
 def my_equipment(
+    request: Request,
     current_user=Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
-    assignments = (
-        db.query(Assignment)
-        .join(StockItem)
-        .filter(
-            Assignment.assignee_user_id == current_user.id,
-            Assignment.returned_at.is_(None),
-            Assignment.company_id == current_user.company_id,
-            StockItem.is_deleted == False,
-        )
-        .all()
+    tag = versions.etag(request, current_user, versions.current_version(db, current_user.company_id))
+    stmt = queries.assigned_items(current_user.company_id, current_user.id)
+    return versions.conditional(
+        request, tag, lambda: rows_response(db.execute(queries.stock_item_rows(stmt)))
     )
-    return [a.stock_item for a in assignments]
 
 
 @app.get("/stock/history/{item_id}", response_model=list[StockHistoryResponse])
@@ -431,15 +535,29 @@ def stock_history(
     current_user=Depends(auth.get_current_user),
     db: Session = Depends(get_db),
 ):
-    history = (
-        db.query(StockHistory)
-        .filter(
-            StockHistory.stock_item_id == item_id,
-            StockHistory.company_id == current_user.company_id,
-        )
-        .order_by(StockHistory.timestamp.desc())
-        .all()
-    )
-    return history
+    manifest = history_archive.load_manifest(current_user.company_id)
+    stmt = queries.item_history(current_user.company_id, item_id, manifest.archived_before)
+    rows = [row._asdict() for row in db.execute(queries.history_rows(stmt))]
+    rows += history_archive.archived_item_history(manifest, item_id)
+    return ORJSONResponse(rows)
+
+
+@app.get("/admin/db/pool")
+def db_pool_stats(current_user=Depends(auth.require_role("admin"))):
+    """Connection pool checkouts and time spent waiting for a connection."""
+    return {"profile": DB_PROFILE, "pools": pool_stats()}
+
+
+@app.get("/admin/slow-queries")
+def list_slow_queries(current_user=Depends(auth.require_role("admin"))):
+    """The company's statements slower than ``SLOW_QUERY_MS``, newest first, with their plans."""
+    return {
+        "threshold_ms": slow_queries.SLOW_QUERY_MS or None,
+        "entries": slow_queries.company_entries(current_user.company_id),
+    }
 
 
+@app.delete("/admin/slow-queries")
+def clear_slow_queries(current_user=Depends(auth.require_role("admin"))):
+    slow_queries.clear(current_user.company_id)
+    return {"detail": "cleared"}
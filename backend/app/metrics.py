@@ -0,0 +1,230 @@
+"""Request and database metrics in the Prometheus text format, at ``/metrics``.
+
+:class:`MetricsMiddleware` keeps, per route template and method, a latency
+histogram and response counts by status, plus an in-flight gauge per
+method. :func:`instrument` hooks an engine's cursor events, and its pool's
+wait observers, so every statement's count and duration, and every wait
+for a pooled connection, is charged to the request that caused it. Work
+outside a request is reported under ``route="none"``. The auth caches'
+hit, miss and size counts are reported per ``cache``.
+
+Everything is plain counters updated in place; there is no locking on the
+request path beyond what the pool already does. Disable with
+``METRICS_ENABLED=false``.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import auth
+from .database import pool_stats
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "unmatched"
+
+router = APIRouter(tags=["metrics"])
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class DbUsage:
+    """Database work done on behalf of one request."""
+
+    __slots__ = ("statements", "seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def add(self, other: "DbUsage") -> None:
+        self.statements += other.statements
+        self.seconds += other.seconds
+        self.pool_wait_seconds += other.pool_wait_seconds
+
+
+_current: ContextVar[Optional[DbUsage]] = ContextVar("metrics_db_usage", default=None)
+_latency: dict[tuple[str, str], Histogram] = {}
+_responses: dict[tuple[str, str, int], int] = {}
+_in_flight: dict[str, int] = {}
+_db: dict[tuple[str, str], DbUsage] = {}
+# Statements outside any request run on arbitrary threads.
+_background = DbUsage()
+_background_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    usage = _current.get()
+    if usage is None:
+        with _background_lock:
+            _background.statements += 1
+            _background.seconds += elapsed
+        return
+    usage.statements += 1
+    usage.seconds += elapsed
+
+
+def _pool_wait(seconds: float) -> None:
+    usage = _current.get()
+    if usage is None:
+        with _background_lock:
+            _background.pool_wait_seconds += seconds
+        return
+    usage.pool_wait_seconds += seconds
+
+
+def instrument(engine: Engine) -> None:
+    """Charge ``engine``'s statements and pool waits to the current request."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    stats = getattr(engine.pool, "stats", None)
+    if stats is not None:
+        stats.observers.append(_pool_wait)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = 500
+        usage = DbUsage()
+        token = _current.set(usage)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        _in_flight[method] = _in_flight.get(method, 0) + 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight[method] -= 1
+            _current.reset(token)
+            # The router puts the matched route into the scope.
+            route = getattr(scope.get("route"), "path", UNMATCHED)
+            key = (method, route)
+            histogram = _latency.get(key)
+            if histogram is None:
+                histogram = _latency[key] = Histogram()
+            histogram.observe(elapsed)
+            _responses[method, route, status] = _responses.get((method, route, status), 0) + 1
+            db = _db.get(key)
+            if db is None:
+                db = _db[key] = DbUsage()
+            db.add(usage)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def _family(lines: list[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render() -> str:
+    lines: list[str] = []
+    _family(lines, "http_request_duration_seconds", "histogram", "Request latency by route.")
+    for (method, route), h in sorted(_latency.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), h.counts):
+            cumulative += count
+            lines.append(
+                f"http_request_duration_seconds_bucket{_labels(method=method, route=route, le=bound)} {cumulative}"
+            )
+        lines.append(f"http_request_duration_seconds_sum{_labels(method=method, route=route)} {h.sum}")
+        lines.append(f"http_request_duration_seconds_count{_labels(method=method, route=route)} {h.count}")
+
+    _family(lines, "http_requests_total", "counter", "Responses by route and status.")
+    for (method, route, status), count in sorted(_responses.items()):
+        lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+    _family(lines, "http_requests_in_flight", "gauge", "Requests being handled.")
+    for method, count in sorted(_in_flight.items()):
+        lines.append(f"http_requests_in_flight{_labels(method=method)} {count}")
+
+    db = sorted(_db.items())
+    db.append((("", "none"), _background))
+    for name, attr, help_text in (
+        ("db_statements_total", "statements", "SQL statements executed, by route."),
+        ("db_statement_seconds_total", "seconds", "Time spent executing SQL, by route."),
+        ("db_pool_wait_seconds_total", "pool_wait_seconds", "Time spent waiting for a pooled connection, by route."),
+    ):
+        _family(lines, name, "counter", help_text)
+        for (method, route), usage in db:
+            lines.append(f"{name}{_labels(method=method, route=route)} {getattr(usage, attr)}")
+
+    pools = pool_stats()
+    for name, key, kind, help_text in (
+        ("db_pool_size", "size", "gauge", "Configured pool size."),
+        ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out."),
+        ("db_pool_overflow", "overflow", "gauge", "Overflow connections currently open."),
+        ("db_pool_checkouts_total", "checkouts", "counter", "Connection checkouts."),
+        ("db_pool_timeouts_total", "timeouts", "counter", "Checkouts that timed out."),
+    ):
+        _family(lines, name, kind, help_text)
+        for engine_name, stats in sorted(pools.items()):
+            # QueuePool reports overflow as negative while below its size.
+            lines.append(f"{name}{_labels(engine=engine_name)} {max(stats[key], 0)}")
+
+    caches = {"principal": auth.principal_cache, "token": auth.token_cache}
+    caches = {name: cache.stats() for name, cache in caches.items() if cache is not None}
+    for name, key, kind, help_text in (
+        ("auth_cache_hits_total", "hits", "counter", "Auth cache lookups answered from the cache."),
+        ("auth_cache_misses_total", "misses", "counter", "Auth cache lookups that missed or had expired."),
+        ("auth_cache_entries", "size", "gauge", "Entries currently held by the auth cache."),
+    ):
+        _family(lines, name, kind, help_text)
+        for cache_name, stats in sorted(caches.items()):
+            lines.append(f"{name}{_labels(cache=cache_name)} {stats[key]}")
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    # On the event loop, like the middleware that updates the counters.
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
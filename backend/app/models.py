@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import (
+    DDL, BigInteger, Column, Integer, String, ForeignKey, DateTime, Boolean, Index, event, func,
+    literal_column,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -42,6 +45,11 @@ class User(Base):
     company = relationship("Company")
 
 
+# Text search configuration of ix_stock_items_name_search; queries must use
+# the same expression for Postgres to pick the index.
+SEARCH_CONFIG = "'simple'::regconfig"
+
+
 class StockItem(Base):
     __tablename__ = "stock_items"
     id = Column(Integer, primary_key=True)
@@ -54,10 +62,33 @@ class StockItem(Base):
     acquired_at = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_deleted = Column(Boolean, default=False)
+    # Bumped by every write; the ORM uses it for optimistic concurrency.
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     department = relationship("Department")
     company = relationship("Company")
 
+    __table_args__ = (
+        # At most one live item per natural key; upserts.restock targets it.
+        Index(
+            "uq_stock_items_live_name",
+            company_id,
+            department_id,
+            name,
+            unique=True,
+            postgresql_where=is_deleted == False,
+            sqlite_where=is_deleted == False,
+        ),
+        # /stock/search on Postgres; SQLite uses the stock_search FTS5 table below.
+        Index(
+            "ix_stock_items_name_search",
+            func.to_tsvector(literal_column(SEARCH_CONFIG), name),
+            postgresql_using="gin",
+            postgresql_where=is_deleted == False,
+        ).ddl_if(dialect="postgresql"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
     @property
     def age_in_days(self) -> int:
         """Return the age of the item in whole days."""
@@ -73,6 +104,89 @@ class StockItem(Base):
         return self.quantity < self.par_level
 
 
+class StockWarning(Base):
+    """Denormalized set of live items currently below their par level."""
+
+    __tablename__ = "stock_warnings"
+    stock_item_id = Column(Integer, ForeignKey("stock_items.id"), primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+
+    stock_item = relationship("StockItem")
+
+
+# Live item names for /stock/search on SQLite, one row per item keyed by its
+# id. ``company`` holds a "c<company_id>" token so a search only walks the
+# company's postings. Triggers keep it in step with inserts, renames and
+# soft deletes; quantity-only updates don't touch it.
+STOCK_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS stock_search USING fts5(name, company, prefix='2 3')",
+    """CREATE TRIGGER IF NOT EXISTS stock_search_insert AFTER INSERT ON stock_items
+    WHEN new.is_deleted = 0 BEGIN
+        INSERT INTO stock_search (rowid, name, company) VALUES (new.id, new.name, 'c' || new.company_id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stock_search_update
+    AFTER UPDATE OF name, company_id, is_deleted ON stock_items BEGIN
+        DELETE FROM stock_search WHERE rowid = old.id;
+        INSERT INTO stock_search (rowid, name, company)
+        SELECT new.id, new.name, 'c' || new.company_id WHERE new.is_deleted = 0;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS stock_search_delete AFTER DELETE ON stock_items BEGIN
+        DELETE FROM stock_search WHERE rowid = old.id;
+    END""",
+)
+for _statement in STOCK_SEARCH_DDL:
+    event.listen(StockItem.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    StockItem.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS stock_search").execute_if(dialect="sqlite"),
+)
+
+
+class DepartmentRollup(Base):
+    """Per-department totals over live items, kept current by :mod:`app.rollups`.
+
+    Average age is derived from ``acquired_seconds`` (the sum of the dated
+    items' ``acquired_at`` as epoch seconds) and ``dated_items``.
+    """
+
+    __tablename__ = "department_rollups"
+    department_id = Column(Integer, ForeignKey("departments.id"), primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+    total_quantity = Column(BigInteger, nullable=False, default=0)
+    item_count = Column(Integer, nullable=False, default=0)
+    faulty_count = Column(Integer, nullable=False, default=0)
+    below_par_count = Column(Integer, nullable=False, default=0)
+    open_assignments = Column(Integer, nullable=False, default=0)
+    acquired_seconds = Column(BigInteger, nullable=False, default=0)
+    dated_items = Column(Integer, nullable=False, default=0)
+
+
+class DepartmentRollupItem(Base):
+    """Each live item's last counted contribution to its department's rollup."""
+
+    __tablename__ = "department_rollup_items"
+    stock_item_id = Column(Integer, ForeignKey("stock_items.id"), primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+    department_id = Column(Integer, ForeignKey("departments.id"))
+    total_quantity = Column(Integer, nullable=False, default=0)
+    item_count = Column(Integer, nullable=False, default=1)
+    faulty_count = Column(Integer, nullable=False, default=0)
+    below_par_count = Column(Integer, nullable=False, default=0)
+    open_assignments = Column(Integer, nullable=False, default=0)
+    acquired_seconds = Column(BigInteger, nullable=False, default=0)
+    dated_items = Column(Integer, nullable=False, default=0)
+
+
+class DataVersion(Base):
+    """Change counter per department; department_id 0 counts changes outside any department."""
+
+    __tablename__ = "data_versions"
+    company_id = Column(Integer, ForeignKey("companies.id"), primary_key=True)
+    department_id = Column(Integer, primary_key=True, default=0)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class StockHistory(Base):
     __tablename__ = "stock_history"
     id = Column(Integer, primary_key=True)
@@ -82,11 +196,41 @@ class StockHistory(Base):
     reason = Column(String, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     company_id = Column(Integer, ForeignKey("companies.id"), index=True)
+    # How much the action changed the item's quantity (0 for faulty, par level
+    # and delete) and the quantity right after it. NULL on rows written
+    # before they were recorded.
+    quantity_delta = Column(Integer, nullable=True)
+    quantity_after = Column(Integer, nullable=True)
 
     stock_item = relationship("StockItem")
     user = relationship("User")
     company = relationship("Company")
 
+    __table_args__ = (
+        Index("ix_stock_history_company_item_timestamp", company_id, stock_item_id, timestamp),
+        Index("ix_stock_history_company_timestamp_id", company_id, timestamp, id),
+    )
+
+
+class StockSnapshot(Base):
+    """A company's live item quantities at ``taken_at``; see :mod:`app.snapshots`."""
+
+    __tablename__ = "stock_snapshots"
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_stock_snapshots_company_taken_at", company_id, taken_at),
+    )
+
+
+class StockSnapshotItem(Base):
+    __tablename__ = "stock_snapshot_items"
+    snapshot_id = Column(Integer, ForeignKey("stock_snapshots.id"), primary_key=True)
+    stock_item_id = Column(Integer, ForeignKey("stock_items.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
+
 
 class Assignment(Base):
     __tablename__ = "assignments"
@@ -102,3 +246,20 @@ class Assignment(Base):
     assignee = relationship("User", foreign_keys=[assignee_user_id])
     assigned_by = relationship("User", foreign_keys=[assigned_by_id])
     company = relationship("Company")
+
+    __table_args__ = (
+        Index(
+            "ix_assignments_company_assignee_open",
+            company_id,
+            assignee_user_id,
+            returned_at,
+            postgresql_where=returned_at.is_(None),
+            sqlite_where=returned_at.is_(None),
+        ),
+        Index(
+            "ix_assignments_item_open",
+            stock_item_id,
+            postgresql_where=returned_at.is_(None),
+            sqlite_where=returned_at.is_(None),
+        ),
+    )
@@ -0,0 +1,208 @@
+"""Statement builders shared by the sync and async read endpoints."""
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean, DateTime, Integer, Select, and_, case, false, literal, or_, select, true, type_coerce,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from .models import Assignment, StockHistory, StockItem, StockWarning
+
+
+class days_since(FunctionElement):
+    """Whole days from a timestamp column to ``now``; 0 when the column is NULL."""
+
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(days_since)
+def _days_since(element, compiler, **kw):
+    now, column = (compiler.process(c, **kw) for c in element.clauses)
+    return f"COALESCE(CAST(EXTRACT(DAY FROM ({now} - {column})) AS INTEGER), 0)"
+
+
+@compiles(days_since, "sqlite")
+def _days_since_sqlite(element, compiler, **kw):
+    now, column = (compiler.process(c, **kw) for c in element.clauses)
+    return f"COALESCE(CAST(julianday({now}) - julianday({column}) AS INTEGER), 0)"
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """``value`` as naive UTC, the way timestamps are stored; query parameters may carry an offset."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def stock_item_rows(stmt: Select) -> Select:
+    """Narrow a ``select(StockItem)`` to the StockItemResponse fields.
+
+    ``age_in_days`` and ``below_par`` are computed by the database, so rows can
+    be encoded straight to JSON without hydrating ORM objects.
+    """
+    now = literal(datetime.utcnow(), DateTime)
+    return stmt.with_only_columns(
+        StockItem.id,
+        StockItem.name,
+        StockItem.quantity,
+        StockItem.department_id,
+        StockItem.is_faulty,
+        StockItem.par_level,
+        StockItem.acquired_at,
+        days_since(now, StockItem.acquired_at).label("age_in_days"),
+        StockItem.created_at,
+        type_coerce(
+            case(
+                (and_(StockItem.par_level.isnot(None), StockItem.quantity < StockItem.par_level), true()),
+                else_=false(),
+            ),
+            Boolean,
+        ).label("below_par"),
+    )
+
+
+def history_rows(stmt: Select) -> Select:
+    """Narrow a ``select(StockHistory)`` to the StockHistoryResponse fields."""
+    return stmt.with_only_columns(
+        StockHistory.id,
+        StockHistory.stock_item_id,
+        StockHistory.user_id,
+        StockHistory.action,
+        StockHistory.reason,
+        StockHistory.timestamp,
+        StockHistory.quantity_delta,
+        StockHistory.quantity_after,
+    )
+
+
+def assigned_items(company_id: int, user_id: int, department_id: Optional[int] = None) -> Select:
+    stmt = (
+        select(StockItem)
+        .join(Assignment, Assignment.stock_item_id == StockItem.id)
+        .where(
+            Assignment.assignee_user_id == user_id,
+            Assignment.returned_at.is_(None),
+            Assignment.company_id == company_id,
+            StockItem.is_deleted == False,
+        )
+    )
+    if department_id is not None:
+        stmt = stmt.where(StockItem.department_id == department_id)
+    return stmt
+
+
+def stock_items(
+    company_id: int,
+    department_id: Optional[int] = None,
+    below_par: Optional[bool] = None,
+    older_than_days: Optional[int] = None,
+    status: Optional[str] = None,
+) -> Select:
+    stmt = select(StockItem).where(
+        StockItem.company_id == company_id,
+        StockItem.is_deleted == False,
+    )
+    if department_id is not None:
+        stmt = stmt.where(StockItem.department_id == department_id)
+    if below_par:
+        stmt = stmt.where(StockItem.par_level.isnot(None), StockItem.quantity < StockItem.par_level)
+    if older_than_days is not None:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        stmt = stmt.where(StockItem.acquired_at < cutoff)
+    if status == "faulty":
+        stmt = stmt.where(StockItem.is_faulty == True)
+    elif status == "ok":
+        stmt = stmt.where(StockItem.is_faulty == False)
+    return stmt
+
+
+def assignments(
+    company_id: int,
+    department_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    open_only: bool = False,
+) -> Select:
+    """Assignment rows with their item's name and department, oldest first."""
+    stmt = (
+        select(
+            Assignment.id,
+            Assignment.stock_item_id,
+            StockItem.name.label("item_name"),
+            StockItem.department_id,
+            Assignment.assignee_user_id,
+            Assignment.assigned_by_id,
+            Assignment.assigned_at,
+            Assignment.returned_at,
+        )
+        .join(StockItem, StockItem.id == Assignment.stock_item_id)
+        .where(Assignment.company_id == company_id)
+    )
+    if department_id is not None:
+        stmt = stmt.where(StockItem.department_id == department_id)
+    if user_id is not None:
+        stmt = stmt.where(Assignment.assignee_user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(Assignment.assigned_at >= since)
+    if until is not None:
+        stmt = stmt.where(Assignment.assigned_at < until)
+    if open_only:
+        stmt = stmt.where(Assignment.returned_at.is_(None))
+    return stmt.order_by(Assignment.id)
+
+
+def stock_warnings(company_id: int) -> Select:
+    return (
+        select(StockItem)
+        .join(StockWarning, StockWarning.stock_item_id == StockItem.id)
+        .where(StockWarning.company_id == company_id, StockItem.is_deleted == False)
+    )
+
+
+def item_history(company_id: int, item_id: int, since: Optional[datetime] = None) -> Select:
+    stmt = select(StockHistory).where(
+        StockHistory.stock_item_id == item_id,
+        StockHistory.company_id == company_id,
+    )
+    if since is not None:
+        stmt = stmt.where(StockHistory.timestamp >= since)
+    return stmt.order_by(StockHistory.timestamp.desc())
+
+
+def audit_history(
+    company_id: int,
+    item_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    since: Optional[datetime] = None,
+    action: Optional[str] = None,
+) -> Select:
+    """History rows in (timestamp, id) descending order, optionally after a keyset position.
+
+    ``since`` is the oldest timestamp to include, e.g. the archive watermark.
+    """
+    stmt = select(StockHistory).where(StockHistory.company_id == company_id)
+    if since is not None:
+        stmt = stmt.where(StockHistory.timestamp >= since)
+    if action is not None:
+        stmt = stmt.where(StockHistory.action == action)
+    if department_id is not None:
+        stmt = stmt.join(StockItem).where(StockItem.department_id == department_id)
+    if item_id is not None:
+        stmt = stmt.where(StockHistory.stock_item_id == item_id)
+    if user_id is not None:
+        stmt = stmt.where(StockHistory.user_id == user_id)
+    if after is not None:
+        timestamp, row_id = after
+        stmt = stmt.where(
+            or_(
+                StockHistory.timestamp < timestamp,
+                and_(StockHistory.timestamp == timestamp, StockHistory.id < row_id),
+            )
+        )
+    return stmt.order_by(StockHistory.timestamp.desc(), StockHistory.id.desc())
@@ -0,0 +1,196 @@
+"""In-process pub/sub for the ``/ws/{user_id}`` push channel.
+
+Mutation handlers record what they changed with :func:`notify` before
+committing. Once the transaction commits, the events go to the
+:class:`EventHub`, which merges everything published for a company within
+one debounce window into a single message per subscriber. Messages are
+invalidation hints: clients refetch the affected queries on receipt.
+"""
+import asyncio
+import json
+import os
+from typing import Iterable, Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import auth
+
+DEBOUNCE_SECONDS = float(os.getenv("REALTIME_DEBOUNCE_MS", "250")) / 1000
+SUBSCRIBER_QUEUE_SIZE = 8
+# Roles that follow every department in their company.
+COMPANY_WIDE_ROLES = {"admin", "warehouse"}
+
+router = APIRouter()
+
+
+class Subscriber:
+    __slots__ = ("user_id", "company_id", "department_id", "company_wide", "queue")
+
+    def __init__(self, principal: auth.Principal):
+        self.user_id = principal.id
+        self.company_id = principal.company_id
+        self.department_id = principal.department_id
+        self.company_wide = principal.role_name in COMPANY_WIDE_ROLES
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, batch: "_Batch") -> bool:
+        return (
+            self.company_wide
+            or self.department_id in batch.department_ids
+            or self.user_id in batch.user_ids
+        )
+
+
+class _Batch:
+    __slots__ = ("department_ids", "user_ids", "item_ids", "actions", "count")
+
+    def __init__(self):
+        self.department_ids: set[int] = set()
+        self.user_ids: set[int] = set()
+        self.item_ids: set[int] = set()
+        self.actions: set[str] = set()
+        self.count = 0
+
+    def message(self, company_id: int) -> str:
+        return json.dumps({
+            "type": "stock-update",
+            "company_id": company_id,
+            "department_ids": sorted(self.department_ids),
+            "item_ids": sorted(self.item_ids),
+            "actions": sorted(self.actions),
+            "count": self.count,
+        })
+
+
+class EventHub:
+    """Fans out coalesced per-company change events to websocket subscribers.
+
+    ``publish`` may be called from any thread; all other state is only
+    touched on the event loop the first subscriber registered from.
+    """
+
+    def __init__(self, debounce: float = DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self.dropped = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: dict[int, set[Subscriber]] = {}
+        self._pending: dict[int, _Batch] = {}
+
+    def subscribe(self, principal: auth.Principal) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(principal)
+        self._subscribers.setdefault(subscriber.company_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.company_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.company_id]
+
+    def connection_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def publish(
+        self,
+        company_id: int,
+        action: str,
+        department_ids: Iterable[Optional[int]] = (),
+        item_ids: Iterable[Optional[int]] = (),
+        user_ids: Iterable[Optional[int]] = (),
+    ) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(
+            self._enqueue, company_id, action, tuple(department_ids), tuple(item_ids), tuple(user_ids)
+        )
+
+    def _enqueue(self, company_id, action, department_ids, item_ids, user_ids) -> None:
+        if company_id not in self._subscribers:
+            return
+        batch = self._pending.get(company_id)
+        if batch is None:
+            batch = self._pending[company_id] = _Batch()
+            self._loop.call_later(self.debounce, self._flush, company_id)
+        batch.actions.add(action)
+        batch.department_ids.update(d for d in department_ids if d is not None)
+        batch.item_ids.update(i for i in item_ids if i is not None)
+        batch.user_ids.update(u for u in user_ids if u is not None)
+        batch.count += 1
+
+    def _flush(self, company_id: int) -> None:
+        batch = self._pending.pop(company_id, None)
+        if batch is None:
+            return
+        message = None
+        for subscriber in self._subscribers.get(company_id, ()):
+            if not subscriber.wants(batch):
+                continue
+            message = message or batch.message(company_id)
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The client is already behind on identical invalidation hints.
+                self.dropped += 1
+
+
+hub = EventHub()
+
+
+def notify(
+    db: Session,
+    company_id: int,
+    action: str,
+    department_ids: Iterable[Optional[int]] = (),
+    item_ids: Iterable[Optional[int]] = (),
+    user_ids: Iterable[Optional[int]] = (),
+) -> None:
+    """Queue an event on ``db`` to be published once its transaction commits."""
+    db.info.setdefault("realtime_events", []).append(
+        (company_id, action, tuple(department_ids), tuple(item_ids), tuple(user_ids))
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    for args in session.info.pop("realtime_events", ()):
+        hub.publish(*args)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("realtime_events", None)
+
+
+async def _pump(websocket: WebSocket, subscriber: Subscriber) -> None:
+    while True:
+        await websocket.send_text(await subscriber.queue.get())
+
+
+@router.websocket("/ws/{user_id}")
+async def stock_updates(websocket: WebSocket, user_id: int, token: str = Query(...)):
+    try:
+        principal = await run_in_threadpool(auth.load_principal, auth.token_subject(token))
+    except HTTPException:
+        principal = None
+    if principal is None or principal.id != user_id:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscriber = hub.subscribe(principal)
+    sender = asyncio.create_task(_pump(websocket, subscriber))
+    try:
+        while True:
+            # Client messages are ignored; this only waits for the disconnect.
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,9 @@
+from typing import Iterable
+
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Row
+
+
+def rows_response(rows: Iterable[Row]) -> ORJSONResponse:
+    """Encode column rows as a JSON list of objects without building models."""
+    return ORJSONResponse([row._asdict() for row in rows])
@@ -0,0 +1,245 @@
+"""Maintenance of the per-department rollups behind ``/departments/summary``.
+
+``department_rollups`` holds running totals per department. Every handler
+that changes an item's quantity, par level, faulty or deleted flag, or its
+open assignments, calls :func:`refresh` for the touched items before
+committing (next to ``warnings_store.refresh``). Each item's last counted
+contribution is kept in ``department_rollup_items``, so a refresh only
+applies the difference between the old and new contribution, in the same
+transaction, and never scans a department.
+
+An item counts while it is live and has a department. It is below par
+when ``quantity < par_level``, like ``StockItem.below_par``. Average age
+comes from the sum of the items' ``acquired_at`` epoch seconds.
+
+:func:`rebuild` recomputes both tables from scratch, recording a change
+for the departments whose totals it corrected, and :func:`reconcile`
+compares the totals against the base tables without changing anything.
+"""
+import time
+from collections import defaultdict
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from sqlalchemy import BigInteger, Select, and_, case, cast, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import changes
+from .models import Assignment, Department, DepartmentRollup, DepartmentRollupItem, StockItem
+
+COUNTERS = (
+    "total_quantity",
+    "item_count",
+    "faulty_count",
+    "below_par_count",
+    "open_assignments",
+    "acquired_seconds",
+    "dated_items",
+)
+SECONDS_PER_DAY = 86400
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def _epoch(dialect_name: str, column):
+    if dialect_name == "sqlite":
+        return cast(func.strftime("%s", column), BigInteger)
+    # Naive timestamps are UTC throughout, so extract() needs no zone.
+    return cast(func.floor(func.extract("epoch", column)), BigInteger)
+
+
+def _contributions(dialect_name: str, *criteria) -> Select:
+    """One row per counted item with its contribution to every counter."""
+    open_assignments = (
+        select(func.count())
+        .where(Assignment.stock_item_id == StockItem.id, Assignment.returned_at.is_(None))
+        .scalar_subquery()
+    )
+    below_par = and_(StockItem.par_level.isnot(None), StockItem.quantity < StockItem.par_level)
+    return select(
+        StockItem.id.label("stock_item_id"),
+        StockItem.company_id,
+        StockItem.department_id,
+        func.coalesce(StockItem.quantity, 0).label("total_quantity"),
+        literal(1).label("item_count"),
+        case((StockItem.is_faulty == True, 1), else_=0).label("faulty_count"),
+        case((below_par, 1), else_=0).label("below_par_count"),
+        open_assignments.label("open_assignments"),
+        func.coalesce(_epoch(dialect_name, StockItem.acquired_at), 0).label("acquired_seconds"),
+        case((StockItem.acquired_at.isnot(None), 1), else_=0).label("dated_items"),
+    ).where(StockItem.is_deleted == False, StockItem.department_id.isnot(None), *criteria)
+
+
+@lru_cache(maxsize=None)
+def _apply_statement(dialect_name: str):
+    # Built once per dialect, like upserts._restock_statement.
+    stmt = _INSERTS[dialect_name](DepartmentRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=[DepartmentRollup.department_id],
+        set_={
+            name: getattr(DepartmentRollup, name) + getattr(stmt.excluded, name)
+            for name in COUNTERS
+        },
+    )
+
+
+def refresh(db: Session, item_ids: Iterable[Optional[int]]) -> None:
+    """Apply the changes of ``item_ids`` to their departments' rollups in the current transaction."""
+    db.flush()
+    ids = {item_id for item_id in item_ids if item_id is not None}
+    if not ids:
+        return
+    dialect_name = db.get_bind().dialect.name
+    mirror = DepartmentRollupItem.__table__
+    old = db.execute(
+        select(mirror.c.company_id, mirror.c.department_id, *(mirror.c[name] for name in COUNTERS))
+        .where(mirror.c.stock_item_id.in_(ids))
+    ).all()
+    new = db.execute(_contributions(dialect_name, StockItem.id.in_(ids))).all()
+
+    deltas: dict[tuple[int, int], list[int]] = defaultdict(lambda: [0] * len(COUNTERS))
+    for rows, sign in ((old, -1), (new, 1)):
+        for row in rows:
+            delta = deltas[row.company_id, row.department_id]
+            for i, name in enumerate(COUNTERS):
+                delta[i] += sign * getattr(row, name)
+    changed = [
+        {"company_id": company_id, "department_id": department_id, **dict(zip(COUNTERS, delta))}
+        # Sorted so concurrent refreshes lock rollup rows in the same order.
+        for (company_id, department_id), delta in sorted(deltas.items(), key=lambda kv: kv[0][1])
+        if any(delta)
+    ]
+    if changed:
+        db.execute(_apply_statement(dialect_name), changed)
+    db.execute(delete(mirror).where(mirror.c.stock_item_id.in_(ids)))
+    if new:
+        db.execute(insert(mirror), [row._asdict() for row in new])
+
+
+def _totals(source, *criteria) -> Select:
+    return (
+        select(
+            source.c.department_id,
+            source.c.company_id,
+            *(func.sum(source.c[name]).label(name) for name in COUNTERS),
+        )
+        .where(*criteria)
+        .group_by(source.c.department_id, source.c.company_id)
+    )
+
+
+def _stored_totals(db: Session, company_id: Optional[int]) -> dict[tuple[int, int], tuple]:
+    stmt = select(
+        DepartmentRollup.company_id,
+        DepartmentRollup.department_id,
+        *(DepartmentRollup.__table__.c[name] for name in COUNTERS),
+    )
+    if company_id is not None:
+        stmt = stmt.where(DepartmentRollup.company_id == company_id)
+    return {(row[0], row[1]): tuple(row[2:]) for row in db.execute(stmt)}
+
+
+def rebuild(db: Session, company_id: Optional[int] = None) -> int:
+    """Recompute the rollups from the base tables; returns the resulting rollup row count."""
+    dialect_name = db.get_bind().dialect.name
+    before = _stored_totals(db, company_id)
+    items = delete(DepartmentRollupItem)
+    rollups = delete(DepartmentRollup)
+    criteria = ()
+    if company_id is not None:
+        items = items.where(DepartmentRollupItem.company_id == company_id)
+        rollups = rollups.where(DepartmentRollup.company_id == company_id)
+        criteria = (StockItem.company_id == company_id,)
+    db.execute(items)
+    db.execute(rollups)
+    contributions = _contributions(dialect_name, *criteria)
+    db.execute(
+        insert(DepartmentRollupItem).from_select(
+            [column.key for column in contributions.selected_columns], contributions
+        )
+    )
+    mirror = DepartmentRollupItem.__table__
+    scope = () if company_id is None else (mirror.c.company_id == company_id,)
+    db.execute(
+        insert(DepartmentRollup).from_select(
+            ["department_id", "company_id", *COUNTERS], _totals(mirror, *scope)
+        )
+    )
+    after = _stored_totals(db, company_id)
+    corrected = defaultdict(set)
+    zero = (0,) * len(COUNTERS)  # a missing row reads as all zeros
+    for key in before.keys() | after.keys():
+        if before.get(key, zero) != after.get(key, zero):
+            corrected[key[0]].add(key[1])
+    for corrected_company_id, department_ids in corrected.items():
+        changes.record(db, corrected_company_id, "rebuild-rollups", department_ids=department_ids)
+    count = select(func.count()).select_from(DepartmentRollup)
+    if company_id is not None:
+        count = count.where(DepartmentRollup.company_id == company_id)
+    return db.scalar(count)
+
+
+def reconcile(db: Session, company_id: Optional[int] = None) -> list[dict]:
+    """Differences between the stored rollups and the base tables, one dict per counter.
+
+    An empty list means the rollups are correct. Nothing is changed.
+    """
+    criteria = () if company_id is None else (StockItem.company_id == company_id,)
+    expected = {
+        row.department_id: row
+        for row in db.execute(
+            _totals(_contributions(db.get_bind().dialect.name, *criteria).subquery())
+        )
+    }
+    stored_stmt = select(DepartmentRollup)
+    if company_id is not None:
+        stored_stmt = stored_stmt.where(DepartmentRollup.company_id == company_id)
+    stored = {rollup.department_id: rollup for rollup in db.scalars(stored_stmt)}
+
+    mismatches = []
+    for department_id in sorted(expected.keys() | stored.keys()):
+        want, have = expected.get(department_id), stored.get(department_id)
+        for name in COUNTERS:
+            want_value = int(getattr(want, name)) if want is not None else 0
+            have_value = getattr(have, name) if have is not None else 0
+            if want_value != have_value:
+                mismatches.append({
+                    "department_id": department_id,
+                    "company_id": (want or have).company_id,
+                    "counter": name,
+                    "stored": have_value,
+                    "expected": want_value,
+                })
+    return mismatches
+
+
+def summary_stmt(company_id: int) -> Select:
+    """Every department of ``company_id`` with its rollup counters, zero when it has no items."""
+    return (
+        select(
+            Department.id.label("department_id"),
+            Department.name.label("department_name"),
+            *(func.coalesce(getattr(DepartmentRollup, name), 0).label(name) for name in COUNTERS),
+        )
+        .outerjoin(DepartmentRollup, DepartmentRollup.department_id == Department.id)
+        .where(Department.company_id == company_id)
+        .order_by(Department.id)
+    )
+
+
+def summaries(rows, now: Optional[float] = None) -> list[dict]:
+    """``summary_stmt`` rows as response dicts, with the average age in days."""
+    now = time.time() if now is None else now
+    result = []
+    for row in rows:
+        summary = row._asdict()
+        acquired_seconds = summary.pop("acquired_seconds")
+        dated_items = summary.pop("dated_items")
+        summary["average_age_days"] = (
+            round((now - acquired_seconds / dated_items) / SECONDS_PER_DAY, 1)
+            if dated_items
+            else None
+        )
+        result.append(summary)
+    return result
@@ -1,6 +1,6 @@
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Annotated, Literal, Optional, Union
 
 class StockAddRequest(BaseModel):
     name: str
@@ -53,6 +53,81 @@ class StockHistoryResponse(BaseModel):
     action: str
     reason: Optional[str] = None
     timestamp: datetime
+    quantity_delta: Optional[int] = None
+    quantity_after: Optional[int] = None
 
     class Config:
         orm_mode = True
+
+class StockSearchPage(BaseModel):
+    items: list[StockItemResponse]
+    next_offset: Optional[int] = None
+
+class AuditLogPage(BaseModel):
+    logs: list[StockHistoryResponse]
+    next_cursor: Optional[str] = None
+
+class BulkAddOp(StockAddRequest):
+    op: Literal["add"]
+
+class BulkAssignOp(StockAssignRequest):
+    op: Literal["assign"]
+
+class BulkReturnOp(StockReturnRequest):
+    op: Literal["return"]
+
+class BulkTransferOp(StockTransferRequest):
+    op: Literal["transfer"]
+
+BulkOperation = Annotated[
+    Union[BulkAddOp, BulkAssignOp, BulkReturnOp, BulkTransferOp],
+    Field(discriminator="op"),
+]
+
+class StockBulkRequest(BaseModel):
+    operations: list[BulkOperation]
+    atomic: bool = True
+
+class BulkOperationResult(BaseModel):
+    index: int
+    op: str
+    ok: bool
+    detail: str
+    stock_item_id: Optional[int] = None
+
+class StockBulkResponse(BaseModel):
+    committed: bool
+    results: list[BulkOperationResult]
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class StockImportReport(BaseModel):
+    rows: int
+    created: int
+    restocked: int
+    failed: int
+    errors: list[ImportRowError]
+
+class DepartmentSummary(BaseModel):
+    department_id: int
+    department_name: Optional[str] = None
+    total_quantity: int
+    item_count: int
+    faulty_count: int
+    below_par_count: int
+    open_assignments: int
+    average_age_days: Optional[float] = None
+
+class StockAsOfItem(BaseModel):
+    id: int
+    name: str
+    department_id: Optional[int] = None
+    quantity: int
+
+class StockAsOfResponse(BaseModel):
+    as_of: datetime
+    snapshot_taken_at: datetime
+    replayed: int
+    items: list[StockAsOfItem]
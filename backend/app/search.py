@@ -0,0 +1,102 @@
+"""``GET /stock/search``: ranked name search over a company's live items.
+
+Every word of the query must prefix-match a word of the item name, so
+"think" finds "Lenovo ThinkPad T14". Matches are found through the
+``stock_search`` FTS5 table on SQLite and the GIN index over
+``to_tsvector(name)`` on Postgres; the database maintains both on insert,
+rename and soft delete (see ``app.models``).
+
+This is prefix matching only, not typo-tolerant fuzzy matching: a
+misspelled word finds nothing. Results are ranked by relevance, with
+``bm25`` over the name column on SQLite and ``ts_rank`` on Postgres, then
+shortest name first.
+"""
+import re
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Integer, Select, column, func, literal_column, select, table
+from sqlalchemy.orm import Session
+
+from . import auth, queries, versions
+from .database import get_db
+from .models import SEARCH_CONFIG, StockItem
+from .schemas import StockSearchPage
+
+router = APIRouter(tags=["stock"])
+
+MAX_PAGE_SIZE = 200
+MAX_TERMS = 8
+_WORD = re.compile(r"\w+")
+
+_fts = table("stock_search", column("rowid", Integer))
+
+
+def terms(q: str) -> list[str]:
+    return _WORD.findall(q.lower())[:MAX_TERMS]
+
+
+def _sqlite_search(stmt: Select, company_id: int, words: list[str]) -> Select:
+    # Words are \w+ only, so they can't carry FTS5 syntax.
+    match = f'company : "c{company_id}" AND name : (' + " ".join(f'"{w}"*' for w in words) + ")"
+    fts = literal_column("stock_search")
+    # bm25 is lower for better matches; weights are (name, company).
+    return (
+        stmt.join(_fts, _fts.c.rowid == StockItem.id)
+        .where(fts.op("MATCH")(match))
+        .order_by(func.bm25(fts, 1.0, 0.0))
+    )
+
+
+def _postgres_search(stmt: Select, words: list[str]) -> Select:
+    config = literal_column(SEARCH_CONFIG)
+    vector = func.to_tsvector(config, StockItem.name)
+    query = func.to_tsquery(config, " & ".join(f"{w}:*" for w in words))
+    return stmt.where(vector.op("@@")(query)).order_by(func.ts_rank(vector, query).desc())
+
+
+def search_stmt(
+    dialect_name: str, company_id: int, q: str, department_id: int | None = None
+) -> Select | None:
+    """Matching live items in rank order, or None if ``q`` has no words."""
+    words = terms(q)
+    if not words:
+        return None
+    stmt = select(StockItem).where(
+        StockItem.company_id == company_id,
+        StockItem.is_deleted == False,
+    )
+    if department_id is not None:
+        stmt = stmt.where(StockItem.department_id == department_id)
+    if dialect_name == "sqlite":
+        stmt = _sqlite_search(stmt, company_id, words)
+    else:
+        stmt = _postgres_search(stmt, words)
+    return stmt.order_by(func.length(StockItem.name), StockItem.id)
+
+
+@router.get("/stock/search", response_model=StockSearchPage)
+def search_stock(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    department_id: int | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    tag = versions.etag(
+        request, current_user, versions.current_version(db, current_user.company_id, department_id)
+    )
+
+    def build():
+        stmt = search_stmt(db.get_bind().dialect.name, current_user.company_id, q, department_id)
+        if stmt is None:
+            return ORJSONResponse({"items": [], "next_offset": None})
+        rows = db.execute(queries.stock_item_rows(stmt).limit(limit + 1).offset(offset)).all()
+        next_offset = offset + limit if len(rows) > limit else None
+        return ORJSONResponse(
+            {"items": [row._asdict() for row in rows[:limit]], "next_offset": next_offset}
+        )
+
+    return versions.conditional(request, tag, build)
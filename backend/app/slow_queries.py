@@ -0,0 +1,185 @@
+"""Opt-in log of slow SQL statements, with their plans.
+
+Set ``SLOW_QUERY_MS`` to record every statement that takes longer than
+that. An entry holds the normalized SQL, the shape of its parameters (types
+only, never values), the duration, and the route and company of the
+request that ran it. It then gets the statement's ``EXPLAIN`` output,
+captured on a background thread over a separate connection, so the slow
+request isn't made slower. Plans are reused for the same normalized
+statement within a company.
+
+The last ``SLOW_QUERY_BUFFER`` entries are kept in memory. Plans can carry
+bound literals, so admins only see and clear their own company's entries
+at ``GET``/``DELETE /admin/slow-queries``.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+PLAN_CACHE_SIZE = 256
+_SKIP = "slow_query_skip"  # execution option set on our own EXPLAIN connections
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+entries: deque = deque(maxlen=SLOW_QUERY_BUFFER)
+_entries_lock = threading.Lock()
+_plans: OrderedDict[tuple[Optional[int], str], str] = OrderedDict()
+_plans_lock = threading.Lock()
+_explainer: Optional[ThreadPoolExecutor] = None
+# Mutable per request, so the company set by the auth dependency on a
+# worker thread is visible to statements run elsewhere in the request.
+_request: ContextVar[Optional[dict]] = ContextVar("slow_query_request", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s|\$\d+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|\$\d+)\s*\)")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize(statement: str) -> str:
+    """``statement`` with literals, placeholders and ``IN`` lists collapsed to ``?``."""
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?...)", sql)
+    return _PLACEHOLDER.sub("?", sql)
+
+
+def parameter_shape(parameters):
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def attribute(company_id: int) -> None:
+    """Tag the current request's slow statements with ``company_id``."""
+    request = _request.get()
+    if request is not None:
+        request["company_id"] = company_id
+
+
+class SlowQueryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request.set({"scope": scope, "company_id": None})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request.reset(token)
+
+
+def _route() -> tuple[Optional[str], Optional[int]]:
+    request = _request.get()
+    if request is None:
+        return None, None
+    scope = request["scope"]
+    # Routing has already put the matched route into the scope by now.
+    route = getattr(scope.get("route"), "path", scope.get("path"))
+    return f"{scope['method']} {route}", request["company_id"]
+
+
+def company_entries(company_id: int) -> list[dict]:
+    """``company_id``'s entries, newest first."""
+    with _entries_lock:
+        return [entry for entry in reversed(entries) if entry["company_id"] == company_id]
+
+
+def clear(company_id: int) -> None:
+    """Drop ``company_id``'s entries, keeping every other company's."""
+    with _entries_lock:
+        kept = [entry for entry in entries if entry["company_id"] != company_id]
+        entries.clear()
+        entries.extend(kept)
+
+
+def _explain(engine: Engine, entry: dict, statement: str, parameters) -> None:
+    # Keyed by company too: a plan may show the literals it was captured with.
+    key = (entry["company_id"], entry["sql"])
+    with _plans_lock:
+        plan = _plans.get(key)
+    if plan is None:
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            with engine.connect().execution_options(**{_SKIP: True}) as conn:
+                rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+            plan = "\n".join(str(row[-1]) for row in rows)
+        except Exception as exc:  # noqa: BLE001 - reported in the entry instead
+            entry["plan_error"] = f"{type(exc).__name__}: {exc}"
+            return
+        with _plans_lock:
+            _plans[key] = plan
+            while len(_plans) > PLAN_CACHE_SIZE:
+                _plans.popitem(last=False)
+    entry["plan"] = plan
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_started = time.perf_counter()
+
+
+def _recorder(explain_engine: Optional[Engine]):
+    threshold = SLOW_QUERY_MS / 1000
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_slow_query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < threshold or conn.get_execution_options().get(_SKIP):
+            return
+        route, company_id = _route()
+        if executemany:
+            rows, parameters = len(parameters), parameters[0] if parameters else ()
+        else:
+            rows = 1
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "duration_ms": round(elapsed * 1000, 3),
+            "sql": normalize(statement),
+            "parameters": parameter_shape(parameters),
+            "parameter_sets": rows,
+            "route": route,
+            "company_id": company_id,
+            "plan": None,
+        }
+        with _entries_lock:
+            entries.append(entry)
+        explainable = statement.lstrip()[:6].lower().startswith(_EXPLAINABLE)
+        if explain_engine is not None and _explainer is not None and explainable:
+            _explainer.submit(_explain, explain_engine, entry, statement, parameters)
+
+    return _after_cursor_execute
+
+
+def instrument(engine: Engine, explain_engine: Optional[Engine] = None) -> None:
+    """Record ``engine``'s statements slower than ``SLOW_QUERY_MS``.
+
+    Plans are captured with ``explain_engine``, which must be a sync engine
+    using the same parameter style; pass None to skip them.
+    """
+    global _explainer
+    if SLOW_QUERY_EXPLAIN and explain_engine is not None and _explainer is None:
+        _explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+    if not SLOW_QUERY_EXPLAIN:
+        explain_engine = None
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _recorder(explain_engine))
+
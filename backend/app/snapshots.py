@@ -0,0 +1,222 @@
+"""Point-in-time stock: periodic snapshots plus history replay.
+
+``stock_snapshots`` records every live item's quantity for a company at
+``taken_at``. ``GET /stock/as-of?ts=`` loads the newest snapshot at or
+before ``ts`` and replays only the history rows after it, using each
+row's ``quantity_after``, so the work is bounded by the snapshot interval
+rather than by the length of the history. Rows older than the archive
+watermark are read back from :mod:`app.history_archive`.
+
+``python manage.py snapshot-stock`` (run from cron) snapshots every company
+whose newest snapshot is older than ``SNAPSHOT_INTERVAL_DAYS``. A company's
+first snapshot copies its live items; later ones replay from the previous
+snapshot, so they agree with what ``/stock/as-of`` reports for the same
+time. App startup and ``sample_data.init_db`` take that first snapshot for
+any company without one. History rows written before quantities were
+recorded carry none and are skipped by the replay. Times before a
+company's first snapshot can't be answered.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from . import auth, history_archive, queries, versions
+from .database import get_db
+from .models import Company, StockHistory, StockItem, StockSnapshot, StockSnapshotItem
+from .schemas import StockAsOfResponse
+
+router = APIRouter(tags=["stock"])
+
+SNAPSHOT_INTERVAL_DAYS = int(os.getenv("SNAPSHOT_INTERVAL_DAYS", "7"))
+# Snapshots stop this far short of now, so transactions that stamped
+# history rows just before it have committed by the time it is taken.
+SNAPSHOT_SETTLE = timedelta(minutes=1)
+REPLAY_BATCH_SIZE = 5000
+
+
+def nearest(db: Session, company_id: int, ts: datetime) -> Optional[StockSnapshot]:
+    """The company's newest snapshot taken at or before ``ts``."""
+    return db.scalars(
+        select(StockSnapshot)
+        .where(StockSnapshot.company_id == company_id, StockSnapshot.taken_at <= ts)
+        .order_by(StockSnapshot.taken_at.desc(), StockSnapshot.id.desc())
+        .limit(1)
+    ).first()
+
+
+def _snapshot_state(db: Session, snapshot_id: int) -> dict[int, int]:
+    return dict(
+        db.execute(
+            select(StockSnapshotItem.stock_item_id, StockSnapshotItem.quantity)
+            .where(StockSnapshotItem.snapshot_id == snapshot_id)
+        ).all()
+    )
+
+
+def _history_between(
+    db: Session, company_id: int, since: datetime, until: datetime
+) -> Iterator[tuple[int, str, Optional[int]]]:
+    """``(stock_item_id, action, quantity_after)`` for rows in ``(since, until]``, oldest first."""
+    stmt = (
+        select(StockHistory.stock_item_id, StockHistory.action, StockHistory.quantity_after)
+        .where(
+            StockHistory.company_id == company_id,
+            StockHistory.timestamp > since,
+            StockHistory.timestamp <= until,
+        )
+        .order_by(StockHistory.timestamp, StockHistory.id)
+    )
+    manifest = history_archive.load_manifest(company_id)
+    if manifest.archived_before is not None and since < manifest.archived_before:
+        archived = [
+            row
+            for row in history_archive.iter_archived(manifest, after=(until, sys.maxsize), since=since)
+            if row["timestamp"] > since
+        ]
+        for row in reversed(archived):
+            yield row["stock_item_id"], row["action"], row["quantity_after"]
+        stmt = stmt.where(StockHistory.timestamp >= manifest.archived_before)
+    yield from db.execute(stmt.execution_options(yield_per=REPLAY_BATCH_SIZE)).tuples()
+
+
+def replay(state: dict[int, int], rows: Iterable[tuple[int, str, Optional[int]]]) -> int:
+    """Apply history rows to ``state`` in place; returns how many rows were read."""
+    count = 0
+    for item_id, action, quantity_after in rows:
+        count += 1
+        if action == "delete":
+            state.pop(item_id, None)
+        elif quantity_after is not None:
+            state[item_id] = quantity_after
+    return count
+
+
+def state_as_of(
+    db: Session, company_id: int, ts: datetime
+) -> Optional[tuple[StockSnapshot, dict[int, int], int]]:
+    """The snapshot used, ``{item_id: quantity}`` at ``ts`` and the rows replayed, or None."""
+    snapshot = nearest(db, company_id, ts)
+    if snapshot is None:
+        return None
+    state = _snapshot_state(db, snapshot.id)
+    replayed = replay(state, _history_between(db, company_id, snapshot.taken_at, ts))
+    return snapshot, state, replayed
+
+
+def take(db: Session, company_id: int, at: Optional[datetime] = None) -> StockSnapshot:
+    """Snapshot the company at ``at`` (default: now, less the settle time)."""
+    at = at or datetime.utcnow() - SNAPSHOT_SETTLE
+    previous = nearest(db, company_id, at)
+    if previous is None:
+        # Nothing to replay from: the baseline is the live table as it is now.
+        snapshot = StockSnapshot(company_id=company_id, taken_at=datetime.utcnow())
+        db.add(snapshot)
+        db.flush()
+        db.execute(
+            insert(StockSnapshotItem).from_select(
+                ["snapshot_id", "stock_item_id", "quantity"],
+                select(literal(snapshot.id), StockItem.id, func.coalesce(StockItem.quantity, 0))
+                .where(StockItem.company_id == company_id, StockItem.is_deleted == False),
+            )
+        )
+        return snapshot
+
+    state = _snapshot_state(db, previous.id)
+    replay(state, _history_between(db, company_id, previous.taken_at, at))
+    snapshot = StockSnapshot(company_id=company_id, taken_at=at)
+    db.add(snapshot)
+    db.flush()
+    if state:
+        db.execute(
+            insert(StockSnapshotItem),
+            [
+                {"snapshot_id": snapshot.id, "stock_item_id": item_id, "quantity": quantity}
+                for item_id, quantity in state.items()
+            ],
+        )
+    return snapshot
+
+
+def take_due(
+    db: Session, company_id: Optional[int] = None, interval_days: int = SNAPSHOT_INTERVAL_DAYS
+) -> list[StockSnapshot]:
+    """Snapshot every company (or one) whose newest snapshot is older than ``interval_days``."""
+    due_before = datetime.utcnow() - timedelta(days=interval_days)
+    newest = (
+        select(StockSnapshot.company_id, func.max(StockSnapshot.taken_at).label("taken_at"))
+        .group_by(StockSnapshot.company_id)
+        .subquery()
+    )
+    stmt = (
+        select(Company.id)
+        .outerjoin(newest, newest.c.company_id == Company.id)
+        .where((newest.c.taken_at == None) | (newest.c.taken_at < due_before))
+        .order_by(Company.id)
+    )
+    if company_id is not None:
+        stmt = stmt.where(Company.id == company_id)
+    taken = []
+    for cid in db.scalars(stmt).all():
+        taken.append(take(db, cid))
+        db.commit()
+    return taken
+
+
+def take_baselines(db: Session) -> list[StockSnapshot]:
+    """Snapshot every company that has none yet, so ``/stock/as-of`` can answer from now on."""
+    stmt = (
+        select(Company.id)
+        .where(~select(StockSnapshot.id).where(StockSnapshot.company_id == Company.id).exists())
+        .order_by(Company.id)
+    )
+    taken = []
+    for cid in db.scalars(stmt).all():
+        taken.append(take(db, cid))
+        db.commit()
+    return taken
+
+
+@router.get("/stock/as-of", response_model=StockAsOfResponse)
+def stock_as_of(
+    request: Request,
+    ts: datetime,
+    department_id: int | None = None,
+    current_user=Depends(auth.get_current_user),
+    db: Session = Depends(get_db),
+):
+    ts = queries.naive_utc(ts)
+    tag = versions.etag(
+        request, current_user, versions.current_version(db, current_user.company_id, department_id)
+    )
+
+    def build():
+        result = state_as_of(db, current_user.company_id, ts)
+        if result is None:
+            raise HTTPException(status_code=404, detail="No stock snapshot at or before this time")
+        snapshot, state, replayed = result
+        stmt = (
+            select(StockItem.id, StockItem.name, StockItem.department_id)
+            .where(StockItem.company_id == current_user.company_id)
+            .order_by(StockItem.id)
+        )
+        if department_id is not None:
+            stmt = stmt.where(StockItem.department_id == department_id)
+        items = [
+            {**row._asdict(), "quantity": state[row.id]}
+            for row in db.execute(stmt)
+            if row.id in state
+        ]
+        return ORJSONResponse({
+            "as_of": ts,
+            "snapshot_taken_at": snapshot.taken_at,
+            "replayed": replayed,
+            "items": items,
+        })
+
+    return versions.conditional(request, tag, build)
@@ -0,0 +1,63 @@
+"""``INSERT ... ON CONFLICT DO UPDATE`` statements keyed on a live item's natural key.
+
+Live stock items are unique per (company, department, name); see
+``uq_stock_items_live_name``. Restocking an existing item and creating a
+new one are therefore a single statement instead of a lookup followed by
+an UPDATE or INSERT, and concurrent restocks cannot create duplicates.
+"""
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import false, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Result
+from sqlalchemy.orm import Session
+
+from .models import StockItem
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+LIVE_NATURAL_KEY = (StockItem.company_id, StockItem.department_id, StockItem.name)
+
+
+@lru_cache(maxsize=None)
+def _restock_statement(dialect_name: str, returning: tuple):
+    # Building ``excluded`` is far costlier than running the statement, so
+    # it is built once per dialect and shape; values are bound at execute.
+    stmt = _INSERTS[dialect_name](StockItem)
+    return stmt.on_conflict_do_update(
+        index_elements=LIVE_NATURAL_KEY,
+        index_where=StockItem.is_deleted == false(),
+        set_={
+            "quantity": StockItem.quantity + stmt.excluded.quantity,
+            "par_level": func.coalesce(stmt.excluded.par_level, StockItem.par_level),
+            "version": StockItem.version + 1,
+        },
+    ).returning(*returning)
+
+
+def restock(db: Session, *returning, **values) -> Result:
+    """Add ``values["quantity"]`` to the live item, creating it from ``values`` if missing.
+
+    ``values`` must include company_id, department_id, name and quantity; a
+    non-null ``par_level`` also replaces the existing one. An inserted row
+    comes back with ``version == 1``, since every conflict update bumps it.
+    """
+    return db.execute(
+        _restock_statement(db.get_bind().dialect.name, returning),
+        values,
+        execution_options={"populate_existing": True},
+    )
+
+
+def was_inserted(version: Optional[int]) -> bool:
+    return version == 1
+
+
+def restock_many(db: Session, *returning):
+    """The :func:`restock` statement for an executemany over a list of value dicts.
+
+    Rows come back in no particular order; return the natural key to match
+    them up. A key must not repeat within one call.
+    """
+    return _restock_statement(db.get_bind().dialect.name, returning)
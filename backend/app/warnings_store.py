@@ -0,0 +1,75 @@
+"""Maintenance of the ``stock_warnings`` table.
+
+Every handler that changes an item's quantity, par level, faulty or deleted
+flag calls :func:`refresh` for the touched items before committing, so
+``/stock/warnings`` can read the current warnings without scanning
+``stock_items``. :func:`rebuild` recomputes the table from scratch and
+records a change for the departments whose warnings it corrected.
+"""
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sqlalchemy import and_, delete, false, func, insert, select
+from sqlalchemy.orm import Session
+
+from . import changes
+from .models import StockItem, StockWarning
+
+WARNING_CRITERIA = (
+    StockItem.is_deleted == False,
+    StockItem.is_faulty == False,
+    StockItem.par_level.isnot(None),
+    StockItem.quantity < StockItem.par_level,
+)
+
+
+def _insert_matching(db: Session, *criteria) -> None:
+    db.execute(
+        insert(StockWarning).from_select(
+            ["stock_item_id", "company_id"],
+            select(StockItem.id, StockItem.company_id).where(*WARNING_CRITERIA, *criteria),
+        )
+    )
+
+
+def _drifted(db: Session, *criteria) -> dict[int, set[int]]:
+    """Company id -> departments with an item whose stored warning is wrong."""
+    expected = func.coalesce(and_(*WARNING_CRITERIA), false())
+    rows = db.execute(
+        select(StockItem.company_id, StockItem.department_id)
+        .distinct()
+        .outerjoin(StockWarning, StockWarning.stock_item_id == StockItem.id)
+        .where(expected != StockWarning.stock_item_id.isnot(None), *criteria)
+    )
+    drifted = defaultdict(set)
+    for company_id, department_id in rows:
+        drifted[company_id].add(department_id)
+    return drifted
+
+
+def refresh(db: Session, item_ids: Iterable[Optional[int]]) -> None:
+    """Recompute the warning rows for ``item_ids`` inside the current transaction."""
+    db.flush()
+    ids = {item_id for item_id in item_ids if item_id is not None}
+    if not ids:
+        return
+    db.execute(delete(StockWarning).where(StockWarning.stock_item_id.in_(ids)))
+    _insert_matching(db, StockItem.id.in_(ids))
+
+
+def rebuild(db: Session, company_id: Optional[int] = None) -> int:
+    """Reconcile the table with ``stock_items``; returns the resulting row count."""
+    stmt = delete(StockWarning)
+    criteria = ()
+    if company_id is not None:
+        stmt = stmt.where(StockWarning.company_id == company_id)
+        criteria = (StockItem.company_id == company_id,)
+    drifted = _drifted(db, *criteria)
+    db.execute(stmt)
+    _insert_matching(db, *criteria)
+    for drifted_company_id, department_ids in drifted.items():
+        changes.record(db, drifted_company_id, "rebuild-warnings", department_ids=department_ids)
+    count = select(func.count()).select_from(StockWarning)
+    if company_id is not None:
+        count = count.where(StockWarning.company_id == company_id)
+    return db.scalar(count)
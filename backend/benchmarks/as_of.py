@@ -0,0 +1,90 @@
+"""``/stock/as-of`` from the nearest snapshot vs. replaying the whole history.
+
+    python -m benchmarks.as_of [--scale medium] [--snapshot-days 30] [--repeat 20]
+
+Generates a ``--scale`` dataset with :func:`sample_data.generate`, then
+times ``GET /stock/as-of`` for random times in the largest company. "full"
+is the same reconstruction replayed from the company's first snapshot,
+i.e. roughly the cost without periodic snapshots, which grows with the
+length of the history instead of the snapshot interval.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from .common import PASSWORD, seed_synthetic, summarize, temp_database_url
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", default="medium")
+    parser.add_argument("--snapshot-days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    os.environ["DATABASE_URL"] = url
+    started = time.perf_counter()
+    generated = seed_synthetic(url, args.scale, snapshot_days=args.snapshot_days)
+    print(f"generated {generated.rows['stock_history']} history rows in {time.perf_counter() - started:.0f}s")
+
+    from fastapi.testclient import TestClient
+
+    from app import snapshots
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import StockHistory, StockSnapshot
+
+    with SessionLocal() as db:
+        company_id, history_rows = db.execute(
+            select(StockHistory.company_id, func.count())
+            .group_by(StockHistory.company_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        ).one()
+        first, last = db.execute(
+            select(func.min(StockSnapshot.taken_at), func.max(StockSnapshot.taken_at))
+            .where(StockSnapshot.company_id == company_id)
+        ).one()
+        baseline = snapshots.nearest(db, company_id, first)
+    print(f"company {company_id}: {history_rows} history rows")
+
+    rng = random.Random(0)
+    span = (last - first).total_seconds()
+    times = [first + timedelta(seconds=rng.random() * span) for _ in range(args.repeat)]
+    with TestClient(app) as client:
+        username = generated.usernames[company_id]["warehouse"]
+        token = client.post(
+            "/token", data={"username": username, "password": PASSWORD}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        latencies, replayed = [], 0
+        for ts in times:
+            start = time.perf_counter()
+            response = client.get("/stock/as-of", params={"ts": ts.isoformat()}, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            replayed += response.json()["replayed"]
+        nearest = summarize(latencies, sum(latencies))
+
+    latencies, full_replayed = [], 0
+    with SessionLocal() as db:
+        for ts in times[: max(args.repeat // 4, 3)]:
+            start = time.perf_counter()
+            state = snapshots._snapshot_state(db, baseline.id)
+            full_replayed += snapshots.replay(
+                state, snapshots._history_between(db, company_id, baseline.taken_at, ts)
+            )
+            latencies.append(time.perf_counter() - start)
+    full = summarize(latencies, sum(latencies))
+
+    print(f"{'':<10}{'rows/query':>12}{'p50 ms':>9}{'p95 ms':>9}")
+    print(f"{'nearest':<10}{replayed // len(times):>12}{nearest['p50_ms']:>9}{nearest['p95_ms']:>9}")
+    print(f"{'full':<10}{full_replayed // max(args.repeat // 4, 3):>12}{full['p50_ms']:>9}{full['p95_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
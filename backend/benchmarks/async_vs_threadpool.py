@@ -0,0 +1,79 @@
+"""Compare read throughput of the sync (threadpool) and async endpoint paths.
+
+    python -m benchmarks.async_vs_threadpool [--requests 2000] [--concurrency 16 64 256]
+
+Each mode runs in its own interpreter because USE_ASYNC_DB is read at import.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from .common import USERNAME, run_child, seed, summarize, temp_database_url
+
+ENDPOINTS = ["/stock", "/stock/warnings", "/my-equipment", "/stock/history/1"]
+
+
+async def _drive(requests: int, concurrency: int) -> dict:
+    import httpx
+
+    from app.auth import create_access_token
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': USERNAME})}"}
+    transport = httpx.ASGITransport(app=app)
+    paths = itertools.cycle(ENDPOINTS)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(path: str):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=headers)
+                    response.raise_for_status()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        await client.get("/stock", headers=headers)  # warm up caches and pools
+        started = time.perf_counter()
+        await asyncio.gather(*(one(next(paths)) for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return {**summarize(latencies, elapsed), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_drive(args.requests, args.concurrency[0]))))
+        return
+
+    url = temp_database_url()
+    seed(url, items=args.items)
+    print(f"{'mode':<8}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for concurrency, mode in itertools.product(args.concurrency, ("sync", "async")):
+        env = {"DATABASE_URL": url, "USE_ASYNC_DB": "1" if mode == "async" else "0"}
+        out = run_child(
+            "benchmarks.async_vs_threadpool", env, "--child",
+            "--requests", str(args.requests), "--concurrency", str(concurrency),
+        )
+        result = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{mode:<8}{concurrency:>6}{result['throughput_rps']:>10}"
+            f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['errors']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
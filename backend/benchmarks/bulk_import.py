@@ -0,0 +1,106 @@
+"""CSV bulk import vs. one ``/stock/add`` request per row.
+
+    python -m benchmarks.bulk_import [--rows 20000] [--existing 0.3]
+
+Builds a CSV where ``--existing`` of the rows restock seeded items and the
+rest create new ones, then loads it through ``POST /stock/import`` and,
+on a fresh database, the same rows through ``POST /stock/add``. Reports
+rows per second and statements per row for each.
+"""
+import argparse
+import io
+import os
+import random
+import time
+
+from sqlalchemy import event
+
+from .common import PASSWORD, USERNAME, seed, temp_database_url
+
+
+def _csv(rows: int, existing: float, items: int) -> str:
+    rng = random.Random(18)
+    out = io.StringIO()
+    out.write("name,quantity,department,par_level\n")
+    for i in range(rows):
+        if rng.random() < existing:
+            n = rng.randrange(items)
+            name, department = f"Item {n}", f"Dept {n % 5}"
+        else:
+            name, department = f"Imported {i}", f"Dept {rng.randrange(5)}"
+        par_level = rng.choice(("", "5", "10"))
+        out.write(f"{name},{rng.randint(1, 50)},{department},{par_level}\n")
+    return out.getvalue()
+
+
+def _per_row(client, headers, body: str) -> None:
+    from app.database import SessionLocal
+    from app.models import Department
+
+    with SessionLocal() as db:
+        departments = {d.name: d.id for d in db.query(Department)}
+    lines = body.splitlines()[1:]
+    for line in lines:
+        name, quantity, department, par_level = line.split(",")
+        payload = {
+            "name": name,
+            "quantity": int(quantity),
+            "department_id": departments[department],
+            "par_level": int(par_level) if par_level else None,
+        }
+        client.post("/stock/add", json=payload, headers=headers).raise_for_status()
+
+
+def _bulk(client, headers, body: str) -> None:
+    response = client.post(
+        "/stock/import", files={"file": ("stock.csv", body, "text/csv")}, headers=headers
+    )
+    response.raise_for_status()
+    assert response.json()["failed"] == 0, response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--existing", type=float, default=0.3)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    os.environ["DATABASE_URL"] = url
+    seed(url, items=args.items, assignments=0, history=0)
+
+    from fastapi.testclient import TestClient
+
+    from app.database import engine
+    from app.main import app
+
+    body = _csv(args.rows, args.existing, args.items)
+    print(f"{args.rows} rows, {args.existing:.0%} restocking existing items")
+    print(f"{'path':<10}{'rows/s':>10}{'seconds':>10}{'stmts/row':>11}")
+    for path in (_bulk, _per_row):
+        seed(url, items=args.items, assignments=0, history=0)
+        statements = 0
+
+        def count(*_):
+            nonlocal statements
+            statements += 1
+
+        with TestClient(app) as client:
+            token = client.post(
+                "/token", data={"username": USERNAME, "password": PASSWORD}
+            ).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            event.listen(engine, "before_cursor_execute", count)
+            started = time.perf_counter()
+            path(client, headers, body)
+            elapsed = time.perf_counter() - started
+            event.remove(engine, "before_cursor_execute", count)
+        print(
+            f"{path.__name__.strip('_'):<10}{args.rows / elapsed:>10.0f}"
+            f"{elapsed:>10.2f}{statements / args.rows:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
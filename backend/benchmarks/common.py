@@ -0,0 +1,154 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks are run from the backend directory, e.g.
+``python -m benchmarks.async_vs_threadpool``. They create their own
+throwaway SQLite database unless ``DATABASE_URL`` points elsewhere.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+def temp_database_url() -> str:
+    if os.getenv("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    fd, path = tempfile.mkstemp(prefix="stock-bench-", suffix=".db")
+    os.close(fd)
+    return f"sqlite:///{path}"
+
+
+def seed(url: str, items: int = 1000, assignments: int = 50, history: int = 5000) -> None:
+    """Create one company with a warehouse user, items, assignments and history."""
+    from app import rollups, snapshots, warnings_store
+    from app.auth import get_password_hash
+    from app.models import (
+        Assignment, Base, Company, Department, Role, StockHistory, StockItem, User,
+    )
+
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with Session(engine) as db:
+        company = Company(name="BenchCorp")
+        db.add(company)
+        db.flush()
+        departments = [Department(name=f"Dept {i}", company_id=company.id) for i in range(5)]
+        roles = {n: Role(name=n, company_id=company.id) for n in ("admin", "warehouse")}
+        db.add_all([*departments, *roles.values()])
+        db.flush()
+        user = User(
+            username=USERNAME,
+            hashed_password=get_password_hash(PASSWORD),
+            role_id=roles["warehouse"].id,
+            department_id=departments[0].id,
+            company_id=company.id,
+        )
+        admin = User(
+            username="bench-admin",
+            hashed_password=get_password_hash(PASSWORD),
+            role_id=roles["admin"].id,
+            department_id=departments[0].id,
+            company_id=company.id,
+        )
+        db.add_all([user, admin])
+        db.flush()
+        db.execute(insert(StockItem), [
+            {
+                "name": f"Item {i}",
+                "quantity": i % 20,
+                "par_level": 10 if i % 3 == 0 else None,
+                "department_id": departments[i % len(departments)].id,
+                "company_id": company.id,
+                "is_faulty": i % 50 == 0,
+                "is_deleted": False,
+                "acquired_at": now - timedelta(days=i % 1000),
+                "created_at": now,
+            }
+            for i in range(items)
+        ])
+        db.execute(insert(Assignment), [
+            {
+                "stock_item_id": 1 + i % items,
+                "assignee_user_id": user.id,
+                "assigned_by_id": user.id,
+                "assigned_at": now,
+                "company_id": company.id,
+            }
+            for i in range(assignments)
+        ])
+        db.execute(insert(StockHistory), [
+            {
+                "stock_item_id": 1 + i % items,
+                "user_id": user.id,
+                "action": "add",
+                "timestamp": now - timedelta(minutes=i),
+                "company_id": company.id,
+            }
+            for i in range(history)
+        ])
+        warnings_store.rebuild(db, company.id)
+        rollups.rebuild(db, company.id)
+        snapshots.take(db, company.id)
+        db.commit()
+    engine.dispose()
+
+
+def seed_synthetic(url: str, scale: str = "small", seed: int = 0, anchor=None, **overrides):
+    """Fill a fresh database with :func:`sample_data.generate` at a preset ``scale``.
+
+    Every user's password is :data:`PASSWORD`; the result's ``usernames``
+    map each company to one user per role.
+    """
+    from dataclasses import replace
+
+    import sample_data
+    from app.models import Base
+
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    try:
+        return sample_data.generate(
+            replace(sample_data.SCALES[scale], **overrides), seed, anchor, PASSWORD, engine
+        )
+    finally:
+        engine.dispose()
+
+
+def run_child(module: str, env: dict, *args: str) -> str:
+    """Run ``module`` in a fresh interpreter so import-time settings apply."""
+    result = subprocess.run(
+        [sys.executable, "-m", module, *args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+        "p50_ms": round(pct(0.50), 2),
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+    }
@@ -0,0 +1,114 @@
+"""Mixed read/write throughput under each engine profile (see DB_PROFILE).
+
+    python -m benchmarks.engine_profiles [--requests 3000] [--concurrency 16 64] [--write-ratio 0.2]
+
+Reads hit the list endpoints; writes restock and assign random items. Each
+profile gets a freshly seeded database, since SQLite's journal mode is a
+property of the file. Pool statistics come from ``database.pool_stats``.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from .common import USERNAME, run_child, seed, summarize, temp_database_url
+
+READS = ["/stock", "/stock/warnings", "/my-equipment", "/stock?department_id=2"]
+
+
+async def _drive(requests: int, concurrency: int, write_ratio: float, items: int) -> dict:
+    import httpx
+
+    from app.auth import create_access_token
+    from app.database import pool_stats
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': USERNAME})}"}
+    transport = httpx.ASGITransport(app=app)
+    rng = random.Random(11)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: dict[str, list[float]] = {"read": [], "write": []}
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(kind: str):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    if kind == "read":
+                        response = await client.get(rng.choice(READS), headers=headers)
+                    elif rng.random() < 0.5:
+                        response = await client.post("/stock/add", headers=headers, json={
+                            "name": f"Item {rng.randrange(items)}", "quantity": 1,
+                            "department_id": 1 + rng.randrange(5),
+                        })
+                    else:
+                        response = await client.post("/stock/assign", headers=headers, json={
+                            "stock_item_id": 1 + rng.randrange(items), "assignee_user_id": 1,
+                        })
+                    # 400 is a legitimate "Item not available" answer.
+                    if response.status_code >= 500:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies[kind].append(time.perf_counter() - start)
+
+        await client.get("/stock", headers=headers)
+        kinds = ["write" if rng.random() < write_ratio else "read" for _ in range(requests)]
+        started = time.perf_counter()
+        await asyncio.gather(*(one(kind) for kind in kinds))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "all": summarize(latencies["read"] + latencies["write"], elapsed),
+        "read": summarize(latencies["read"], elapsed),
+        "write": summarize(latencies["write"], elapsed),
+        "errors": errors,
+        "pool": pool_stats()["sync"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--profiles", nargs="+", default=["defaults", "tuned"])
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = asyncio.run(
+            _drive(args.requests, args.concurrency[0], args.write_ratio, args.items)
+        )
+        print(json.dumps(result))
+        return
+
+    print(
+        f"{'profile':<10}{'conc':>6}{'rps':>9}{'read p99':>10}{'write p99':>11}"
+        f"{'errors':>8}{'pool wait max ms':>18}{'timeouts':>10}"
+    )
+    for profile, concurrency in itertools.product(args.profiles, args.concurrency):
+        url = temp_database_url()
+        seed(url, items=args.items)
+        out = run_child(
+            "benchmarks.engine_profiles",
+            {"DATABASE_URL": url, "DB_PROFILE": profile, "USE_ASYNC_DB": "0"},
+            "--child", "--requests", str(args.requests), "--concurrency", str(concurrency),
+            "--write-ratio", str(args.write_ratio), "--items", str(args.items),
+        )
+        result = json.loads(out.strip().splitlines()[-1])
+        pool = result["pool"]
+        print(
+            f"{profile:<10}{concurrency:>6}{result['all']['throughput_rps']:>9}"
+            f"{result['read']['p99_ms']:>10}{result['write']['p99_ms']:>11}"
+            f"{result['errors']:>8}{pool['wait_ms_max']:>18}{pool['timeouts']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
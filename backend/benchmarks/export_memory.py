@@ -0,0 +1,141 @@
+"""Export a large synthetic history table and check peak RSS stays bounded.
+
+    python -m benchmarks.export_memory [--rows 2000000] [--format csv] [--gzip] [--max-rss-mb 150]
+
+The export runs in a child interpreter that drives the ASGI app directly
+and discards the body as it streams, so the child's RSS reflects the
+server side alone. RSS is sampled as each chunk is sent. It counts
+anonymous memory only: with the tuned SQLite profile the database file is
+mmapped, and its page-cache pages would otherwise show up as RSS. The
+tuned profile's 64 MB SQLite page cache does count, and fills during large
+exports; run with ``DB_PROFILE=defaults`` to see the export's own
+footprint. Exits non-zero if the peak exceeds ``--max-rss-mb``.
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+from .common import run_child, seed, temp_database_url
+
+INSERT_BATCH = 50_000
+
+
+def _fill_history(url: str, rows: int) -> None:
+    from app.models import StockHistory
+
+    engine = create_engine(url)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(0, rows, INSERT_BATCH):
+            conn.execute(insert(StockHistory), [
+                {
+                    "stock_item_id": 1 + i % 1000,
+                    "user_id": 1,
+                    "action": ("add", "assign", "return", "transfer")[i % 4],
+                    "reason": "synthetic" if i % 7 == 0 else None,
+                    "timestamp": now - timedelta(seconds=i),
+                    "company_id": 1,
+                }
+                for i in range(start, min(start + INSERT_BATCH, rows))
+            ])
+    engine.dispose()
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Not Linux: fall back to the (file-inclusive) peak.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _export(path: str) -> dict:
+    from app.auth import create_access_token
+    from app.main import app
+
+    token = create_access_token({"sub": "bench-admin"})
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "server": ("bench", 80), "client": ("bench", 1), "root_path": "",
+        "path": path.split("?")[0], "raw_path": path.split("?")[0].encode(),
+        "query_string": path.partition("?")[2].encode(),
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    }
+    received = {"bytes": 0, "chunks": 0, "status": None, "peak_rss_mb": 0.0}
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Starlette listens for a disconnect while streaming; never send one.
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            received["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            received["bytes"] += len(message.get("body", b""))
+            received["chunks"] += 1
+            received["peak_rss_mb"] = max(received["peak_rss_mb"], round(_rss_mb(), 1))
+
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    done.set()
+    return {
+        **received,
+        "seconds": round(time.perf_counter() - started, 2),
+        "baseline_rss_mb": round(baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--max-rss-mb", type=float, default=150)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_export(args.child))))
+        return
+
+    url = temp_database_url()
+    seed(url, items=1000, assignments=0, history=0)
+    started = time.perf_counter()
+    _fill_history(url, args.rows)
+    print(f"seeded {args.rows} history rows in {time.perf_counter() - started:.1f}s")
+
+    path = f"/export/history?format={args.format}&gzip={str(args.gzip).lower()}"
+    out = run_child("benchmarks.export_memory", {"DATABASE_URL": url}, "--child", path)
+    result = json.loads(out.strip().splitlines()[-1])
+    print(
+        f"{path}: status {result['status']}, {result['bytes'] / 1e6:.1f} MB in "
+        f"{result['chunks']} chunks, {result['seconds']}s"
+    )
+    print(
+        f"RSS: {result['baseline_rss_mb']} MB before export, peak {result['peak_rss_mb']} MB "
+        f"(ceiling {args.max_rss_mb} MB)"
+    )
+    ok = result["status"] == 200 and result["peak_rss_mb"] <= args.max_rss_mb
+    print("within ceiling" if ok else "CEILING EXCEEDED")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
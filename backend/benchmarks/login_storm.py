@@ -0,0 +1,111 @@
+"""Latency of ordinary requests while a burst of logins arrives.
+
+    python -m benchmarks.login_storm [--logins 400] [--readers 8] [--seconds 2]
+
+A fixed set of readers polls the list endpoints throughout. After a quiet
+baseline period, ``--logins`` concurrent ``/token`` requests arrive at once.
+The script compares the readers' p99 before and during the burst in two
+modes: "threadpool" verifies hashes on the shared request threadpool with
+no admission limit (the old behaviour), and "process" uses the dedicated
+verifier pool with its admission queue.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from .common import PASSWORD, USERNAME, run_child, seed, summarize, temp_database_url
+
+READS = ["/stock/warnings", "/my-equipment", "/stock?department_id=2"]
+MODES = {
+    "threadpool": {"HASH_WORKERS": "0", "HASH_QUEUE_SIZE": "1000000"},
+    "process": {},
+}
+
+
+async def _drive(logins: int, readers: int, seconds: float) -> dict:
+    import httpx
+
+    from app.auth import create_access_token
+    from app.hashing import verifier
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': USERNAME})}"}
+    transport = httpx.ASGITransport(app=app)
+    phase = "baseline"
+    reads: dict[str, list[float]] = {"baseline": [], "burst": []}
+    login_latencies: list[float] = []
+    outcomes: Counter = Counter()
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def reader(n: int):
+            i = n
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get(READS[i % len(READS)], headers=headers)
+                reads[phase].append(time.perf_counter() - start)
+                i += 1
+
+        async def login():
+            start = time.perf_counter()
+            response = await client.post(
+                "/token", data={"username": USERNAME, "password": PASSWORD}
+            )
+            login_latencies.append(time.perf_counter() - start)
+            outcomes[response.status_code] += 1
+
+        verifier.start()
+        await login()  # warm up the worker processes
+        tasks = [asyncio.create_task(reader(n)) for n in range(readers)]
+        await asyncio.sleep(seconds)
+        phase = "burst"
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        burst_elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*tasks)
+        verifier.shutdown()
+
+    return {
+        "baseline": summarize(reads["baseline"], seconds),
+        "burst": summarize(reads["burst"], burst_elapsed),
+        "logins": summarize(login_latencies, burst_elapsed),
+        "outcomes": {str(code): n for code, n in sorted(outcomes.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_drive(args.logins, args.readers, args.seconds))))
+        return
+
+    url = temp_database_url()
+    seed(url)
+    print(
+        f"{'mode':<12}{'read p99 before':>16}{'read p99 during':>16}"
+        f"{'login p50':>11}{'login p99':>11}  login statuses"
+    )
+    for mode, env in MODES.items():
+        out = run_child(
+            "benchmarks.login_storm", {"DATABASE_URL": url, **env}, "--child",
+            "--logins", str(args.logins), "--readers", str(args.readers),
+            "--seconds", str(args.seconds),
+        )
+        result = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{mode:<12}{result['baseline']['p99_ms']:>16}{result['burst']['p99_ms']:>16}"
+            f"{result['logins']['p50_ms']:>11}{result['logins']['p99_ms']:>11}  {result['outcomes']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
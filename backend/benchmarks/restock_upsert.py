@@ -0,0 +1,132 @@
+"""Repeated restocks of existing items: lookup-then-write vs. one upsert.
+
+    python -m benchmarks.restock_upsert [--restocks 5000] [--threads 16]
+
+"lookup" is the ORM read-modify-write ``add_stock`` used before the live
+natural key became unique; "upsert" is :func:`app.upserts.restock`. Each
+restock is its own transaction, like a request. Afterwards a burst of
+concurrent restocks of a brand-new name checks that only one live row is
+created.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event, func, select
+
+from .common import seed, summarize, temp_database_url
+
+
+def _lookup_restock(db, company_id, department_id, name, quantity):
+    from app.models import StockItem
+
+    item = db.scalars(
+        select(StockItem).where(
+            StockItem.company_id == company_id,
+            StockItem.department_id == department_id,
+            StockItem.name == name,
+            StockItem.is_deleted == False,
+        )
+    ).first()
+    if item:
+        item.quantity += quantity
+    else:
+        db.add(StockItem(
+            name=name, quantity=quantity, department_id=department_id, company_id=company_id,
+        ))
+    db.flush()
+
+
+def _upsert_restock(db, company_id, department_id, name, quantity):
+    from app import upserts
+    from app.models import StockItem
+
+    upserts.restock(
+        db, StockItem.id,
+        company_id=company_id, department_id=department_id, name=name, quantity=quantity,
+    ).one()
+
+
+def _run(strategy, targets, engine, session_factory) -> None:
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    latencies = []
+    started = time.perf_counter()
+    for company_id, department_id, name in targets:
+        start = time.perf_counter()
+        with session_factory() as db:
+            strategy(db, company_id, department_id, name, 1)
+            db.commit()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    event.remove(engine, "before_cursor_execute", count)
+    stats = summarize(latencies, elapsed)
+    print(
+        f"{strategy.__name__.strip('_').split('_')[0]:<8}{stats['throughput_rps']:>10}"
+        f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}{statements / len(targets):>8.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--restocks", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    os.environ["DATABASE_URL"] = url
+    seed(url, items=args.items, assignments=0, history=0)
+
+    from app.database import SessionLocal, engine
+    from app.models import StockItem
+
+    with SessionLocal() as db:
+        keys = db.execute(
+            select(StockItem.company_id, StockItem.department_id, StockItem.name)
+        ).all()
+    rng = random.Random(3)
+    targets = [tuple(rng.choice(keys)) for _ in range(args.restocks)]
+
+    print(f"{args.restocks} restocks of existing items")
+    print(f"{'path':<8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'stmts':>8}")
+    for strategy in (_lookup_restock, _upsert_restock):
+        _run(strategy, targets, engine, SessionLocal)
+
+    company_id, department_id, _ = keys[0]
+    errors = []
+
+    def restock_new():
+        try:
+            with SessionLocal() as db:
+                _upsert_restock(db, company_id, department_id, "Brand new item", 1)
+                db.commit()
+        except Exception as exc:  # noqa: BLE001 - reported below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=restock_new) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with SessionLocal() as db:
+        rows, quantity = db.execute(
+            select(func.count(StockItem.id), func.sum(StockItem.quantity)).where(
+                StockItem.name == "Brand new item", StockItem.is_deleted == False
+            )
+        ).one()
+    print(
+        f"{args.threads} concurrent restocks of a new name -> {rows} live row(s), "
+        f"quantity {quantity}, {len(errors)} errors"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""``/stock/search`` over a large synthetic dataset vs. scanning names with LIKE.
+
+    python -m benchmarks.search [--items 1000000] [--companies 20] [--repeat 30]
+
+Generates ``--items`` items with :func:`sample_data.generate` (no history),
+then times the first page of ``GET /stock/search`` for a mix of common,
+prefix, narrow and missing terms in the largest company. "like" is the
+same company-scoped lookup as a ``name LIKE '%term%'`` scan over all
+matches (ranking needs every one), i.e. roughly what the database would do
+without the text index.
+"""
+import argparse
+import os
+import time
+
+from sqlalchemy import func, select
+
+from .common import PASSWORD, seed_synthetic, summarize, temp_database_url
+
+QUERIES = ("laptop", "lap", "monitor 12", "dock 4711", "zebra")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    os.environ["DATABASE_URL"] = url
+    started = time.perf_counter()
+    generated = seed_synthetic(
+        url, "large", companies=args.companies, items=args.items,
+        users=args.companies * 10, assignments=0, history=0,
+    )
+    print(f"generated {args.items} items in {time.perf_counter() - started:.0f}s")
+
+    from fastapi.testclient import TestClient
+
+    from app import search
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.models import StockItem
+
+    with SessionLocal() as db:
+        company_id, company_items = db.execute(
+            select(StockItem.company_id, func.count())
+            .group_by(StockItem.company_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        ).one()
+    print(f"company {company_id}: {company_items} items")
+    print(f"{'query':<12}{'matches':>9}{'p50 ms':>9}{'p95 ms':>9}{'like p50':>10}")
+
+    with TestClient(app) as client:
+        username = generated.usernames[company_id]["warehouse"]
+        token = client.post(
+            "/token", data={"username": username, "password": PASSWORD}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for q in QUERIES:
+            with SessionLocal() as db:
+                stmt = search.search_stmt(engine.dialect.name, company_id, q)
+                matches = db.scalar(select(func.count()).select_from(stmt.subquery()))
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                client.get("/stock/search", params={"q": q}, headers=headers).raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            indexed = summarize(latencies, sum(latencies))
+
+            like = select(StockItem.id).where(
+                StockItem.company_id == company_id,
+                StockItem.is_deleted == False,
+                StockItem.name.ilike(f"%{q}%"),
+            )
+            latencies = []
+            with SessionLocal() as db:
+                for _ in range(max(args.repeat // 5, 3)):
+                    start = time.perf_counter()
+                    db.execute(like).all()
+                    latencies.append(time.perf_counter() - start)
+            scan = summarize(latencies, sum(latencies))
+            print(
+                f"{q:<12}{matches:>9}{indexed['p50_ms']:>9}{indexed['p95_ms']:>9}{scan['p50_ms']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Per-row cost of the ORM + pydantic list path versus the column/orjson path.
+
+    python -m benchmarks.serialization [--items 20000] [--repeat 5]
+
+Both paths run the same /stock query. The script checks that they produce
+identical JSON before timing them.
+"""
+import argparse
+import json
+import time
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import queries
+from app.schemas import StockItemResponse
+
+from .common import seed, temp_database_url
+
+
+def orm_path(db: Session, stmt) -> bytes:
+    items = db.scalars(stmt).all()
+    adapter = TypeAdapter(list[StockItemResponse])
+    return adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+
+def fast_path(db: Session, stmt) -> bytes:
+    return orjson.dumps([row._asdict() for row in db.execute(queries.stock_item_rows(stmt))])
+
+
+def best_of(repeat: int, fn, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    seed(url, items=args.items, assignments=0, history=0)
+    engine = create_engine(url)
+    with Session(engine) as db:
+        stmt = queries.stock_items(company_id=1)
+        if json.loads(orm_path(db, stmt)) != json.loads(fast_path(db, stmt)):
+            raise SystemExit("fast path output differs from the ORM path")
+        db.expunge_all()
+        timings = {}
+        for name, fn in (("orm+pydantic", orm_path), ("columns+orjson", fast_path)):
+            timings[name] = best_of(args.repeat, lambda: (fn(db, stmt), db.expunge_all()))
+    for name, seconds in timings.items():
+        print(f"{name:<16}{seconds * 1000:>10.1f} ms{seconds / args.items * 1e6:>10.2f} us/row")
+    print(f"speedup: {timings['orm+pydantic'] / timings['columns+orjson']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
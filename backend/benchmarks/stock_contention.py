@@ -0,0 +1,149 @@
+"""Concurrent assign/transfer/return against a single hot item.
+
+    python -m benchmarks.stock_contention [--stock 100] [--requests 400] [--concurrency 32]
+
+Every request competes for the same row. Afterwards the script checks that
+stock was neither lost nor oversold: the item's quantity must equal what it
+started with, minus successful assigns and transferred units, plus returns,
+and must never drop below zero, and no assignment may be returned twice. Exits non-zero if an invariant is broken.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import func, insert, select, update
+
+from .common import USERNAME, seed, summarize, temp_database_url
+
+HOT_ITEM_ID = 2  # "Item 1", seeded into department 2
+TRANSFER_TO = 3
+PREASSIGNED = 40
+
+
+async def _drive(stock: int, requests: int, concurrency: int, rng: random.Random) -> dict:
+    import httpx
+
+    from app.auth import create_access_token
+    from app.database import SessionLocal
+    from app.main import app
+    from app.models import Assignment, StockItem, User
+
+    with SessionLocal() as db:
+        db.execute(
+            update(StockItem)
+            .where(StockItem.id == HOT_ITEM_ID)
+            .values(quantity=stock, is_faulty=False)
+        )
+        user = db.execute(select(User.id, User.company_id).where(User.username == USERNAME)).one()
+        user_id = user.id
+        # Open assignments to return; each one is returned twice concurrently
+        # below, and only one of the two may succeed.
+        assignment_ids = list(db.scalars(
+            insert(Assignment).returning(Assignment.id),
+            [
+                {"stock_item_id": HOT_ITEM_ID, "assignee_user_id": user_id,
+                 "assigned_by_id": user_id, "company_id": user.company_id}
+                for _ in range(PREASSIGNED)
+            ],
+        ))
+        db.commit()
+        open_before = db.scalar(
+            select(func.count(Assignment.id)).where(
+                Assignment.stock_item_id == HOT_ITEM_ID, Assignment.returned_at.is_(None)
+            )
+        )
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': USERNAME})}"}
+    transport = httpx.ASGITransport(app=app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    outcomes: Counter = Counter()
+    moved = 0
+    returns = iter(assignment_ids * 2)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(kind: str):
+            nonlocal moved
+            async with semaphore:
+                if kind == "assign":
+                    path, body = "/stock/assign", {
+                        "stock_item_id": HOT_ITEM_ID, "assignee_user_id": user_id,
+                    }
+                elif kind == "transfer":
+                    path, body = "/stock/transfer", {
+                        "stock_item_id": HOT_ITEM_ID, "to_department_id": TRANSFER_TO, "quantity": 2,
+                    }
+                else:
+                    path, body = "/stock/return", {"assignment_id": next(returns)}
+                start = time.perf_counter()
+                response = await client.post(path, json=body, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                outcomes[(kind, response.status_code)] += 1
+                if response.status_code == 200 and kind == "transfer":
+                    moved += 2
+
+        kinds = rng.choices(["assign", "transfer"], weights=[3, 1], k=requests - 2 * PREASSIGNED)
+        kinds += ["return"] * (2 * PREASSIGNED)
+        rng.shuffle(kinds)
+        started = time.perf_counter()
+        await asyncio.gather(*(one(kind) for kind in kinds))
+        elapsed = time.perf_counter() - started
+
+    with SessionLocal() as db:
+        final = db.scalar(select(StockItem.quantity).where(StockItem.id == HOT_ITEM_ID))
+        open_after = db.scalar(
+            select(func.count(Assignment.id)).where(
+                Assignment.stock_item_id == HOT_ITEM_ID, Assignment.returned_at.is_(None)
+            )
+        )
+    assigned = outcomes[("assign", 200)]
+    returned = outcomes[("return", 200)]
+    return {
+        "stats": summarize(latencies, elapsed),
+        "outcomes": {f"{k} {code}": n for (k, code), n in sorted(outcomes.items())},
+        "expected": stock - assigned - moved + returned,
+        "final": final,
+        "open_assignments_delta": open_after - open_before,
+        "net_assigned": assigned - returned,
+        "double_returns": returned - PREASSIGNED,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    url = temp_database_url()
+    # Set before anything imports app.database, which reads it at import.
+    os.environ["DATABASE_URL"] = url
+    seed(url, items=50, assignments=0, history=0)
+    result = asyncio.run(
+        _drive(args.stock, args.requests, args.concurrency, random.Random(args.seed))
+    )
+
+    stats = result["stats"]
+    print(f"{stats['requests']} requests at concurrency {args.concurrency}: "
+          f"{stats['throughput_rps']} rps, p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms")
+    for outcome, count in result["outcomes"].items():
+        print(f"  {outcome}: {count}")
+    print(f"quantity: expected {result['expected']}, final {result['final']}")
+    ok = (
+        result["final"] == result["expected"]
+        and result["final"] >= 0
+        and result["open_assignments_delta"] == result["net_assigned"]
+        and result["double_returns"] == 0
+    )
+    print("invariants hold" if ok else "INVARIANT VIOLATED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""End-to-end latency and throughput of the API, per endpoint.
+
+    python -m benchmarks.suite run [--sizes small medium] [--concurrency 1 16 64]
+                                   [--requests 500] [--output results.json]
+    python -m benchmarks.suite compare BASELINE.json CANDIDATE.json [--threshold 0.1]
+
+``run`` generates a synthetic dataset per size (see ``sample_data.SCALES``),
+then, for each concurrency level, drives the app in a fresh interpreter
+through an in-process ASGI client: logins, ``/stock`` with each filter,
+warnings, equipment, item history, audit queries and an assign / return /
+transfer write mix. Requests act as the warehouse and admin users of the
+company with the most items. Results, with the settings they were taken
+under, are written as JSON.
+
+``compare`` matches two result files by size, concurrency and scenario and
+flags scenarios whose throughput dropped or p95 latency rose by more than
+``--threshold``; it exits non-zero if any did. Environment settings such
+as ``DB_PROFILE`` or ``USE_ASYNC_DB`` are passed through to the app.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import date, datetime
+
+import sample_data
+
+from .common import BACKEND_DIR, PASSWORD, run_child, seed_synthetic, summarize
+
+# Name -> (method, path template); the templates are filled from ``_Targets``.
+SCENARIOS = {
+    "login": ("POST", "/token"),
+    "stock": ("GET", "/stock"),
+    "stock_department": ("GET", "/stock?department_id={department_id}"),
+    "stock_below_par": ("GET", "/stock?below_par=true"),
+    "stock_older_than": ("GET", "/stock?older_than_days=365"),
+    "stock_faulty": ("GET", "/stock?status=faulty"),
+    "stock_assigned_to": ("GET", "/stock?user_id={assignee_id}"),
+    "warnings": ("GET", "/stock/warnings"),
+    "search": ("GET", "/stock/search?q=laptop"),
+    "my_equipment": ("GET", "/my-equipment"),
+    "item_history": ("GET", "/stock/history/{hot_item_id}"),
+    "audit_logs": ("GET", "/audit/logs?limit=100"),
+    "audit_item": ("GET", "/audit/logs?item_id={hot_item_id}&limit=100"),
+    "audit_user": ("GET", "/audit/logs?user_id={warehouse_id}&limit=100"),
+    "write_mix": ("POST", None),
+}
+WRITE_MIX = {"assign": 40, "return": 40, "transfer": 20}
+ANCHOR = date(2025, 1, 1)  # fixed, so every run sees the same dataset
+SETTINGS_ENV = (
+    "DATABASE_URL", "DB_PROFILE", "USE_ASYNC_DB", "HASH_WORKERS", "TOKEN_CACHE_SIZE", "METRICS_ENABLED",
+)
+
+
+class _Targets:
+    """Ids the scenarios use, looked up in the seeded database."""
+
+    def __init__(self):
+        from sqlalchemy import func, select
+
+        from app.database import SessionLocal
+        from app.models import Assignment, Role, StockHistory, StockItem, User
+
+        with SessionLocal() as db:
+            self.company_id = db.scalar(
+                select(StockItem.company_id).group_by(StockItem.company_id)
+                .order_by(func.count().desc()).limit(1)
+            )
+            users = dict(db.execute(
+                select(Role.name, func.min(User.username))
+                .join(User, User.role_id == Role.id)
+                .where(User.company_id == self.company_id)
+                .group_by(Role.name)
+            ).all())
+            self.warehouse, self.admin = users["warehouse"], users["admin"]
+            self.warehouse_id = db.scalar(select(User.id).where(User.username == self.warehouse))
+            self.user_ids = db.scalars(
+                select(User.id).where(User.company_id == self.company_id)
+            ).all()
+            self.assignee_id, self.department_id = db.execute(
+                select(Assignment.assignee_user_id, StockItem.department_id)
+                .join(StockItem, StockItem.id == Assignment.stock_item_id)
+                .where(Assignment.company_id == self.company_id, Assignment.returned_at.is_(None))
+                .group_by(Assignment.assignee_user_id, StockItem.department_id)
+                .order_by(func.count().desc()).limit(1)
+            ).one()
+            self.hot_item_id = db.scalar(
+                select(StockHistory.stock_item_id)
+                .where(StockHistory.company_id == self.company_id)
+                .group_by(StockHistory.stock_item_id)
+                .order_by(func.count().desc()).limit(1)
+            )
+            self.department_ids = db.scalars(
+                select(StockItem.department_id).where(StockItem.company_id == self.company_id).distinct()
+            ).all()
+            self.stocked = db.scalars(
+                select(StockItem.id).where(
+                    StockItem.company_id == self.company_id,
+                    StockItem.is_deleted == False,
+                    StockItem.is_faulty == False,
+                    StockItem.quantity >= 5,
+                )
+            ).all()
+            self.open_assignments = db.scalars(
+                select(Assignment.id).where(
+                    Assignment.company_id == self.company_id, Assignment.returned_at.is_(None)
+                ).order_by(Assignment.id)
+            ).all()
+
+
+def _write_request(targets: _Targets, rng: random.Random) -> tuple[str, str, dict]:
+    kinds, weights = zip(*WRITE_MIX.items())
+    kind = rng.choices(kinds, weights)[0]
+    if kind == "return" and targets.open_assignments:
+        return kind, "/stock/return", {"assignment_id": targets.open_assignments.pop()}
+    if kind == "transfer":
+        return kind, "/stock/transfer", {
+            "stock_item_id": rng.choice(targets.stocked),
+            "to_department_id": rng.choice(targets.department_ids),
+            "quantity": 1,
+        }
+    return "assign", "/stock/assign", {
+        "stock_item_id": rng.choice(targets.stocked),
+        "assignee_user_id": rng.choice(targets.user_ids),
+    }
+
+
+async def _drive(scenarios: list[str], requests: int, concurrency: int) -> dict:
+    import httpx
+
+    from app import hashing
+    from app.auth import create_access_token
+    from app.main import app
+
+    targets = _Targets()
+    rng = random.Random(20)
+    warehouse = {"Authorization": f"Bearer {create_access_token({'sub': targets.warehouse})}"}
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': targets.admin})}"}
+    hashing.verifier.start()
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in scenarios:
+            method, template = SCENARIOS[scenario]
+            headers = admin if scenario.startswith("audit") else warehouse
+            count = max(20, requests // 10) if scenario == "login" else requests
+
+            def request():
+                if scenario == "login":
+                    return client.post(
+                        "/token", data={"username": targets.warehouse, "password": PASSWORD}
+                    )
+                if scenario == "write_mix":
+                    _, path, body = _write_request(targets, rng)
+                    return client.post(path, json=body, headers=headers)
+                return client.request(method, template.format(**vars(targets)), headers=headers)
+
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies, statuses = [], {}
+
+            async def one():
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        status = (await request()).status_code
+                    except Exception:  # noqa: BLE001 - counted as an error
+                        status = "exception"
+                    latencies.append(time.perf_counter() - start)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            await request()  # warm up caches and pools
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(count)))
+            elapsed = time.perf_counter() - started
+            errors = sum(n for s, n in statuses.items() if s == "exception" or s >= 500)
+            results[scenario] = {
+                **summarize(latencies, elapsed),
+                "errors": errors,
+                "statuses": {str(s): n for s, n in sorted(statuses.items(), key=str)},
+            }
+    hashing.verifier.shutdown()
+    return results
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _dataset(size: str, seed: int, reuse: bool) -> str:
+    """Path of a pristine SQLite file seeded at ``size``."""
+    path = os.path.join(tempfile.gettempdir(), f"stock-bench-{size}-{seed}.db")
+    if not (reuse and os.path.exists(path)):
+        started = time.perf_counter()
+        seed_synthetic(f"sqlite:///{path}", size, seed, ANCHOR)
+        print(f"seeded {size} in {time.perf_counter() - started:.0f}s: {path}", file=sys.stderr)
+    return path
+
+
+def _working_copy(pristine: str) -> str:
+    # Each run gets its own copy, so the write mix of one concurrency level
+    # doesn't change the data the next one reads.
+    path = pristine.replace(".db", "-run.db")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(pristine, path)
+    return f"sqlite:///{path}"
+
+
+def run(args) -> None:
+    report = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "settings": {k: os.environ[k] for k in SETTINGS_ENV if k in os.environ},
+        "requests": args.requests,
+        "seed": args.seed,
+        "sizes": {size: asdict(sample_data.SCALES[size]) for size in args.sizes},
+        "results": [],
+    }
+    print(f"{'size':<8}{'conc':>5}  {'scenario':<20}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'err':>6}")
+    for size in args.sizes:
+        if os.getenv("DATABASE_URL"):
+            url = os.environ["DATABASE_URL"]
+            seed_synthetic(url, size, args.seed, ANCHOR)
+        else:
+            pristine = _dataset(size, args.seed, args.reuse)
+        for concurrency in args.concurrency:
+            if not os.getenv("DATABASE_URL"):
+                url = _working_copy(pristine)
+            out = run_child(
+                "benchmarks.suite", {"DATABASE_URL": url}, "child",
+                "--requests", str(args.requests), "--concurrency", str(concurrency),
+                "--scenarios", *args.scenarios,
+            )
+            for scenario, stats in json.loads(out.strip().splitlines()[-1]).items():
+                report["results"].append(
+                    {"size": size, "concurrency": concurrency, "scenario": scenario, **stats}
+                )
+                print(
+                    f"{size:<8}{concurrency:>5}  {scenario:<20}{stats['throughput_rps']:>9}"
+                    f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['errors']:>6}"
+                )
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"results: {args.output}")
+
+
+def compare(args) -> None:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    def key(r):
+        return r["size"], r["concurrency"], r["scenario"]
+
+    before = {key(r): r for r in baseline["results"]}
+    regressions = 0
+    print(f"baseline {baseline.get('revision')} -> candidate {candidate.get('revision')}")
+    print(f"{'size':<8}{'conc':>5}  {'scenario':<20}{'rps':>9}{'Δrps':>9}{'p95':>9}{'Δp95':>9}")
+    for result in candidate["results"]:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        rps_change = result["throughput_rps"] / old["throughput_rps"] - 1
+        p95_change = result["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        slower = rps_change < -args.threshold or (
+            p95_change > args.threshold and result["p95_ms"] - old["p95_ms"] > args.min_ms
+        )
+        failing = result["errors"] > old["errors"]
+        regressions += slower or failing
+        flag = "REGRESSION" if slower else "MORE ERRORS" if failing else ""
+        print(
+            f"{result['size']:<8}{result['concurrency']:>5}  {result['scenario']:<20}"
+            f"{result['throughput_rps']:>9}{rps_change:>+9.1%}{result['p95_ms']:>9}"
+            f"{p95_change:>+9.1%}  {flag}"
+        )
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("run", help="run the suite and write a results file")
+    cmd.add_argument("--sizes", nargs="+", choices=sample_data.SCALES, default=["small", "medium"])
+    cmd.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    cmd.add_argument("--requests", type=int, default=500, help="per scenario (logins: a tenth)")
+    cmd.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    cmd.add_argument("--seed", type=int, default=0)
+    cmd.add_argument("--reuse", action="store_true", help="reuse a previously seeded SQLite file")
+    cmd.add_argument("--output", default=f"bench-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    cmd.set_defaults(func=run)
+
+    cmd = commands.add_parser("compare", help="flag regressions between two results files")
+    cmd.add_argument("baseline")
+    cmd.add_argument("candidate")
+    cmd.add_argument("--threshold", type=float, default=0.10, help="relative change (default 0.10)")
+    cmd.add_argument("--min-ms", type=float, default=1.0, help="ignore p95 increases smaller than this")
+    cmd.set_defaults(func=compare)
+
+    cmd = commands.add_parser("child")
+    cmd.add_argument("--requests", type=int)
+    cmd.add_argument("--concurrency", type=int)
+    cmd.add_argument("--scenarios", nargs="+")
+    cmd.set_defaults(func=lambda a: print(json.dumps(asyncio.run(_drive(a.scenarios, a.requests, a.concurrency)))))
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
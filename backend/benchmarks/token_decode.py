@@ -0,0 +1,44 @@
+"""Cost of resolving a bearer token with and without the verified-token cache.
+
+    python -m benchmarks.token_decode [--tokens 100] [--calls 200000]
+
+Each call resolves one of ``--tokens`` live tokens round-robin, the way a
+handful of active users reuse theirs across many requests.
+"""
+import argparse
+import itertools
+import time
+
+from app import auth
+from app.cache import TTLCache
+
+
+def _per_call_us(tokens: list[str], calls: int) -> float:
+    cycle = itertools.cycle(tokens)
+    start = time.perf_counter()
+    for _ in range(calls):
+        auth.token_subject(next(cycle))
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    tokens = [auth.create_access_token({"sub": f"user{i}"}) for i in range(args.tokens)]
+
+    auth.token_cache = None
+    uncached = _per_call_us(tokens, args.calls)
+    auth.token_cache = TTLCache(maxsize=max(args.tokens, 1), ttl=60)
+    cached = _per_call_us(tokens, args.calls)
+    stats = auth.token_cache.stats()
+
+    print(f"{args.calls} calls over {args.tokens} tokens")
+    print(f"jwt.decode every call: {uncached:8.2f} us/call")
+    print(f"verified-token cache:  {cached:8.2f} us/call ({uncached / cached:.1f}x, {stats})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Fan-out latency and per-connection overhead of the realtime EventHub.
+
+    python -m benchmarks.ws_fanout [--subscribers 5000] [--burst 200] [--rounds 20]
+
+Subscribers are registered on the hub directly (no sockets), so this
+measures the hub's own cost: memory per idle subscriber and the time from
+the last publish of a burst until every subscriber's queue holds the
+coalesced message, net of the debounce window.
+"""
+import argparse
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from app.auth import Principal
+from app.realtime import EventHub
+
+from .common import summarize
+
+
+async def run(subscribers: int, burst: int, rounds: int, debounce: float) -> None:
+    hub = EventHub(debounce=debounce)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    subs = [
+        hub.subscribe(Principal(
+            id=i, username=f"u{i}", company_id=1, department_id=i % 10,
+            role_id=None, role_name="warehouse" if i % 20 == 0 else "technical_support",
+        ))
+        for i in range(subscribers)
+    ]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print(f"idle subscribers: {subscribers}, ~{grown / subscribers:.0f} bytes each")
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        # Publish from a worker thread, as the sync request handlers do.
+        def burst_publish():
+            for n in range(burst):
+                hub.publish(1, "add", department_ids=[n % 10], item_ids=[n])
+        thread = threading.Thread(target=burst_publish)
+        thread.start()
+        thread.join()
+        published_at = time.perf_counter()
+        for sub in subs:
+            await sub.queue.get()
+            latencies.append(time.perf_counter() - published_at - debounce)
+    elapsed = time.perf_counter() - started
+
+    stats = summarize([max(0.0, lat) for lat in latencies], elapsed)
+    print(
+        f"{rounds} bursts of {burst} events -> {rounds} messages per subscriber "
+        f"(dropped {hub.dropped})"
+    )
+    print(
+        f"fan-out latency beyond debounce: p50 {stats['p50_ms']} ms, "
+        f"p95 {stats['p95_ms']} ms, p99 {stats['p99_ms']} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--burst", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--debounce-ms", type=float, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.burst, args.rounds, args.debounce_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Print the database's query plan for each hot endpoint query.
+
+Run from the backend directory against a populated database:
+
+    DATABASE_URL=sqlite:///./local.db python explain_queries.py
+
+Statements come from the same builders the endpoints use (``app.queries``
+and ``app.upserts``), so the plans are the ones the app actually runs.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+from app import history_archive, queries, upserts
+from app.database import engine, SessionLocal
+from app.models import StockItem, User
+
+
+def endpoint_queries(db, user: User, item: StockItem):
+    company_id = user.company_id
+    archived_before = history_archive.load_manifest(company_id).archived_before
+    yield "/stock", queries.stock_item_rows(queries.stock_items(company_id))
+    yield "/stock?department_id=&below_par=true", queries.stock_item_rows(
+        queries.stock_items(company_id, item.department_id, below_par=True)
+    )
+    yield "/stock?user_id=, /my-equipment", queries.stock_item_rows(
+        queries.assigned_items(company_id, user.id)
+    )
+    yield "/stock/warnings", queries.stock_item_rows(queries.stock_warnings(company_id))
+    yield "/stock/history/{item_id}", queries.history_rows(
+        queries.item_history(company_id, item.id, archived_before)
+    )
+    yield "/audit/logs", queries.history_rows(
+        queries.audit_history(
+            company_id, after=(datetime.utcnow(), 0), since=archived_before
+        ).limit(101)
+    )
+    yield "/stock/add, /stock/transfer (restock upsert)", upserts.restock_many(
+        db, StockItem.id, StockItem.quantity
+    ).values(
+        company_id=company_id,
+        department_id=item.department_id,
+        name=item.name,
+        quantity=1,
+    )
+
+
+def explain(db, stmt) -> list[str]:
+    compiled = stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    rows = db.execute(text(f"{prefix} {compiled}")).all()
+    return [str(row[-1]) for row in rows]
+
+
+def main():
+    db = SessionLocal()
+    try:
+        user = db.scalars(select(User).limit(1)).first()
+        item = user and db.scalars(
+            select(StockItem).where(StockItem.company_id == user.company_id).limit(1)
+        ).first()
+        if user is None or item is None:
+            raise SystemExit("Database needs at least one user and stock item")
+        for endpoint, stmt in endpoint_queries(db, user, item):
+            print(f"== {endpoint}")
+            for line in explain(db, stmt):
+                print(f"   {line}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
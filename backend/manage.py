@@ -0,0 +1,141 @@
+"""Maintenance commands for the stock management backend.
+
+Run from the backend directory, e.g. ``python manage.py rebuild-warnings``.
+"""
+import argparse
+import sys
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import User
+from app import history_archive, importer, rollups, snapshots, warnings_store
+
+
+def rebuild_warnings(args):
+    db = SessionLocal()
+    try:
+        count = warnings_store.rebuild(db, args.company_id)
+        db.commit()
+    finally:
+        db.close()
+    print(f"stock_warnings rebuilt: {count} rows")
+
+
+def reconcile_rollups(args):
+    db = SessionLocal()
+    try:
+        mismatches = rollups.reconcile(db, args.company_id)
+        for m in mismatches:
+            print(
+                f"department {m['department_id']} (company {m['company_id']}): "
+                f"{m['counter']} is {m['stored']}, expected {m['expected']}"
+            )
+        if mismatches and args.fix:
+            count = rollups.rebuild(db, args.company_id)
+            db.commit()
+            print(f"department_rollups rebuilt: {count} rows")
+    finally:
+        db.close()
+    if not mismatches:
+        print("department_rollups match the base tables")
+    elif not args.fix:
+        sys.exit(1)
+
+
+def archive_history(args):
+    db = SessionLocal()
+    try:
+        moved = history_archive.archive(db, args.older_than_days, args.company_id)
+    finally:
+        db.close()
+    for company_id, count in sorted(moved.items()):
+        print(f"company {company_id}: archived {count} stock_history rows")
+    print(f"archive: {history_archive.HISTORY_ARCHIVE_DIR}")
+
+
+def snapshot_stock(args):
+    db = SessionLocal()
+    try:
+        taken = snapshots.take_due(db, args.company_id, args.interval_days)
+        for snapshot in taken:
+            print(f"company {snapshot.company_id}: snapshot at {snapshot.taken_at:%Y-%m-%d %H:%M:%S}")
+    finally:
+        db.close()
+    if not taken:
+        print("no snapshots due")
+
+
+def import_stock(args):
+    db = SessionLocal()
+    try:
+        user = db.scalar(select(User).where(User.username == args.username))
+        if user is None:
+            sys.exit(f"unknown user {args.username!r}")
+
+        def progress(report):
+            print(
+                f"{report.rows} rows: {report.created} created, "
+                f"{report.restocked} restocked, {report.failed} failed",
+                file=sys.stderr,
+            )
+
+        with open(args.file, encoding="utf-8-sig", newline="") as f:
+            try:
+                report = importer.import_csv(db, f, user.company_id, user.id, progress)
+            except ValueError as exc:
+                sys.exit(str(exc))
+    finally:
+        db.close()
+    for error in report.errors:
+        print(f"line {error['line']}: {error['error']}")
+    if report.failed > len(report.errors):
+        print(f"... and {report.failed - len(report.errors)} more errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("rebuild-warnings", help="recompute the below-par warnings table")
+    cmd.add_argument("--company-id", type=int, help="only rebuild this company")
+    cmd.set_defaults(func=rebuild_warnings)
+
+    cmd = commands.add_parser(
+        "reconcile-rollups", help="check the department summary rollups against the base tables"
+    )
+    cmd.add_argument("--company-id", type=int, help="only check this company")
+    cmd.add_argument("--fix", action="store_true", help="rebuild the rollups if they differ")
+    cmd.set_defaults(func=reconcile_rollups)
+
+    cmd = commands.add_parser(
+        "archive-history", help="move old stock_history rows to compressed archive files"
+    )
+    cmd.add_argument(
+        "--older-than-days", type=int, default=history_archive.HISTORY_ARCHIVE_DAYS,
+        help="archive rows older than this (default: HISTORY_ARCHIVE_DAYS)",
+    )
+    cmd.add_argument("--company-id", type=int, help="only archive this company")
+    cmd.set_defaults(func=archive_history)
+
+    cmd = commands.add_parser(
+        "snapshot-stock", help="snapshot item quantities for the /stock/as-of endpoint"
+    )
+    cmd.add_argument(
+        "--interval-days", type=int, default=snapshots.SNAPSHOT_INTERVAL_DAYS,
+        help="snapshot companies whose newest snapshot is older than this (default: SNAPSHOT_INTERVAL_DAYS)",
+    )
+    cmd.add_argument("--company-id", type=int, help="only snapshot this company")
+    cmd.set_defaults(func=snapshot_stock)
+
+    cmd = commands.add_parser("import-stock", help="bulk import stock items from a CSV file")
+    cmd.add_argument("file", help="CSV with name, quantity, department and optional columns")
+    cmd.add_argument("--username", required=True, help="user recorded in the history rows")
+    cmd.set_defaults(func=import_stock)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,49 @@
+"""Sample and synthetic data.
+
+``python sample_data.py`` creates the small demo company used in the README.
+``python sample_data.py --scale large`` (or explicit ``--companies``,
+``--items``, ``--history`` ... counts) instead generates a synthetic
+dataset with production-like skew: a few large departments and companies,
+a long tail of small ones, and history concentrated on a small set of hot
+items, heavier on weekdays and growing over time. Item quantities are
+the result of their history, and every ``Scale.snapshot_days`` a stock
+snapshot (see ``app.snapshots``) records them.
+
+The generated data depends only on the counts, ``--seed`` and ``--anchor``
+(the date the history runs up to), so two runs with the same arguments
+produce the same rows. Rows are written with multi-row inserts, or
+``COPY`` on Postgres, in batches of ``BATCH_SIZE``.
+"""
+import argparse
+import bisect
+import csv
+import io
+import random
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate, islice
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app import rollups, snapshots, warnings_store
 from app.database import Base, engine, SessionLocal
-from app.models import Company, Department, Role, User, StockItem
+from app.models import Company, Department, Role, User, StockItem, StockSnapshot
 from app.auth import get_password_hash
-from datetime import datetime
+
+BATCH_SIZE = 20000
+ROLES = ("admin", "warehouse", "technical_support", "sales")
+DEPARTMENT_NAMES = (
+    "Warehouse", "IT", "Sales", "Support", "Finance", "Operations", "Marketing", "Facilities",
+)
+ITEM_KINDS = (
+    "Laptop", "Phone", "Monitor", "Keyboard", "Mouse", "Headset", "Dock", "Tablet",
+    "Printer", "Router", "Cable", "Charger", "Webcam", "Desk", "Chair", "Badge",
+)
+# Relative frequency of history actions other than an item's "create".
+ACTIONS = {"add": 40, "assign": 25, "return": 20, "transfer": 6, "set_par_level": 6, "faulty": 3}
 
 
 def init_db():
@@ -16,6 +58,7 @@ def init_db():
     warehouse = Department(name="Warehouse", company_id=company.id)
     it = Department(name="IT", company_id=company.id)
     db.add_all([warehouse, it])
+    db.flush()
 
     # Create sample roles
     admin_role = Role(name="admin", company_id=company.id)
@@ -65,10 +108,450 @@ def init_db():
         par_level=2,
     )
     db.add_all([laptop, phone])
+    db.flush()
+    warnings_store.rebuild(db, company.id)
+    rollups.rebuild(db, company.id)
+    snapshots.take(db, company.id)
 
     db.commit()
     db.close()
 
 
+@dataclass(frozen=True)
+class Scale:
+    companies: int
+    departments: int  # per company, on average
+    users: int
+    items: int
+    assignments: int
+    history: int
+    years: float = 2.0
+    snapshot_days: int = 7
+
+
+SCALES = {
+    "small": Scale(companies=1, departments=5, users=50, items=2_000, assignments=500, history=20_000),
+    "medium": Scale(companies=5, departments=8, users=2_000, items=100_000, assignments=50_000, history=2_000_000, snapshot_days=30),
+    "large": Scale(companies=20, departments=12, users=20_000, items=1_000_000, assignments=500_000, history=20_000_000, years=3.0, snapshot_days=90),
+}
+
+
+@dataclass(frozen=True)
+class Generated:
+    companies: list[int]
+    usernames: dict[int, dict[str, str]]  # company id -> role -> a username with it
+    rows: dict[str, int]
+
+
+def _zipf_weights(n: int, s: float, rng: random.Random) -> list[float]:
+    """Weights ``1 / rank**s`` for ``n`` entries, ranks shuffled so the heavy ones are spread out."""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return [1 / r ** s for r in ranks]
+
+
+def _split(total: int, weights: list[float], minimum: int = 0) -> list[int]:
+    """Split ``total`` into integer parts proportional to ``weights``."""
+    total_weight = sum(weights)
+    parts, carry = [], 0.0
+    for w in weights:
+        exact = total * w / total_weight + carry
+        part = int(exact)
+        carry = exact - part
+        parts.append(part)
+    parts[-1] += total - sum(parts)
+    return [max(p, minimum) for p in parts]
+
+
+def _batches(rows: Iterable[tuple], size: int = BATCH_SIZE) -> Iterator[list[tuple]]:
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _stamp(value: datetime) -> str:
+    # Readable by Postgres, and the format SQLAlchemy itself stores on SQLite,
+    # so string comparisons there line up with rows written by the app.
+    return value.isoformat(" ", "microseconds")
+
+
+class _Writer:
+    """Bulk-insert tuples into a table: ``COPY`` on Postgres, executemany elsewhere.
+
+    Values must already be plain: timestamps go through :func:`_stamp`.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.postgres = engine.dialect.name == "postgresql"
+
+    def _copy(self, conn: Connection, table: str, columns: tuple, batch: list[tuple]) -> None:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow(row)
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+    def insert(self, table: str, columns: tuple, rows: Iterable[tuple]) -> int:
+        count = 0
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for batch in _batches(rows):
+            with self.engine.begin() as conn:
+                if self.postgres:
+                    self._copy(conn, table, columns, batch)
+                else:
+                    conn.exec_driver_sql(sql, batch)
+            count += len(batch)
+        return count
+
+    def update(self, table: str, columns: tuple, rows: Iterable[tuple]) -> int:
+        """Set ``columns`` of existing rows from ``(id, *values)`` tuples."""
+        count = 0
+        assignments = ", ".join(f"{c} = ?" for c in columns)
+        sql = f"UPDATE {table} SET {assignments} WHERE id = ?"
+        for batch in _batches(rows):
+            with self.engine.begin() as conn:
+                if self.postgres:
+                    conn.exec_driver_sql(
+                        f"CREATE TEMP TABLE _updates ON COMMIT DROP AS"
+                        f" SELECT id, {', '.join(columns)} FROM {table} WITH NO DATA"
+                    )
+                    self._copy(conn, "_updates", ("id", *columns), batch)
+                    conn.exec_driver_sql(
+                        f"UPDATE {table} SET {', '.join(f'{c} = _updates.{c}' for c in columns)}"
+                        f" FROM _updates WHERE {table}.id = _updates.id"
+                    )
+                else:
+                    conn.exec_driver_sql(sql, [(*values, id_) for id_, *values in batch])
+            count += len(batch)
+        return count
+
+    def fix_sequences(self, tables: Iterable[str]) -> None:
+        # Explicit ids leave Postgres sequences behind; move them past the new rows.
+        if not self.postgres:
+            return
+        with self.engine.begin() as conn:
+            for table in tables:
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'),"
+                    f" coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"
+                )
+
+
+def _next_ids(engine: Engine) -> dict[str, int]:
+    with engine.connect() as conn:
+        return {
+            model.__tablename__: (conn.scalar(select(func.max(model.id))) or 0) + 1
+            for model in (Company, Department, Role, User, StockItem, StockSnapshot)
+        }
+
+
+def generate(
+    scale: Scale,
+    seed: int = 0,
+    anchor: Optional[date] = None,
+    password: str = "password",
+    target: Engine = engine,
+) -> Generated:
+    """Add a synthetic dataset of ``scale`` to ``target``'s database.
+
+    History covers ``scale.years`` up to ``anchor`` (default: today). Each
+    company gets users named ``c<n>-admin``, ``c<n>-warehouse`` and
+    ``c<n>-user<k>``, all with ``password``. Ids continue after any
+    existing rows.
+    """
+    Base.metadata.create_all(bind=target)
+    rng = random.Random(seed)
+    anchor = anchor or date.today()
+    end = datetime.combine(anchor, time())
+    days = max(1, round(scale.years * 365))
+    start = end - timedelta(days=days)
+    writer = _Writer(target)
+    ids = _next_ids(target)
+    hashed_password = get_password_hash(password)  # one hash: it's the slow part
+    rows = dict.fromkeys(
+        (
+            "companies", "departments", "roles", "users", "stock_items", "assignments",
+            "stock_history", "stock_snapshots", "stock_snapshot_items",
+        ),
+        0,
+    )
+
+    # A few big companies and a long tail of small ones.
+    company_weights = _zipf_weights(scale.companies, 1.0, rng)
+    company_ids = list(range(ids["companies"], ids["companies"] + scale.companies))
+    rows["companies"] = writer.insert(
+        "companies", ("id", "name"),
+        ((cid, f"Synthetic {cid}") for cid in company_ids),
+    )
+    usernames = {}
+    shares = {
+        "departments": _split(scale.departments * scale.companies, company_weights, 1),
+        "users": _split(scale.users, company_weights, len(ROLES)),
+        "items": _split(scale.items, company_weights, 1),
+        "assignments": _split(scale.assignments, company_weights),
+        "history": _split(scale.history, company_weights),
+    }
+    for n, company_id in enumerate(company_ids):
+        department_count = shares["departments"][n]
+        department_ids = list(range(ids["departments"], ids["departments"] + department_count))
+        ids["departments"] += department_count
+        rows["departments"] += writer.insert(
+            "departments", ("id", "name", "company_id"),
+            (
+                (
+                    did,
+                    DEPARTMENT_NAMES[i] if i < len(DEPARTMENT_NAMES) else f"Department {i + 1}",
+                    company_id,
+                )
+                for i, did in enumerate(department_ids)
+            ),
+        )
+        role_ids = {name: ids["roles"] + i for i, name in enumerate(ROLES)}
+        ids["roles"] += len(ROLES)
+        rows["roles"] += writer.insert(
+            "roles", ("id", "name", "company_id"),
+            ((rid, name, company_id) for name, rid in role_ids.items()),
+        )
+
+        # Departments: a couple of large ones, many small.
+        department_weights = _zipf_weights(department_count, 1.2, rng)
+        department_cum = list(accumulate(department_weights))
+
+        def pick_department():
+            return department_ids[
+                bisect.bisect(department_cum, rng.random() * department_cum[-1])
+            ]
+
+        user_count = shares["users"][n]
+        user_ids = list(range(ids["users"], ids["users"] + user_count))
+        ids["users"] += user_count
+        prefix = f"c{company_id}"
+        users = []
+        for k, uid in enumerate(user_ids):
+            if k < len(ROLES):
+                role, username = ROLES[k], f"{prefix}-{ROLES[k]}"
+            else:
+                role = rng.choices(ROLES, weights=(2, 20, 30, 48))[0]
+                username = f"{prefix}-user{k}"
+            users.append((uid, username, hashed_password, role_ids[role], pick_department(), company_id))
+        usernames[company_id] = {role: f"{prefix}-{role}" for role in ROLES}
+        rows["users"] += writer.insert(
+            "users",
+            ("id", "username", "hashed_password", "role_id", "department_id", "company_id"),
+            users,
+        )
+
+        # Items, in acquisition order: a fifth is the initial inventory, the
+        # rest arrive over the period. Quantities are mostly small.
+        item_count = shares["items"][n]
+        first_item = ids["stock_items"]
+        ids["stock_items"] += item_count
+        offsets = sorted(
+            0.0 if rng.random() < 0.2 else rng.random() * days * 86400 for _ in range(item_count)
+        )
+        acquired = [start + timedelta(seconds=o) for o in offsets]
+        acquired_stamps = [_stamp(a) for a in acquired]
+        item_departments = [pick_department() for _ in range(item_count)]
+        # Quantities on arrival; the history below moves them on from there.
+        initial = [min(int(rng.lognormvariate(1.5, 1.0)), 500) for _ in range(item_count)]
+        deleted = [rng.random() < 0.01 for _ in range(item_count)]
+
+        def items():
+            for i in range(item_count):
+                par_level = rng.choice((2, 5, 10, 20)) if rng.random() < 0.3 else None
+                yield (
+                    first_item + i,
+                    f"{ITEM_KINDS[i % len(ITEM_KINDS)]} {i + 1}",
+                    initial[i],
+                    item_departments[i],
+                    company_id,
+                    rng.random() < 0.02,
+                    par_level,
+                    acquired_stamps[i],
+                    acquired_stamps[i],
+                    deleted[i],
+                    1,
+                )
+
+        rows["stock_items"] += writer.insert(
+            "stock_items",
+            (
+                "id", "name", "quantity", "department_id", "company_id", "is_faulty",
+                "par_level", "acquired_at", "created_at", "is_deleted", "version",
+            ),
+            items(),
+        )
+
+        # Hot items and busy users: Zipf over both.
+        item_cum = list(accumulate(_zipf_weights(item_count, 1.1, rng)))
+        user_cum = list(accumulate(_zipf_weights(user_count, 0.8, rng)))
+
+        def pick_item(available: int) -> int:
+            # Only items acquired so far, i.e. a prefix of the acquisition order.
+            return bisect.bisect(item_cum, rng.random() * item_cum[available - 1], 0, available - 1)
+
+        def pick_user() -> int:
+            return user_ids[bisect.bisect(user_cum, rng.random() * user_cum[-1])]
+
+        def assignments():
+            for _ in range(shares["assignments"][n]):
+                i = pick_item(item_count)
+                assigned_at = acquired[i] + (end - acquired[i]) * rng.random()
+                returned_at = None
+                if rng.random() < 0.7:
+                    returned_at = assigned_at + (end - assigned_at) * rng.random()
+                yield (
+                    first_item + i, pick_user(), user_ids[1], _stamp(assigned_at),
+                    returned_at and _stamp(returned_at), company_id,
+                )
+
+        rows["assignments"] += writer.insert(
+            "assignments",
+            ("stock_item_id", "assignee_user_id", "assigned_by_id", "assigned_at", "returned_at", "company_id"),
+            assignments(),
+        )
+
+        # History day by day so ids follow time: every item's "create", plus
+        # the other actions spread over weekdays and growing towards the anchor,
+        # and a "delete" for the deleted items. Each row carries the quantity
+        # change; an "assign" with nothing in stock, or a "transfer" that can't
+        # move anything, becomes an "add".
+        day_weights = [
+            (0.5 + d / days) * (0.25 if (start + timedelta(days=d)).weekday() >= 5 else 1.0)
+            for d in range(days)
+        ]
+        per_day = _split(shares["history"][n], day_weights)
+        actions, action_weights = zip(*ACTIONS.items())
+        action_cum = list(accumulate(action_weights))
+
+        deletions: dict[int, list[tuple[datetime, int]]] = {}
+        for i in range(item_count):
+            if deleted[i]:
+                at = acquired[i] + (end - acquired[i]) * rng.random()
+                deletions.setdefault(min((at - start).days, days - 1), []).append((at, i))
+        quantity = list(initial)
+        live = [False] * item_count
+        snapshots: list[tuple[datetime, list[Optional[int]]]] = []
+
+        def history():
+            created = 0
+            for d in range(days):
+                day_end = start + timedelta(days=d + 1)
+                events = []
+                while created < item_count and acquired[created] < day_end:
+                    events.append((acquired[created], created, "create", None))
+                    created += 1
+                if created:
+                    for _ in range(per_day[d]):
+                        action = actions[bisect.bisect(action_cum, rng.random() * action_cum[-1])]
+                        at = day_end - timedelta(seconds=rng.random() * 86400)
+                        i = pick_item(created)
+                        j = pick_item(created) if action == "transfer" else None
+                        # Not before the items arrived.
+                        at = max(at, acquired[i], acquired[j] if j is not None else at)
+                        events.append((at, i, action, j))
+                events.extend((at, i, "delete", None) for at, i in deletions.get(d, ()))
+                events.sort(key=lambda e: e[0])
+                for at, i, action, j in events:
+                    if action == "create":
+                        live[i] = True
+                        yield (first_item + i, pick_user(), action, _stamp(at), company_id, quantity[i], quantity[i])
+                        continue
+                    if not live[i]:
+                        continue
+                    user_id, stamp = pick_user(), _stamp(at)
+                    if action == "transfer" and j != i and live[j] and quantity[i]:
+                        moved = min(quantity[i], rng.randint(1, 5))
+                        quantity[i] -= moved
+                        quantity[j] += moved
+                        yield (first_item + i, user_id, action, stamp, company_id, -moved, quantity[i])
+                        yield (first_item + j, user_id, action, stamp, company_id, moved, quantity[j])
+                        continue
+                    if action == "assign" and quantity[i]:
+                        delta = -1
+                    elif action == "return":
+                        delta = 1
+                    elif action in ("faulty", "set_par_level", "delete"):
+                        delta = 0
+                    else:
+                        action, delta = "add", rng.randint(1, 20)
+                    quantity[i] += delta
+                    if action == "delete":
+                        live[i] = False
+                    yield (first_item + i, user_id, action, stamp, company_id, delta, quantity[i])
+                if (d + 1) % scale.snapshot_days == 0 or d == days - 1:
+                    snapshots.append(
+                        (day_end, [q if alive else None for q, alive in zip(quantity, live)])
+                    )
+
+        rows["stock_history"] += writer.insert(
+            "stock_history",
+            (
+                "stock_item_id", "user_id", "action", "timestamp", "company_id",
+                "quantity_delta", "quantity_after",
+            ),
+            history(),
+        )
+        writer.update(
+            "stock_items", ("quantity",),
+            ((first_item + i, q) for i, q in enumerate(quantity) if q != initial[i]),
+        )
+
+        snapshot_ids = list(range(ids["stock_snapshots"], ids["stock_snapshots"] + len(snapshots)))
+        ids["stock_snapshots"] += len(snapshots)
+        rows["stock_snapshots"] += writer.insert(
+            "stock_snapshots", ("id", "company_id", "taken_at"),
+            ((sid, company_id, _stamp(taken_at)) for sid, (taken_at, _) in zip(snapshot_ids, snapshots)),
+        )
+        rows["stock_snapshot_items"] += writer.insert(
+            "stock_snapshot_items", ("snapshot_id", "stock_item_id", "quantity"),
+            (
+                (sid, first_item + i, q)
+                for sid, (_, state) in zip(snapshot_ids, snapshots)
+                for i, q in enumerate(state)
+                if q is not None
+            ),
+        )
+
+    writer.fix_sequences(("companies", "departments", "roles", "users", "stock_items", "stock_snapshots"))
+    with Session(bind=target) as db:
+        for company_id in company_ids:
+            warnings_store.rebuild(db, company_id)
+            rollups.rebuild(db, company_id)
+        db.commit()
+    return Generated(company_ids, usernames, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, help="preset sizes; the flags below override them")
+    for field in ("companies", "departments", "users", "items", "assignments", "history", "snapshot_days"):
+        parser.add_argument(f"--{field}", type=int)
+    parser.add_argument("--years", type=float)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--anchor", type=date.fromisoformat, help="last day of history (default: today)")
+    parser.add_argument("--password", default="password")
+    args = parser.parse_args()
+
+    overrides = {
+        k: v for k, v in vars(args).items()
+        if k in Scale.__dataclass_fields__ and v is not None
+    }
+    if args.scale is None and not overrides:
+        init_db()
+        return
+    scale = replace(SCALES[args.scale or "small"], **overrides)
+    result = generate(scale, args.seed, args.anchor, args.password)
+    for table, count in result.rows.items():
+        print(f"{table}: {count} rows")
+    first = result.companies[0]
+    print(f"log in as {result.usernames[first]['admin']} / {args.password}")
+
+
 if __name__ == "__main__":
-    init_db()
+    main()
@@ -0,0 +1,82 @@
+"""Statement counts for the assigned-items endpoints.
+
+``/my-equipment`` and ``/stock?user_id=`` load a user's items with one
+query however many assignments are open. These tests fail if a change
+brings back a per-item lookup.
+"""
+import os
+
+import pytest
+from sqlalchemy import delete, event, insert, select
+
+from benchmarks.common import PASSWORD, USERNAME, seed
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    # The app reads DATABASE_URL at import time, so point it at a fresh
+    # file before the first import; seed() drops whatever is there.
+    url = f"sqlite:///{tmp_path_factory.mktemp('db') / 'query_counts.db'}"
+    os.environ["DATABASE_URL"] = url
+    seed(url, items=30, assignments=0, history=0)
+
+    from fastapi.testclient import TestClient
+
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.models import User
+
+    with SessionLocal() as db:
+        user = db.scalars(select(User).where(User.username == USERNAME)).one()
+    client = TestClient(app)
+    token = client.post(
+        "/token", data={"username": USERNAME, "password": PASSWORD}
+    ).json()["access_token"]
+    return client, engine, {"Authorization": f"Bearer {token}"}, user
+
+
+def _open_assignments(user, count: int) -> None:
+    from app.database import SessionLocal
+    from app.models import Assignment, StockItem
+
+    with SessionLocal() as db:
+        db.execute(delete(Assignment))
+        item_ids = db.scalars(select(StockItem.id).order_by(StockItem.id).limit(count)).all()
+        db.execute(insert(Assignment), [
+            {
+                "stock_item_id": item_id,
+                "assignee_user_id": user.id,
+                "assigned_by_id": user.id,
+                "company_id": user.company_id,
+            }
+            for item_id in item_ids
+        ])
+        db.commit()
+
+
+def _statements(api, path: str) -> tuple[int, int]:
+    client, engine, headers, _ = api
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client.get(path, headers=headers).raise_for_status()  # warm up caches
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        response = client.get(path, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    response.raise_for_status()
+    return len(statements), len(response.json())
+
+
+@pytest.mark.parametrize("path", ["/my-equipment", "/stock?user_id={user_id}"])
+def test_assigned_items_statement_count_is_constant(api, path):
+    path = path.format(user_id=api[3].id)
+    counts = {}
+    for open_count in (1, 20):
+        _open_assignments(api[3], open_count)
+        counts[open_count], items = _statements(api, path)
+        assert items == open_count
+    assert counts[1] == counts[20]